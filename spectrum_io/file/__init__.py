@@ -1,6 +1,6 @@
 """Initialize logger."""
 import logging
 
-from . import csv, hdf5
+from . import csv, hdf5, mgf
 
 logger = logging.getLogger(__name__)
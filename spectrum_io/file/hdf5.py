@@ -1,12 +1,25 @@
+import atexit
 import logging
+import os
+import queue
 import threading
+import zlib
+from concurrent.futures import Future
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import h5py
+import numpy as np
 import pandas as pd
 import scipy
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix
+
+from spectrum_io.raw.spectrum_batch import split_peaks
+
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
 
 logger = logging.getLogger(__name__)
 
@@ -15,52 +28,470 @@ INTENSITY_RAW_KEY = "raw_intensity"
 INTENSITY_PRED_KEY = "pred_intensity"
 MZ_RAW_KEY = "raw_mz"
 
+_SPECTRA_CHUNK_SIZE = 1 << 16
+_SPARSE_CHUNK_SIZE = 1 << 20
+_SLAB_CHUNK_BYTES = 1 << 20
+
+# PyTables is not thread-safe, so writes of dataframes from several HDF5Writer threads must not overlap
+_PYTABLES_LOCK = threading.Lock()
 
-def read_file(path: Union[str, Path], key: str) -> pd.DataFrame:
+
+def read_file(
+    path: Union[str, Path],
+    key: str,
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+    columns: Optional[Sequence[Union[str, int]]] = None,
+    where: Optional[Union[str, List[str]]] = None,
+) -> pd.DataFrame:
     """
     Read hdf5 file and return dataframe with contents.
 
-    With possibility to partial load for memory issues.
+    With possibility to partial load for memory issues: only the rows in the range [start, stop) and the given
+    columns are read. For sparse groups, the entries outside the range are never loaded if the group was written in
+    csr layout or sorted by row, which is the case for all groups written by ``write_dataset``, and are skipped
+    chunk by chunk otherwise. Pandas keys written in table format additionally support where predicates on their data
+    columns, see pandas.HDFStore.select.
+
     :param path: The path to the hdf5 file to read
     :param key: The key of the dataset/group of interest
+    :param start: Optional, the first row to read. Default: None, meaning the first row
+    :param stop: Optional, the row after the last row to read. Default: None, meaning after the last row
+    :param columns: Optional, the names of the columns to read. Columns of sparse groups without column names can be
+        selected by position. Default: None, meaning all columns
+    :param where: Optional, a where predicate for pandas keys in table format. Default: None
+    :raises ValueError: if a where predicate is given for a sparse group or a pandas key in fixed format
     :return: a pandas DataFrame with contents
     """
-    try:
-        if key.startswith("sparse"):
-            with h5py.File(path, "r") as f:
-                logger.info(f"Reading sparse matrix from hdf5 file. Available keys: {f.keys()}")
-                values = f[f"{key}/values"]
-                i = f[f"{key}/i"]
-                j = f[f"{key}/j"]
-                shape = f[f"{key}/shape"]
-                sparse_data = coo_matrix((values, (i, j)), shape)
-                df = pd.DataFrame.sparse.from_spmatrix(sparse_data)
-                if f"{key}/column_names" in f.keys():
-                    df.columns = f[f"{key}/column_names"].asstr()
-                if f"{key}/index" in f.keys():
-                    df.index = f[f"{key}/index"]
+    if key.startswith("sparse"):
+        if where is not None:
+            raise ValueError("where predicates are only supported for pandas keys in table format.")
+        with h5py.File(path, "r") as f:
+            logger.info(f"Reading sparse matrix from hdf5 file. Available keys: {f.keys()}")
+            return _read_sparse_rows(f[key], start, stop, columns)
+    with pd.HDFStore(path, "r") as store:
+        return _read_pandas_rows(store, key, start, stop, columns, where)
+
+
+def iter_file(
+    path: Union[str, Path],
+    key: str,
+    chunksize: int,
+    columns: Optional[Sequence[Union[str, int]]] = None,
+    where: Optional[Union[str, List[str]]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Read hdf5 file in chunks of rows, keeping only a single chunk in memory.
+
+    See ``read_file`` for the supported keys and arguments. The file is kept open until the iterator is
+    exhausted or closed.
+
+    :param path: The path to the hdf5 file to read
+    :param key: The key of the dataset/group of interest
+    :param chunksize: The maximum number of rows per chunk
+    :param columns: Optional, the names of the columns to read. Default: None, meaning all columns
+    :param where: Optional, a where predicate for pandas keys in table format. Default: None
+    :raises ValueError: if chunksize is not positive or a where predicate is given for unsupported keys
+    :yield: dataframes with up to chunksize rows each, in the order of the file
+    """
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be a positive integer. Got {chunksize}")
+    if key.startswith("sparse"):
+        if where is not None:
+            raise ValueError("where predicates are only supported for pandas keys in table format.")
+        with h5py.File(path, "r") as f:
+            group = f[key]
+            for chunk_start in range(0, int(group["shape"][0]), chunksize):
+                yield _read_sparse_rows(group, chunk_start, chunk_start + chunksize, columns)
+        return
+    with pd.HDFStore(path, "r") as store:
+        storer = store.get_storer(key)
+        if storer.is_table:
+            yield from store.select(
+                key, where=where, columns=None if columns is None else list(columns), chunksize=chunksize
+            )
+            return
+        for chunk_start in range(0, storer.shape[0], chunksize):
+            yield _read_pandas_rows(store, key, chunk_start, chunk_start + chunksize, columns, where)
+
+
+def read_sparse(
+    path: Union[str, Path], key: str, start: Optional[int] = None, stop: Optional[int] = None
+) -> Tuple[csr_matrix, Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Read a sparse group as scipy csr matrix, without the conversion to a sparse dataframe done by ``read_file``.
+
+    Groups in csr layout are read directly into the buffers of the matrix, keeping the stored dtypes, i.e. float32
+    values. Groups in coo layout are converted to csr after reading the coordinates of the selected rows.
+
+    :param path: The path to the hdf5 file to read
+    :param key: The key of the sparse group, e.g. 'sparse_<dataset_name>'
+    :param start: Optional, the first row to read. Default: None, meaning the first row
+    :param stop: Optional, the row after the last row to read. Default: None, meaning after the last row
+    :return: tuple of the selected rows as csr matrix, the column names and the index of the selected rows. Column
+        names and index are None if they were not stored.
+    """
+    with h5py.File(path, "r") as f:
+        group = f[key]
+        num_rows, num_columns = (int(n) for n in group["shape"][:])
+        start, stop, _ = slice(start, stop).indices(num_rows)
+        stop = max(start, stop)
+        shape = (stop - start, num_columns)
+        if group.attrs.get("layout") == "csr":
+            indptr = group["indptr"][start : stop + 1]
+            first, last = indptr[0], indptr[-1]
+            matrix = csr_matrix((group["data"][first:last], group["indices"][first:last], indptr - first), shape)
+        else:
+            i, j, values = _read_coordinates(group, start, stop)
+            matrix = coo_matrix((values, (i - start, j)), shape).tocsr()
+        column_names = group["column_names"].asstr()[:] if "column_names" in group else None
+        return matrix, column_names, _read_index(group, start, stop)
+
+
+def _read_pandas_rows(
+    store: pd.HDFStore,
+    key: str,
+    start: Optional[int],
+    stop: Optional[int],
+    columns: Optional[Sequence[Union[str, int]]],
+    where: Optional[Union[str, List[str]]],
+) -> pd.DataFrame:
+    """
+    Read a row range and a subset of columns of a pandas key.
+
+    :param store: the opened hdf5 store
+    :param key: the key of the dataframe
+    :param start: the first row to read
+    :param stop: the row after the last row to read
+    :param columns: the names of the columns to read
+    :param where: a where predicate, only supported for keys in table format
+    :raises ValueError: if a where predicate is given for a key in fixed format
+    :return: the selected part of the dataframe
+    """
+    if columns is not None:
+        columns = list(columns)  # pandas treats tuples as a single multi-level column
+    if store.get_storer(key).is_table:
+        return store.select(key, where=where, start=start, stop=stop, columns=columns)
+    if where is not None:
+        raise ValueError(f"{key} is stored in fixed format, write it in table format to use where predicates.")
+    # the fixed format can only slice rows, the columns are selected after reading them
+    df = store.select(key, start=start, stop=stop)
+    return df if columns is None else df[columns]
+
+
+def _read_sparse_rows(
+    group: h5py.Group, start: Optional[int], stop: Optional[int], columns: Optional[Sequence[Union[str, int]]]
+) -> pd.DataFrame:
+    """
+    Read a row range and a subset of columns of a sparse matrix.
+
+    :param group: the group containing the datasets of the csr or coo layout and shape
+    :param start: the first row to read
+    :param stop: the row after the last row to read
+    :param columns: the names or positions of the columns to read
+    :return: the selected part of the matrix as sparse dataframe
+    """
+    num_rows, num_columns = (int(n) for n in group["shape"][:])
+    start, stop, _ = slice(start, stop).indices(num_rows)
+    stop = max(start, stop)
+    i, j, values = _read_coordinates(group, start, stop)
+
+    column_names = group["column_names"].asstr()[:] if "column_names" in group else None
+    if columns is not None:
+        positions = np.array([_column_position(column, column_names) for column in columns], dtype=int)
+        new_positions = np.full(num_columns, -1)
+        new_positions[positions] = np.arange(len(positions))
+        mask = new_positions[j] >= 0
+        i, j, values = i[mask], new_positions[j[mask]], values[mask]
+        num_columns = len(positions)
+        if column_names is not None:
+            column_names = column_names[positions]
+
+    df = pd.DataFrame.sparse.from_spmatrix(coo_matrix((values, (i - start, j)), (stop - start, num_columns)))
+    if column_names is not None:
+        df.columns = column_names
+    index = _read_index(group, start, stop)
+    if index is not None:
+        df.index = index
+    return df
+
+
+def _read_index(group: h5py.Group, start: int, stop: int) -> Optional[np.ndarray]:
+    """
+    Read the index of the rows [start, stop) of a sparse group.
+
+    :param group: the sparse group
+    :param start: the first row to read
+    :param stop: the row after the last row to read
+    :return: the index of the rows, None if the group has no index
+    """
+    if "index" not in group:
+        return None
+    index = group["index"]
+    return index.asstr()[start:stop] if h5py.check_string_dtype(index.dtype) else index[start:stop]
+
+
+def _read_coordinates(group: h5py.Group, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Read the coordinates and values of the entries in the rows [start, stop) of a sparse matrix.
+
+    In the csr layout, the range of entries is given by the row pointers. In the coo layout, the range is found by
+    binary search on the row dataset if the entries are sorted by row, otherwise the row dataset is scanned in chunks.
+
+    :param group: the group containing the datasets indptr, indices and data or the datasets i, j and values
+    :param start: the first row to read
+    :param stop: the row after the last row to read
+    :return: tuple of row indices, column indices and values of the entries
+    """
+    if group.attrs.get("layout") == "csr":
+        indptr = group["indptr"][start : stop + 1]
+        rows = np.repeat(np.arange(start, stop), np.diff(indptr))
+        return rows, group["indices"][indptr[0] : indptr[-1]], group["data"][indptr[0] : indptr[-1]]
+    i_dataset, j_dataset, values_dataset = group["i"], group["j"], group["values"]
+    num_entries = i_dataset.shape[0]
+    if group.attrs.get("row_sorted", False):
+        first, last = _bisect(i_dataset, start), _bisect(i_dataset, stop)
+        return i_dataset[first:last], j_dataset[first:last], values_dataset[first:last]
+    if start == 0 and stop >= int(group["shape"][0]):
+        return i_dataset[:], j_dataset[:], values_dataset[:]
+    parts = []
+    for chunk_start in range(0, num_entries, _SPARSE_CHUNK_SIZE):
+        chunk = slice(chunk_start, chunk_start + _SPARSE_CHUNK_SIZE)
+        i = i_dataset[chunk]
+        mask = (i >= start) & (i < stop)
+        if mask.any():
+            parts.append((i[mask], j_dataset[chunk][mask], values_dataset[chunk][mask]))
+    if not parts:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0, dtype=values_dataset.dtype)
+    i, j, values = zip(*parts)
+    return np.concatenate(i), np.concatenate(j), np.concatenate(values)
+
+
+def _bisect(dataset: h5py.Dataset, value: int) -> int:
+    """
+    Find the first position in a sorted dataset with an element not smaller than value, reading single elements.
+
+    :param dataset: the sorted one-dimensional dataset
+    :param value: the value to search
+    :return: the position of the first element >= value
+    """
+    low, high = 0, dataset.shape[0]
+    while low < high:
+        middle = (low + high) // 2
+        if dataset[middle] < value:
+            low = middle + 1
         else:
-            df = pd.read_hdf(path, key=key)
-        return df
-    except Exception as e:
-        logger.exception(e)
+            high = middle
+    return low
+
+
+def _column_position(column: Union[str, int], column_names: Optional[np.ndarray]) -> int:
+    """
+    Get the position of a column of a sparse matrix.
+
+    :param column: the name or position of the column
+    :param column_names: the names of all columns, None if the matrix has no column names
+    :raises KeyError: if the column does not exist
+    :return: the position of the column
+    """
+    if column_names is not None and not isinstance(column, (int, np.integer)):
+        positions = np.flatnonzero(column_names == column)
+        if len(positions) == 0:
+            raise KeyError(f"Column {column} not found.")
+        return int(positions[0])
+    return int(column)
+
+
+class HDF5Writer:
+    """
+    Background service writing hdf5 files, allowing callers to overlap computations with writing.
+
+    Writes are executed by a fixed number of worker threads. All writes to the same file are handled by the same
+    thread in the order they were submitted, so they never race on the file. Each thread accepts a bounded number of
+    pending writes and submitting blocks while the target thread is full, which bounds the memory held by pending
+    writes. Every submission returns a future that raises the exception of a failed write.
+    """
+
+    def __init__(self, max_queue_size: int = 8, num_threads: int = 1):
+        """
+        Initialize a HDF5Writer object and start its worker threads.
+
+        :param max_queue_size: maximum number of pending writes per thread before submitting blocks
+        :param num_threads: number of worker threads. h5py and pandas serialize the calls to the hdf5 library, so more
+            than one thread mainly helps if the written data has to be converted or compressed first. Default: 1
+        :raises ValueError: if max_queue_size or num_threads is not a positive integer
+        """
+        if max_queue_size < 1 or num_threads < 1:
+            raise ValueError(f"max_queue_size and num_threads must be positive. Got {max_queue_size}, {num_threads}")
+        self._queues: List[queue.Queue] = [queue.Queue() for _ in range(num_threads)]
+        # the capacity is tracked separately from the queues, so that the shutdown never waits for free space
+        self._slots = [threading.BoundedSemaphore(max_queue_size) for _ in range(num_threads)]
+        self._shutdown = False
+        self._shutdown_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._work, args=(q, slots), name=f"hdf5-writer-{i}", daemon=True)
+            for i, (q, slots) in enumerate(zip(self._queues, self._slots))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, path: Union[str, Path], fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Schedule a function writing to a file, blocking while too many writes are pending.
+
+        :param path: the file written by fn, used to serialize all writes to the same file
+        :param fn: the function to execute
+        :param args: positional arguments of fn
+        :param kwargs: keyword arguments of fn
+        :raises RuntimeError: if the writer was shut down
+        :return: future resolving to the return value of fn
+        """
+        if self._shutdown:
+            raise RuntimeError("Cannot submit writes after the hdf5 writer was shut down.")
+        worker = zlib.crc32(os.path.abspath(path).encode()) % len(self._queues)
+        future: Future = Future()
+        self._slots[worker].acquire()
+        with self._shutdown_lock:
+            if self._shutdown:
+                self._slots[worker].release()
+                raise RuntimeError("Cannot submit writes after the hdf5 writer was shut down.")
+            self._queues[worker].put((future, fn, args, kwargs))
+        return future
+
+    def write_file(
+        self,
+        data_sets: List[Union[pd.DataFrame, scipy.sparse.spmatrix]],
+        path: Union[str, Path],
+        dataset_names: List[str],
+        column_names: Optional[List[Optional[List[str]]]] = None,
+    ) -> Future:
+        """
+        Schedule writing several datasets (spectra) to an hdf5 file.
+
+        :param data_sets: list of datasets
+        :param path: path to store the file to
+        :param dataset_names: list of dataset names
+        :param column_names: list of column_names
+        :return: future resolving once all datasets are written
+        """
+        return self.submit(path, _write_file, data_sets, path, dataset_names, column_names)
+
+    def flush(self):
+        """Wait until all writes submitted so far are finished."""
+        for q in self._queues:
+            q.join()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting writes and stop the worker threads.
+
+        :param wait: whether to wait for the pending writes and the worker threads. Otherwise return immediately and
+            cancel the writes that did not start yet, the running writes finish in the background
+        """
+        with self._shutdown_lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            for q, slots in zip(self._queues, self._slots):
+                if not wait:
+                    _cancel_pending(q, slots)
+                q.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self) -> "HDF5Writer":
+        """Use the writer as context manager, shutting it down on exit."""
+        return self
 
+    def __exit__(self, *args):
+        """Wait for all pending writes and stop the worker threads."""
+        self.shutdown(wait=True)
 
-def thread_this(fn):
-    """Function for threading."""
+    @staticmethod
+    def _work(q: queue.Queue, slots: threading.BoundedSemaphore):
+        """
+        Execute the writes of a queue until the shutdown sentinel is received.
 
-    def run(*args, **kwargs):
-        t = threading.Thread(target=fn, args=args, kwargs=kwargs)
-        t.start()
-        return t
+        :param q: the queue of the worker thread
+        :param slots: semaphore limiting the number of pending writes of the queue
+        """
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                slots.release()
+                future, fn, args, kwargs = item
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                q.task_done()
 
-    return run
+
+def _cancel_pending(q: queue.Queue, slots: threading.BoundedSemaphore):
+    """
+    Cancel the writes waiting in the queue of a worker thread.
+
+    :param q: the queue of the worker thread
+    :param slots: semaphore limiting the number of pending writes of the queue
+    """
+    while True:
+        try:
+            future, _, _, _ = q.get_nowait()
+        except queue.Empty:
+            return
+        slots.release()
+        future.cancel()
+        q.task_done()
+
+
+_default_writer: Optional[HDF5Writer] = None
+_default_writer_lock = threading.Lock()
+
+
+def get_writer() -> HDF5Writer:
+    """
+    Get the writer service used by ``write_file``, which is flushed and stopped when the interpreter exits.
+
+    :return: the default hdf5 writer
+    """
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = HDF5Writer()
+            atexit.register(_default_writer.shutdown)
+        return _default_writer
 
 
-@thread_this
 def write_file(
     data_sets: List[Union[pd.DataFrame, scipy.sparse.spmatrix]],
-    path: str,
+    path: Union[str, Path],
+    dataset_names: List[str],
+    column_names: Optional[List[Optional[List[str]]]] = None,
+) -> Future:
+    """
+    Writes several datasets (spectra) to hdf5 file in the background.
+
+    The write is scheduled on the default ``HDF5Writer``, so multiple calls for the same file are executed in
+    order and never at the same time. Call result() on the returned future to wait for the write and to raise its
+    exception if it failed.
+
+    :param data_sets: list of datasets
+    :param path: path to store the file to
+    :param dataset_names: list of dataset names
+    :param column_names: list of column_names
+    :return: future resolving once all datasets are written
+    """
+    return get_writer().write_file(data_sets, path, dataset_names, column_names)
+
+
+def _write_file(
+    data_sets: List[Union[pd.DataFrame, scipy.sparse.spmatrix]],
+    path: Union[str, Path],
     dataset_names: List[str],
     column_names: Optional[List[Optional[List[str]]]] = None,
 ):
@@ -74,9 +505,10 @@ def write_file(
     :raises TypeError: if data_set has an unexpected type
     """
     index = 0
-    for data_set, dataset_name in zip(data_sets, dataset_names):
+    for position, (data_set, dataset_name) in enumerate(zip(data_sets, dataset_names)):
         if isinstance(data_set, pd.DataFrame):
-            write_dataset(data_set, path, dataset_name)
+            # a leading dataframe replaces the file, the following datasets are added to it
+            write_dataset(data_set, path, dataset_name, mode="w" if position == 0 else "a")
         elif isinstance(data_set, scipy.sparse.spmatrix):
             if not isinstance(column_names, list):
                 raise TypeError(f"column_names is required if data_set is of type {type(data_set)}.")
@@ -88,55 +520,554 @@ def write_file(
 
 def write_dataset(
     data: Union[pd.DataFrame, scipy.sparse.spmatrix],
-    path: str,
+    path: Union[str, Path],
     dataset_name: str,
     mode: str = "w",
     compression: Optional[Union[str, bool]] = True,
     column_names: Optional[List[str]] = None,
     index: Optional[List[str]] = None,
+    hdf_format: str = "fixed",
+    data_columns: Optional[List[str]] = None,
+    sparse_layout: str = "csr",
 ):
     """
     Writes or appends dataset to an hdf5 file.
 
+    Sparse matrices are stored in a group named sparse_<dataset_name>. The default csr layout stores the row pointers
+    indptr, the column indices as int32 and the values as float32 in chunked datasets, so reading a range of rows
+    only reads the chunks of these rows. The coo layout stores row and column indices and values in their original
+    precision and is only kept for compatibility with older readers.
+
     :param data: The data to store. Can be a pandas DataFrame or a scipy Sparsematrix
     :param path: The path to store the file to
     :param dataset_name: The key in the hdf5 file under which to store the data
     :param mode: The method when writing the data. Use 'a' to append to an existing file or 'w' to overwrite
     :param compression: Optional, the method for compressing data. Check pandas.DataFrame.to_hdf docs for supported
-            compression methods in case of providing a pandas DataFrame and h5py.Dataset docs in case of providing
-            a sparse matrix. If providing False, no compression is applied; if providing True, defaults to 'zlib'
-            in case of providing a pandas DataFrame and 'gzip' if providing a sparse matrix.
-            standard compression depending on the data type given. Default: True
+            compression methods in case of providing a pandas DataFrame, in which case 'gzip' is an alias of 'zlib'.
+            Sparse matrices support 'gzip', 'lzf' and 'blosc' or 'blosc:<compressor>', e.g. 'blosc:zstd', which
+            requires hdf5plugin and uses the number of threads given by the BLOSC_NTHREADS environment variable.
+            If providing False or None, no compression is applied; if providing True, defaults to 'zlib' in case of
+            providing a pandas DataFrame and 'gzip' if providing a sparse matrix. Default: True
     :param column_names: Optional, additional column column_names. Ignored if providing a pandas DataFrame. Default: None
     :param index: Optional, additional index. Ignored if providing a pandas DataFrame. Default: None
-    :raises AssertionError: if data_set has an unexpected type
+    :param hdf_format: Optional, the pandas storage format, either 'fixed' or 'table'. Only the table format supports
+            reading selected columns without loading all of them and where predicates. Ignored if providing a sparse
+            matrix. Default: 'fixed'
+    :param data_columns: Optional, columns of a dataframe in table format to index for where predicates. Ignored if
+            providing a sparse matrix. Default: None
+    :param sparse_layout: Optional, the layout of sparse matrices, either 'csr' or 'coo'. Ignored if providing a
+            pandas DataFrame. Default: 'csr'
+    :raises TypeError: if data_set has an unexpected type
+    :raises ValueError: if the sparse layout is unknown
+    """
+    if isinstance(data, pd.DataFrame):
+        complib = "zlib" if compression is True or compression == "gzip" else compression or None
+        # pandas only compresses with a complevel > 0
+        with _PYTABLES_LOCK:
+            data.to_hdf(
+                path,
+                key=dataset_name,
+                mode=mode,
+                complib=complib,
+                complevel=4 if complib else None,
+                format=hdf_format,
+                data_columns=data_columns,
+            )
+    elif isinstance(data, scipy.sparse.spmatrix):
+        if sparse_layout not in ("csr", "coo"):
+            raise ValueError(f"Unknown sparse layout {sparse_layout}, use 'csr' or 'coo'.")
+        filter_options = _filter_options(compression)
+        with h5py.File(path, mode) as f:
+            _write_sparse(f, f"sparse_{dataset_name}", data, sparse_layout, filter_options, column_names, index)
+    else:
+        raise TypeError(f"Only pd.DataFrame and scipy.sparse.spmatrix are supported. Got {type(data)}")
+    logger.info(f"Data {'appended' if mode=='a' else 'written'} to {path}")
+
+
+def append_dataset(
+    data: Union[pd.DataFrame, scipy.sparse.spmatrix],
+    path: Union[str, Path],
+    dataset_name: str,
+    compression: Optional[Union[str, bool]] = True,
+    column_names: Optional[List[str]] = None,
+    index: Optional[Sequence[Union[str, int]]] = None,
+    data_columns: Optional[List[str]] = None,
+    min_itemsize: Optional[Dict[str, int]] = None,
+):
+    """
+    Appends a batch of rows to a dataset of an hdf5 file, creating the file and the dataset with the first batch.
+
+    Results can thus be streamed to disk batch by batch instead of being collected in memory. Sparse matrices are
+    appended to the resizable datasets of a group in csr layout, see ``write_dataset``. The shape of the group is
+    updated after the rows, so readers only see complete batches. Dataframes are appended in pandas table format.
+    Calls for the same file must not run concurrently, e.g. submit them to an ``HDF5Writer``.
+
+    :param data: The rows to append. Can be a pandas DataFrame or a scipy Sparsematrix
+    :param path: The path to the hdf5 file
+    :param dataset_name: The key in the hdf5 file under which to store the data
+    :param compression: Optional, the method for compressing data, see ``write_dataset``. Only used when creating
+        the dataset. Default: True
+    :param column_names: Optional, the column names of a sparse matrix. Only used when creating the dataset.
+        Ignored if providing a pandas DataFrame. Default: None
+    :param index: Optional, the index of the rows of a sparse matrix. Has to be given either for every batch or for
+        none. Ignored if providing a pandas DataFrame. Default: None
+    :param data_columns: Optional, columns of a dataframe to index for where predicates. Only used when creating the
+        dataset. Ignored if providing a sparse matrix. Default: None
+    :param min_itemsize: Optional, the minimum sizes of string columns of a dataframe. The table format stores
+        strings with a fixed size determined by the first batch, so longer strings of later batches require
+        reserving space. Ignored if providing a sparse matrix. Default: None
+    :raises TypeError: if data has an unexpected type
+    """
+    if isinstance(data, pd.DataFrame):
+        complib = "zlib" if compression is True or compression == "gzip" else compression or None
+        with _PYTABLES_LOCK:
+            data.to_hdf(
+                path,
+                key=dataset_name,
+                mode="a",
+                append=True,
+                complib=complib,
+                complevel=4 if complib else None,
+                format="table",
+                data_columns=data_columns,
+                min_itemsize=min_itemsize,
+            )
+    elif isinstance(data, scipy.sparse.spmatrix):
+        group_name = f"sparse_{dataset_name}"
+        with h5py.File(path, "a") as f:
+            if group_name in f:
+                _append_csr(f[group_name], data, index)
+            else:
+                filter_options = _filter_options(compression)
+                _write_sparse(f, group_name, data, "csr", filter_options, column_names, index)
+    else:
+        raise TypeError(f"Only pd.DataFrame and scipy.sparse.spmatrix are supported. Got {type(data)}")
+    logger.info(f"{data.shape[0]} rows appended to {dataset_name} in {path}")
+
+
+def _write_sparse(
+    f: h5py.File,
+    group_name: str,
+    data: scipy.sparse.spmatrix,
+    sparse_layout: str,
+    filter_options: Dict[str, Any],
+    column_names: Optional[List[str]],
+    index: Optional[Sequence[Union[str, int]]],
+):
+    """
+    Create a sparse group.
+
+    :param f: the opened hdf5 file
+    :param group_name: the name of the group
+    :param data: the sparse matrix
+    :param sparse_layout: the layout of the group, either 'csr' or 'coo'
+    :param filter_options: keyword arguments of h5py.Group.create_dataset selecting the compression filter
+    :param column_names: the column names of the matrix
+    :param index: the index of the rows of the matrix
+    """
+    group = f.create_group(group_name)
+    if sparse_layout == "csr":
+        _write_csr(group, data, filter_options)
+    else:
+        _write_coo(group, data, filter_options)
+    group.create_dataset("shape", data=data.shape, shape=(2,), dtype=int)
+    if column_names:
+        _create_chunked_dataset(group, "column_names", column_names, filter_options)
+    if index is not None and len(index) > 0:
+        _create_chunked_dataset(group, "index", index, filter_options)
+
+
+def _append_csr(group: h5py.Group, data: scipy.sparse.spmatrix, index: Optional[Sequence[Union[str, int]]]):
+    """
+    Append the rows of a sparse matrix to a group in csr layout.
+
+    :param group: the sparse group
+    :param data: the rows to append
+    :param index: the index of the rows to append
+    :raises ValueError: if the group is not in csr layout, the number of columns differs or the index is missing,
+        unexpected or has the wrong length
     """
-    if isinstance(compression, bool) and compression:
-        if isinstance(compression, pd.DataFrame):
-            compression = "zlib"
-        elif isinstance(compression, scipy.sparse.spmatrix):
-            compression = "gzip"
+    if group.attrs.get("layout") != "csr":
+        raise ValueError(f"Rows can only be appended to groups in csr layout, {group.name} is in coo layout.")
+    num_rows, num_columns = (int(n) for n in group["shape"][:])
+    if data.shape[1] != num_columns:
+        raise ValueError(f"{group.name} has {num_columns} columns, cannot append {data.shape[1]} columns.")
+    # the index can only be omitted or added if no rows were written yet
+    if num_rows > 0 and ("index" in group) != (index is not None):
+        raise ValueError("An index has to be given for every batch or for none.")
+    if index is not None and len(index) != data.shape[0]:
+        raise ValueError(f"The index has {len(index)} entries, but {data.shape[0]} rows are appended.")
+    csr = data.tocsr()
+    csr.sort_indices()
+    _append(group["indices"], csr.indices)
+    _append(group["data"], csr.data.astype(np.float32))
+    _append(group["indptr"], csr.indptr[1:].astype(np.int64) + group["indptr"][-1])
+    if index is not None and len(index) > 0:
+        if "index" not in group:
+            # the previous batches were empty, the uncompressed index is created with the first rows
+            _create_chunked_dataset(group, "index", index, {})
         else:
-            compression = None
-    try:
-        if isinstance(data, pd.DataFrame):
-            data.to_hdf(path, key=dataset_name, mode=mode, complib=compression)
-        elif isinstance(data, scipy.sparse.spmatrix):
-            with h5py.File(path, mode) as f:
-                group_name = f"sparse_{dataset_name}"
-                f.create_group(group_name)
-                i, j, values = scipy.sparse.find(data)
-                shape = data.shape
-                f.create_dataset(f"{group_name}/i", data=i, compression=compression, dtype=int)
-                f.create_dataset(f"{group_name}/j", data=j, compression=compression, dtype=int)
-                f.create_dataset(f"{group_name}/values", data=values, compression=compression, dtype=float)
-                f.create_dataset(f"{group_name}/shape", data=shape, shape=(2,), dtype=int)
-                if column_names:
-                    f.create_dataset(f"{group_name}/column_names", data=column_names, compression=compression)
-                if index:
-                    f.create_dataset(f"{group_name}/index", data=index, compression=compression)
+            _append(group["index"], index)
+    group["shape"][0] = num_rows + csr.shape[0]
+
+
+def _write_csr(group: h5py.Group, data: scipy.sparse.spmatrix, filter_options: Dict[str, Any]):
+    """
+    Store a sparse matrix as row pointers, column indices and values.
+
+    :param group: the group to create the datasets in
+    :param data: the sparse matrix
+    :param filter_options: keyword arguments of h5py.Group.create_dataset selecting the compression filter
+    """
+    csr = data.tocsr()
+    csr.sort_indices()
+    index_dtype = np.int32 if csr.shape[1] <= np.iinfo(np.int32).max else np.int64
+    group.attrs["layout"] = "csr"
+    _create_chunked_dataset(group, "indptr", csr.indptr.astype(np.int64), filter_options)
+    _create_chunked_dataset(group, "indices", csr.indices.astype(index_dtype), filter_options)
+    _create_chunked_dataset(group, "data", csr.data.astype(np.float32), filter_options)
+
+
+def _write_coo(group: h5py.Group, data: scipy.sparse.spmatrix, filter_options: Dict[str, Any]):
+    """
+    Store a sparse matrix as row indices, column indices and values, sorted by row.
+
+    :param group: the group to create the datasets in
+    :param data: the sparse matrix
+    :param filter_options: keyword arguments of h5py.Group.create_dataset selecting the compression filter
+    """
+    # coo entries of a csr matrix are sorted by row, allowing to read row ranges by binary search
+    coo = data.tocsr().tocoo()
+    group.attrs["row_sorted"] = True
+    _create_chunked_dataset(group, "i", coo.row.astype(int), filter_options)
+    _create_chunked_dataset(group, "j", coo.col.astype(int), filter_options)
+    _create_chunked_dataset(group, "values", coo.data.astype(float), filter_options)
+
+
+def _create_chunked_dataset(group: h5py.Group, name: str, data: Any, filter_options: Dict[str, Any]):
+    """
+    Create a one-dimensional, resizable dataset in chunks of up to _SPARSE_CHUNK_SIZE elements.
+
+    :param group: the group to create the dataset in
+    :param name: the name of the dataset
+    :param data: the elements of the dataset
+    :param filter_options: keyword arguments of h5py.Group.create_dataset selecting the compression filter
+    """
+    # hdf5 does not allow chunks of size 0, empty datasets get the chunk size of the batches appended later
+    chunk_size = min(len(data), _SPARSE_CHUNK_SIZE) or _SPECTRA_CHUNK_SIZE
+    group.create_dataset(name, data=data, maxshape=(None,), chunks=(chunk_size,), **filter_options)
+
+
+def _filter_options(compression: Optional[Union[str, bool]]) -> Dict[str, Any]:
+    """
+    Get the keyword arguments of h5py.Group.create_dataset for a compression method.
+
+    The byte shuffle filter is applied before compressing, which groups the similar high bytes of indices and values.
+
+    :param compression: 'gzip', 'lzf', 'blosc' or 'blosc:<compressor>', True for 'gzip', None or False for no
+        compression
+    :raises ImportError: if blosc is requested but hdf5plugin is not installed
+    :raises ValueError: if the compression method is not supported
+    :return: the keyword arguments
+    """
+    if not compression:
+        return {}
+    if compression is True or compression == "gzip":
+        return {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+    if compression == "lzf":
+        return {"compression": "lzf", "shuffle": True}
+    if compression.split(":")[0] == "blosc":
+        if hdf5plugin is None:
+            raise ImportError("Compression with blosc requires hdf5plugin, install it or use 'gzip' or 'lzf'.")
+        cname = compression.partition(":")[2] or "lz4"
+        return dict(hdf5plugin.Blosc(cname=cname, clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError(f"Unsupported compression {compression} for sparse matrices, use 'gzip', 'lzf' or 'blosc'.")
+
+
+def write_spectra(
+    spectra: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    path: Union[str, Path],
+    group: str = "/",
+    mode: str = "w",
+    compression: Optional[str] = "gzip",
+):
+    """
+    Writes spectra to a ragged-array container in an hdf5 file.
+
+    The peaks of all spectra are stored in the flat datasets MZ_RAW_KEY and INTENSITY_RAW_KEY of the group. The peaks
+    of spectrum i are found between offsets[i] and offsets[i + 1]. All other columns are stored as one dataset per
+    column in the META_DATA_KEY subgroup. An iterable of dataframes is written batch by batch into resizable datasets,
+    so spectra can be streamed to the file as they are read.
+
+    :param spectra: a dataframe or an iterable of dataframes in the layout returned by MSRaw.read_mzml, i.e. with one
+        array of peaks per row in the columns MZ and INTENSITIES
+    :param path: The path to the hdf5 file
+    :param group: the group to store the spectra in, e.g. one group per raw file. Default: "/"
+    :param mode: use 'a' to add the group to an existing file or 'w' to overwrite the file
+    :param compression: Optional, the compression filter of the peak datasets, see h5py.Dataset. Default: "gzip"
+    """
+    if isinstance(spectra, pd.DataFrame):
+        spectra = [spectra]
+    metadata = []
+    columns = ["MZ", "INTENSITIES"]
+    with h5py.File(path, mode) as f:
+        h5_group = f.require_group(group)
+        offsets = h5_group.create_dataset(
+            "offsets", shape=(1,), maxshape=(None,), dtype="int64", chunks=(_SPECTRA_CHUNK_SIZE,), data=[0]
+        )
+        datasets = {}  # type: Dict[str, h5py.Dataset]
+        for df in spectra:
+            if len(df) == 0:
+                continue
+            ends = np.cumsum(df["MZ"].apply(len).to_numpy()) + offsets[-1]
+            for key, column in [(MZ_RAW_KEY, "MZ"), (INTENSITY_RAW_KEY, "INTENSITIES")]:
+                values = np.concatenate(df[column].to_list())
+                if key not in datasets:
+                    datasets[key] = h5_group.create_dataset(
+                        key,
+                        shape=(0,),
+                        maxshape=(None,),
+                        dtype=values.dtype,
+                        chunks=(_SPECTRA_CHUNK_SIZE,),
+                        compression=compression,
+                    )
+                _append(datasets[key], values)
+            _append(offsets, ends)
+            metadata.append(df.drop(columns=["MZ", "INTENSITIES"]))
+            columns = list(df.columns)
+        for key in [MZ_RAW_KEY, INTENSITY_RAW_KEY]:
+            if key not in datasets:
+                h5_group.create_dataset(
+                    key, shape=(0,), maxshape=(None,), dtype="float64", chunks=(_SPECTRA_CHUNK_SIZE,)
+                )
+
+        meta_data = pd.concat(metadata) if metadata else pd.DataFrame()
+        meta_group = h5_group.create_group(META_DATA_KEY)
+        meta_group.attrs["columns"] = list(meta_data.columns)
+        h5_group.attrs["columns"] = columns
+        for column in meta_data.columns:
+            values = meta_data[column].to_numpy()
+            if values.dtype == object or isinstance(meta_data[column].dtype, pd.CategoricalDtype):
+                values = values.astype(str).astype(object)
+                meta_group.create_dataset(column, data=values, dtype=h5py.string_dtype(), compression=compression)
+            else:
+                meta_group.create_dataset(column, data=values, compression=compression)
+    logger.info(f"{len(meta_data)} spectra written to {path}")
+
+
+def read_spectra(
+    path: Union[str, Path], group: str = "/", start: Optional[int] = None, stop: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Reads spectra written by ``write_spectra``.
+
+    Only the peaks of the spectra in the range [start, stop) are read, which are stored contiguously.
+
+    :param path: The path to the hdf5 file
+    :param group: the group the spectra are stored in. Default: "/"
+    :param start: Optional, the first spectrum to read. Default: None, meaning the first spectrum
+    :param stop: Optional, the spectrum after the last spectrum to read. Default: None, meaning after the last spectrum
+    :return: a pandas DataFrame with the metadata columns and one array of peaks per row in the columns MZ and
+        INTENSITIES in the column order of the written dataframes. The arrays are views into the flat peak arrays.
+    """
+    with h5py.File(path, "r") as f:
+        h5_group = f[group]
+        start, stop, _ = slice(start, stop).indices(h5_group["offsets"].shape[0] - 1)
+        stop = max(start, stop)
+        offsets = h5_group["offsets"][start : stop + 1]
+        mz = h5_group[MZ_RAW_KEY][offsets[0] : offsets[-1]]
+        intensity = h5_group[INTENSITY_RAW_KEY][offsets[0] : offsets[-1]]
+        offsets -= offsets[0]
+        meta_group = h5_group[META_DATA_KEY]
+        columns = list(h5_group.attrs["columns"])
+        df = pd.DataFrame(
+            {
+                column: (
+                    meta_group[column].asstr()[start:stop]
+                    if h5py.check_string_dtype(meta_group[column].dtype)
+                    else meta_group[column][start:stop]
+                )
+                for column in meta_group.attrs["columns"]
+            }
+        )
+    df["MZ"] = split_peaks(mz, offsets)
+    df["INTENSITIES"] = split_peaks(intensity, offsets)
+    return df[columns]
+
+
+def _append(dataset: h5py.Dataset, values: Union[np.ndarray, Sequence[Any]]):
+    start = dataset.shape[0]
+    dataset.resize((start + len(values),))
+    dataset[start:] = values
+
+
+class SpectrumContainer:
+    """
+    Single hdf5 file holding the raw spectra, predicted intensities and psm metadata of a pipeline.
+
+    The raw spectra of each raw file are stored in the group raw/<raw_file> in the layout of ``write_spectra``.
+    The predicted intensities are stored in the chunked two-dimensional float32 dataset INTENSITY_PRED_KEY, whose
+    chunks span all columns and about 1 MB of rows, so reading a slab of rows touches only a few chunks. The psm
+    metadata is stored as pandas table under META_DATA_KEY, supporting where predicates on its data columns. Row i of
+    the predicted intensities belongs to row i of the psm metadata, both are appended batch by batch.
+
+    Methods open and close the file on every call, so a container can be passed between pipeline stages by its path.
+    Writes to the same file must not run concurrently, e.g. submit them to an ``HDF5Writer``.
+    """
+
+    RAW_GROUP = "raw"
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Initialize a SpectrumContainer object.
+
+        :param path: path to the hdf5 file, which is created by the first write
+        """
+        self.path = Path(path)
+
+    def write_raw_spectra(
+        self,
+        spectra: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+        raw_file: Optional[str] = None,
+        compression: Optional[str] = "gzip",
+    ):
+        """
+        Store the spectra of raw files, replacing previously stored spectra of the same raw files.
+
+        :param spectra: a dataframe or an iterable of dataframes in the layout returned by MSRaw.read_mzml
+        :param raw_file: Optional, the raw file the spectra belong to. Default: None, meaning that a dataframe is split
+            by its RAW_FILE column. Required if providing an iterable of dataframes
+        :param compression: Optional, the compression filter of the peak datasets, see h5py.Dataset. Default: "gzip"
+        :raises ValueError: if an iterable of dataframes is given without raw file
+        """
+        if raw_file is not None:
+            groups = [(raw_file, spectra)]
+        elif isinstance(spectra, pd.DataFrame):
+            groups = list(spectra.groupby("RAW_FILE", sort=False))
         else:
-            raise AssertionError("Only pd.DataFrame and scipy.sparse.spmatrix are supported." + type(data))
-        logger.info(f"Data {'appended' if mode=='a' else 'written'} to {path}")
-    except Exception as e:
-        logger.exception(e)
+            raise ValueError("raw_file is required if providing an iterable of dataframes.")
+        for name, raw_spectra in groups:
+            group = f"{self.RAW_GROUP}/{name}"
+            with h5py.File(self.path, "a") as f:
+                if group in f:
+                    del f[group]
+            write_spectra(raw_spectra, self.path, group=group, mode="a", compression=compression)
+
+    def raw_files(self) -> List[str]:
+        """
+        Get the names of the raw files with stored spectra.
+
+        :return: the names of the raw files
+        """
+        if not self.path.is_file():
+            return []
+        with h5py.File(self.path, "r") as f:
+            return list(f[self.RAW_GROUP].keys()) if self.RAW_GROUP in f else []
+
+    def read_raw_spectra(self, raw_file: str, start: Optional[int] = None, stop: Optional[int] = None) -> pd.DataFrame:
+        """
+        Read the spectra of a raw file.
+
+        :param raw_file: the name of the raw file
+        :param start: Optional, the first spectrum to read. Default: None, meaning the first spectrum
+        :param stop: Optional, the spectrum after the last spectrum to read. Default: None, meaning after the last
+            spectrum
+        :return: the spectra in the layout returned by MSRaw.read_mzml
+        """
+        return read_spectra(self.path, f"{self.RAW_GROUP}/{raw_file}", start, stop)
+
+    def append_psms(
+        self,
+        psms: pd.DataFrame,
+        data_columns: Optional[List[str]] = None,
+        min_itemsize: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Append a batch of psm metadata.
+
+        :param psms: the metadata of the psms, e.g. a search result
+        :param data_columns: Optional, columns to index for where predicates. Only used for the first batch.
+            Default: None
+        :param min_itemsize: Optional, the minimum sizes of string columns, see ``append_dataset``. Default: None
+        """
+        append_dataset(psms, self.path, META_DATA_KEY, data_columns=data_columns, min_itemsize=min_itemsize)
+
+    def read_psms(
+        self,
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+        where: Optional[Union[str, List[str]]] = None,
+    ) -> pd.DataFrame:
+        """
+        Read psm metadata, see ``read_file`` for the arguments.
+
+        :param start: Optional, the first row to read. Default: None, meaning the first row
+        :param stop: Optional, the row after the last row to read. Default: None, meaning after the last row
+        :param columns: Optional, the names of the columns to read. Default: None, meaning all columns
+        :param where: Optional, a where predicate on the data columns. Default: None
+        :return: the selected psm metadata
+        """
+        return read_file(self.path, META_DATA_KEY, start=start, stop=stop, columns=columns, where=where)
+
+    def append_predictions(
+        self,
+        intensities: Union[np.ndarray, scipy.sparse.spmatrix],
+        column_names: Optional[List[str]] = None,
+        compression: Optional[Union[str, bool]] = "gzip",
+    ):
+        """
+        Append a batch of predicted intensities, one row per psm.
+
+        :param intensities: the predicted intensities with one column per fragment ion
+        :param column_names: Optional, the names of the fragment ions. Only used for the first batch. Default: None
+        :param compression: Optional, the compression method, see ``write_dataset``. Only used for the first
+            batch. Default: "gzip"
+        :raises ValueError: if the number of columns differs from the stored intensities
+        """
+        if isinstance(intensities, scipy.sparse.spmatrix):
+            intensities = intensities.toarray()
+        intensities = np.asarray(intensities, dtype=np.float32)
+        with h5py.File(self.path, "a") as f:
+            if INTENSITY_PRED_KEY not in f:
+                num_columns = intensities.shape[1]
+                rows_per_chunk = max(1, _SLAB_CHUNK_BYTES // (num_columns * intensities.itemsize))
+                dataset = f.create_dataset(
+                    INTENSITY_PRED_KEY,
+                    shape=(0, num_columns),
+                    maxshape=(None, num_columns),
+                    dtype=np.float32,
+                    chunks=(rows_per_chunk, num_columns),
+                    **_filter_options(compression),
+                )
+                if column_names:
+                    dataset.attrs["column_names"] = column_names
+            dataset = f[INTENSITY_PRED_KEY]
+            if intensities.shape[1] != dataset.shape[1]:
+                raise ValueError(
+                    f"{INTENSITY_PRED_KEY} has {dataset.shape[1]} columns, cannot append {intensities.shape[1]}."
+                )
+            num_rows = dataset.shape[0]
+            dataset.resize((num_rows + len(intensities), dataset.shape[1]))
+            dataset[num_rows:] = intensities
+
+    def read_predictions(self, start: Optional[int] = None, stop: Optional[int] = None) -> np.ndarray:
+        """
+        Read the predicted intensities of a range of psms.
+
+        :param start: Optional, the first row to read. Default: None, meaning the first row
+        :param stop: Optional, the row after the last row to read. Default: None, meaning after the last row
+        :return: the predicted intensities as float32 array
+        """
+        with h5py.File(self.path, "r") as f:
+            return f[INTENSITY_PRED_KEY][start:stop]
+
+    def prediction_columns(self) -> Optional[List[str]]:
+        """
+        Get the names of the fragment ions of the predicted intensities.
+
+        :return: the names of the fragment ions, None if they were not stored
+        """
+        with h5py.File(self.path, "r") as f:
+            column_names = f[INTENSITY_PRED_KEY].attrs.get("column_names")
+        return None if column_names is None else [str(name) for name in column_names]
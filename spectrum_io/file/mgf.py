@@ -0,0 +1,126 @@
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MGF_COLUMNS = ["TITLE", "SCAN_NUMBER", "RETENTION_TIME", "PRECURSOR_MZ", "PRECURSOR_CHARGE", "MZ", "INTENSITIES"]
+
+_TITLE_SCAN_PATTERNS = [re.compile(r"scan=(\d+)"), re.compile(r"\.(\d+)\.\d+\.\d*$")]
+
+
+def read_file(path: Union[str, Path]) -> pd.DataFrame:
+    """
+    Read an mgf file and return a df with one row per spectrum.
+
+    The scan number is taken from the SCANS parameter or, if it is missing, from a scan=<number> or
+    <name>.<scan>.<scan>.<charge> pattern in the title. Retention times are converted to minutes.
+
+    :param path: path to the mgf file
+    :return: df with the columns MGF_COLUMNS
+    """
+    spectra = []
+    params: Dict[str, str] = {}
+    peaks: List[List[str]] = []
+    with open(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if not line or line[0] in "#;!/":
+                continue
+            if line == "BEGIN IONS":
+                params, peaks = {}, []
+            elif line == "END IONS":
+                spectra.append(_parse_spectrum(params, peaks))
+            elif line[0].isdigit():
+                peaks.append(line.split(maxsplit=2)[:2])
+            elif "=" in line:
+                key, value = line.split("=", 1)
+                params[key.upper()] = value
+    df = pd.DataFrame(spectra, columns=MGF_COLUMNS)
+    logger.info(f"{len(df)} spectra read from {path}")
+    return df
+
+
+def _parse_spectrum(params: Dict[str, str], peaks: List[List[str]]) -> List[Any]:
+    """
+    Convert the parameters and peak lines of a single mgf entry to a row in the order of MGF_COLUMNS.
+
+    :param params: the key value pairs of the entry with upper case keys
+    :param peaks: the m/z and intensity strings of the peak lines
+    :return: the row of the spectrum
+    """
+    title = params.get("TITLE", "")
+    scan_number = -1
+    if "SCANS" in params:
+        scan_number = int(params["SCANS"].split("-")[0])
+    else:
+        for pattern in _TITLE_SCAN_PATTERNS:
+            match = pattern.search(title)
+            if match is not None:
+                scan_number = int(match.group(1))
+                break
+    charge = params.get("CHARGE", "0").split(" and ")[0].strip()
+    # charges are written as "2+", a trailing minus indicates negative charges
+    charge_state = -int(charge[:-1]) if charge.endswith("-") else int(charge.rstrip("+") or 0)
+    pepmass = params.get("PEPMASS", "").split()
+    peak_array = np.array(peaks, dtype=float).reshape(-1, 2)
+    return [
+        title,
+        scan_number,
+        float(params["RTINSECONDS"]) / 60 if "RTINSECONDS" in params else np.nan,
+        float(pepmass[0]) if pepmass else np.nan,
+        charge_state,
+        peak_array[:, 0].copy(),
+        peak_array[:, 1].copy(),
+    ]
+
+
+def write_file(spectra: Union[pd.DataFrame, Iterable[pd.DataFrame]], path: Union[str, Path], mode: str = "w"):
+    """
+    Write spectra to an mgf file.
+
+    The spectra are expected in the layout returned by MSRaw.read_mzml. The optional columns PRECURSOR_MZ and
+    PRECURSOR_CHARGE are written as PEPMASS and CHARGE if present. An iterable of dataframes is written batch by
+    batch, so spectra can be streamed to the file as they are read.
+
+    :param spectra: a dataframe or an iterable of dataframes with the columns RAW_FILE, SCAN_NUMBER, MZ, INTENSITIES
+        and RETENTION_TIME
+    :param path: path to the mgf file
+    :param mode: use 'a' to append to an existing file or 'w' to overwrite it
+    """
+    if isinstance(spectra, pd.DataFrame):
+        spectra = [spectra]
+    num_spectra = 0
+    with open(path, mode) as fh:
+        for df in spectra:
+            for spectrum in df.itertuples(index=False):
+                fh.write(_format_spectrum(spectrum._asdict()))
+            num_spectra += len(df)
+    logger.info(f"{num_spectra} spectra written to {path}")
+
+
+def _format_spectrum(spectrum: dict) -> str:
+    """
+    Format a single spectrum as mgf entry.
+
+    :param spectrum: dictionary with the columns of a single row of the spectra dataframe
+    :return: the mgf entry including the BEGIN IONS and END IONS lines
+    """
+    charge = int(spectrum.get("PRECURSOR_CHARGE", 0) or 0)
+    lines = [
+        "BEGIN IONS",
+        f"TITLE={spectrum['RAW_FILE']}.{spectrum['SCAN_NUMBER']}.{spectrum['SCAN_NUMBER']}.{charge}",
+        f"RTINSECONDS={spectrum['RETENTION_TIME'] * 60:.4f}",
+    ]
+    if not np.isnan(spectrum.get("PRECURSOR_MZ", np.nan)):
+        lines.append(f"PEPMASS={spectrum['PRECURSOR_MZ']:.6f}")
+    if charge > 0:
+        lines.append(f"CHARGE={charge}+")
+    lines.append(f"SCANS={spectrum['SCAN_NUMBER']}")
+    lines.extend(f"{mz:.6f} {intensity:.4f}" for mz, intensity in zip(spectrum["MZ"], spectrum["INTENSITIES"]))
+    lines.append("END IONS\n\n")
+    return "\n".join(lines)
@@ -1,6 +1,9 @@
 """Init raw."""
 import logging
 
+from .peak_filter import PeakFilter
+from .spectra_cache import SpectraCache
+from .spectrum_batch import SpectrumBatch
 from .thermo_raw import ThermoRaw
 
 logger = logging.getLogger(__name__)
@@ -0,0 +1,318 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+LOCK_SUFFIX = ".lock"
+BREAK_SUFFIX = ".break"
+
+# conversions of large raw files take tens of minutes, waiting for them must not time out too early
+LOCK_TIMEOUT = 2 * 60 * 60.0
+STALE_AFTER = 5 * 60.0
+
+_CHUNK_SIZE = 1 << 20
+
+
+class ConversionManifest:
+    """
+    Sidecar file recording how a converted file was created, used to decide whether it can be reused.
+
+    The manifest stores size, modification time and SHA-256 checksum of the input file, the conversion parameters
+    and size, modification time and checksum of the output file. It is written only after the output file has been
+    renamed into place, so an output without a matching manifest is either partial, stale or was created by other
+    means and has to be converted again. Checksums are only computed when size and modification time disagree, e.g.
+    after copying the files, so checking an unchanged file does not read it.
+    """
+
+    def __init__(self, output_path: Union[str, Path]):
+        """
+        Initialize a ConversionManifest object.
+
+        :param output_path: path to the converted file
+        """
+        self.output_path = Path(output_path)
+        self.path = self.output_path.with_name(self.output_path.name + MANIFEST_SUFFIX)
+
+    def is_current(self, input_path: Union[str, Path], parameters: Dict[str, Any]) -> bool:
+        """
+        Check if the output file was converted from the current input file with the given parameters and is intact.
+
+        :param input_path: path to the file that was converted
+        :param parameters: the conversion parameters
+        :return: whether the output file can be reused
+        """
+        try:
+            with open(self.path) as fh:
+                manifest = json.load(fh)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return False
+        if manifest.get("parameters") != json.loads(json.dumps(parameters)):
+            logger.info(f"Conversion parameters of {self.output_path} changed")
+            return False
+        if not _matches(Path(input_path), manifest.get("input", {})):
+            logger.info(f"{input_path} changed since it was converted to {self.output_path}")
+            return False
+        if not _matches(self.output_path, manifest.get("output", {})):
+            logger.warning(f"{self.output_path} is missing, partial or was modified after the conversion")
+            return False
+        return True
+
+    def write(self, input_path: Union[str, Path], parameters: Dict[str, Any]):
+        """
+        Record the conversion of input_path to the output file, replacing the manifest atomically.
+
+        :param input_path: path to the file that was converted
+        :param parameters: the conversion parameters
+        """
+        manifest = {
+            "input": {"path": str(Path(input_path).resolve()), **_describe(Path(input_path))},
+            "parameters": parameters,
+            "output": _describe(self.output_path),
+        }
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fh:
+            json.dump(manifest, fh, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def invalidate(self):
+        """Remove the manifest, marking the output file as not reusable."""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def lock(self, timeout: Optional[float] = LOCK_TIMEOUT, poll_interval: float = 1.0) -> "FileLock":
+        """
+        Get a lock serializing conversions to the output file across threads and processes.
+
+        :param timeout: maximum number of seconds to wait for the lock, None to wait indefinitely. Default: 2 hours
+        :param poll_interval: number of seconds between attempts to acquire the lock
+        :return: the lock, to be used as context manager
+        """
+        return FileLock(self.output_path.with_name(self.output_path.name + LOCK_SUFFIX), timeout, poll_interval)
+
+
+class FileLock:
+    """
+    Lock file created with O_CREAT | O_EXCL, which is atomic on local and network file systems.
+
+    The lock file contains the host name, process id and a random token of the owner. While the lock is held, a
+    background thread refreshes its modification time every stale_after / 5 seconds. A lock is stale if it was not
+    refreshed for stale_after seconds, which covers owners killed on other hosts and owners that died before writing
+    the lock file, or if its owner process no longer exists on this host. The age is measured against the clock of
+    this host, so stale_after has to exceed the clock skew between the hosts sharing the file system.
+
+    Stale locks are only removed while holding the second lock file <path>.break and after checking that the lock
+    file did not change in the meantime, so a waiter never removes a lock that another waiter has just created.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        timeout: Optional[float] = LOCK_TIMEOUT,
+        poll_interval: float = 1.0,
+        stale_after: float = STALE_AFTER,
+    ):
+        """
+        Initialize a FileLock object.
+
+        :param path: path to the lock file
+        :param timeout: maximum number of seconds to wait for the lock, None to wait indefinitely. Default: 2 hours
+        :param poll_interval: number of seconds between attempts to acquire the lock
+        :param stale_after: number of seconds after which a lock that was not refreshed is removed. Default: 5 minutes
+        """
+        self.path = Path(path)
+        self.break_path = self.path.with_name(self.path.name + BREAK_SUFFIX)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._owner: Optional[str] = None
+        self._stop_refresh = threading.Event()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    def acquire(self):
+        """
+        Wait until the lock file could be created.
+
+        :raises TimeoutError: if the lock could not be acquired within the timeout
+        """
+        start = time.monotonic()
+        owner = f"{socket.gethostname()} {os.getpid()} {uuid.uuid4().hex}"
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._remove_if_stale():
+                    continue
+                if self.timeout is not None and time.monotonic() - start > self.timeout:
+                    raise TimeoutError(f"Could not acquire {self.path} within {self.timeout} seconds") from None
+                time.sleep(self.poll_interval)
+                continue
+            with os.fdopen(fd, "w") as fh:
+                fh.write(owner)
+            self._owner = owner
+            self._stop_refresh = threading.Event()
+            self._refresh_thread = threading.Thread(
+                target=self._refresh, args=(self._stop_refresh,), name=f"refresh {self.path.name}", daemon=True
+            )
+            self._refresh_thread.start()
+            return
+
+    def release(self):
+        """Stop refreshing the lock and remove the lock file if it is still owned by this lock."""
+        if self._refresh_thread is not None:
+            self._stop_refresh.set()
+            self._refresh_thread.join()
+            self._refresh_thread = None
+        owner, self._owner = self._owner, None
+        if owner is None:
+            return
+        observed = self._observe()
+        if observed is None or observed[2] != owner:
+            logger.warning(f"{self.path} was removed by another process while it was held")
+            return
+        _unlink(self.path)
+
+    def __enter__(self) -> "FileLock":
+        """Acquire the lock."""
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        """Release the lock."""
+        self.release()
+
+    def _refresh(self, stop: threading.Event):
+        """
+        Update the modification time of the lock file until stop is set, showing that the owner is alive.
+
+        :param stop: event signalling that the lock is released
+        """
+        while not stop.wait(self.stale_after / 5):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                logger.warning(f"{self.path} was removed by another process while it was held")
+                return
+
+    def _remove_if_stale(self) -> bool:
+        """
+        Remove the lock file if it is stale.
+
+        :return: whether the lock file was removed or changed, i.e. whether acquiring should be retried immediately
+        """
+        observed = self._observe()
+        if observed is None:
+            return True  # released in the meantime
+        if not self._is_stale(observed):
+            return False
+        try:
+            os.close(os.open(self.break_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            self._remove_stale_break_lock()
+            return False
+        try:
+            # another waiter may have removed the lock and created a new one before we got the break lock
+            if self._observe() != observed:
+                return True
+            logger.warning(f"Removing stale lock {self.path}")
+            _unlink(self.path)
+            return True
+        finally:
+            _unlink(self.break_path)
+
+    def _remove_stale_break_lock(self):
+        """Remove the break lock if a waiter died while holding it, which it only does for a few milliseconds."""
+        try:
+            age = time.time() - self.break_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if age > self.stale_after:
+            logger.warning(f"Removing stale lock {self.break_path}")
+            _unlink(self.break_path)
+
+    def _observe(self) -> Optional[Tuple[int, int, str]]:
+        """
+        Get the identity of the current lock file.
+
+        :return: tuple of inode, modification time and content of the lock file, None if it does not exist
+        """
+        try:
+            stat = self.path.stat()
+            content = self.path.read_text()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, content
+
+    def _is_stale(self, observed: Tuple[int, int, str]) -> bool:
+        """
+        Check if a lock was not refreshed for stale_after seconds or is held by a process that no longer exists.
+
+        :param observed: tuple of inode, modification time and content of the lock file
+        :return: whether the lock can be removed
+        """
+        _, mtime_ns, content = observed
+        if time.time() - mtime_ns / 1e9 > self.stale_after:
+            return True
+        owner = content.split()
+        # signal 0 only checks for existence on posix, on windows it would terminate the process
+        if len(owner) < 2 or os.name != "posix" or owner[0] != socket.gethostname():
+            return False
+        try:
+            os.kill(int(owner[1]), 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, ValueError):
+            return False
+        return False
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _describe(path: Path) -> Dict[str, Any]:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _sha256(path)}
+
+
+def _matches(path: Path, description: Dict[str, Any]) -> bool:
+    """
+    Check if a file matches its description in a manifest.
+
+    :param path: the file to check
+    :param description: the recorded size, modification time and checksum
+    :return: whether the file is unchanged
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    if stat.st_size != description.get("size"):
+        return False
+    if stat.st_mtime_ns == description.get("mtime_ns"):
+        return True
+    return _sha256(path) == description.get("sha256")
+
+
+def _sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
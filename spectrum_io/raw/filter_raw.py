@@ -1,65 +1,411 @@
-from spectrum_io.raw.msraw import MSRaw
-import pandas as pd
+import hashlib
+import logging
+import re
+import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from spectrum_fundamentals.constants import MZML_DATA_COLUMNS
+
+from spectrum_io.file import hdf5, mgf
+from spectrum_io.raw import mzml_decoder
+from spectrum_io.raw.msraw import MSRaw, get_mass_analyzer, get_raw_file_name, parse_filter_string
+from spectrum_io.raw.scan_index import ScanIndex, open_mzml, read_spectrum
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = {"mzml": ".mzML", "hdf5": ".hdf5", "mgf": ".mgf"}
+
+_UNMATCHED_SUFFIX = "_unmatched_spectra"
+_MSMS_CHUNK_SIZE = 100000
+_SPECTRA_COLUMNS = MZML_DATA_COLUMNS + ["PRECURSOR_MZ", "PRECURSOR_CHARGE"]
+_CHUNK_SIZE = 1 << 20
+_SPECTRUM_LIST_COUNT_PATTERN = re.compile(rb'(<spectrumList\s[^>]*?\bcount=")\d+(")')
+_SPECTRUM_START_PATTERN = re.compile(rb'<spectrum\s[^>]*?\bid="([^"]*)"')
+_SPECTRUM_INDEX_ATTRIBUTE_PATTERN = re.compile(rb'^(<spectrum\s[^>]*?\bindex=")\d+')
+_CHROMATOGRAM_INDEX_PATTERN = re.compile(rb'<index\s+name="chromatogram"\s*>(.*?)</index>', re.DOTALL)
+_OFFSET_PATTERN = re.compile(rb'<offset\s+idRef="([^"]*)"[^>]*>\s*(\d+)\s*</offset>')
+
 
 class SpectraFilter:
-    def __init__(self, mzml_dir, msms_file):
+    """
+    Extract the spectra of mzml files that were not matched to a peptide in a MaxQuant search.
+
+    Spectra are identified by raw file and scan number. Each mzml file is filtered independently, optionally in a
+    pool of worker processes. The unmatched spectra are written as mzml, or streamed directly into an hdf5 ragged-array
+    container or an mgf file, so downstream tools do not have to parse xml again.
+    """
+
+    def __init__(
+        self, mzml_dir: Union[str, Path], msms_file: Union[str, Path], workers: int = 1, output_format: str = "mzml"
+    ):
+        """
+        Initialize a SpectraFilter object.
+
+        :param mzml_dir: directory containing the mzml files, optionally gzipped
+        :param msms_file: path to the msms.txt of the search
+        :param workers: number of processes used to filter multiple files concurrently. Default: 1
+        :param output_format: format of the output files, either "mzml", "hdf5" or "mgf". Default: "mzml"
+        :raises ValueError: if the output format is not supported
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {list(OUTPUT_FORMATS)}. Got {output_format}")
         self.mzml_dir = mzml_dir
         self.msms_file = msms_file
+        self.workers = workers
+        self.output_format = output_format
 
     def filter_spectra(self):
-        unmatched_spectra = self.get_unmatched_spectra()
-        self.process_mzml_directory(unmatched_spectra)
-
-    def get_unmatched_spectra(self):
-        """
-        get a list of spectra that didn't match to any peptide sequence
-        """
-        raw_df = MSRaw.read_mzml(self.mzml_dir)
-        msms_df = pd.read_csv(self.msms_file, sep='\t', index_col=False, header=0)
-        msms_df.rename(columns={'Scan number': 'SCAN_NUMBER'}, inplace=True)
-        merged_df = pd.merge(raw_df, msms_df, on='SCAN_NUMBER', how='inner')
-        unmatched_df = raw_df[~raw_df['SCAN_NUMBER'].isin(merged_df['SCAN_NUMBER'])]
-        unmatched_spectra = unmatched_df['SCAN_NUMBER'].tolist()
-        print(f'msms_file has: {len(msms_df)} scans')
-        print(f'number of matched spectra: {len(raw_df)} scans')
-        print(f'number of unmatched spectra: {len(unmatched_df)} scans')
+        """
+        Write a copy of every mzml file in mzml_dir that only contains its unmatched MS2 spectra.
+
+        The unmatched scans of each file are determined by the worker filtering it, so the files are only read in
+        parallel and never by the main process.
+        """
+        self._filter_files(matched_spectra=self.get_matched_spectra())
+
+    def get_matched_spectra(self) -> Dict[str, Set[int]]:
+        """
+        Read the matched scans from msms.txt.
+
+        Only the raw file and scan number columns are read, in chunks, so the memory usage does not depend on the
+        size of the search result.
+
+        :return: dictionary mapping raw file names to the set of matched scan numbers
+        """
+        matched_spectra = defaultdict(set)  # type: Dict[str, Set[int]]
+        chunks = pd.read_csv(
+            self.msms_file,
+            sep="\t",
+            usecols=lambda x: x.upper() in ["RAW FILE", "SCAN NUMBER"],
+            chunksize=_MSMS_CHUNK_SIZE,
+        )
+        for chunk in chunks:
+            chunk.columns = chunk.columns.str.upper().str.replace(" ", "_")
+            for raw_file, scan_numbers in chunk.groupby("RAW_FILE")["SCAN_NUMBER"]:
+                matched_spectra[raw_file].update(scan_numbers.astype(int))
+        logger.info(f"msms.txt contains {sum(map(len, matched_spectra.values()))} matched scans")
+        return dict(matched_spectra)
+
+    def get_unmatched_spectra(self) -> Dict[str, List[int]]:
+        """
+        Get the MS2 spectra of every mzml file in mzml_dir that were not matched to any peptide sequence.
+
+        :return: dictionary mapping raw file names to the sorted unmatched scan numbers
+        """
+        matched_spectra = self.get_matched_spectra()
+        unmatched_spectra = {}
+        for mzml_file in self._get_mzml_files():
+            raw_file = get_raw_file_name(mzml_file)
+            unmatched_spectra[raw_file] = _get_unmatched_scans(mzml_file, matched_spectra.get(raw_file, set()))
         return unmatched_spectra
 
-    def process_mzml_directory(self, unmatched_spectra):
+    def process_mzml_directory(self, unmatched_spectra: Union[Dict[str, Iterable[int]], Iterable[int]]):
         """
-        iterate over all mzml files in the given directory
+        Write a copy of every mzml file in mzml_dir that only contains the given spectra.
+
+        The copies are stored next to the input files as {raw file}_unmatched_spectra with the extension of the
+        output format.
+
+        :param unmatched_spectra: the scan numbers to keep, either a dictionary mapping raw file names to scan numbers
+            as returned by get_unmatched_spectra, or scan numbers kept in every file
         """
-        path = Path(self.mzml_dir)
-        mzml_files = path.glob("*.mzML")
+        if isinstance(unmatched_spectra, dict):
+            spectra_per_file = {raw_file: list(scan_numbers) for raw_file, scan_numbers in unmatched_spectra.items()}
+        else:
+            scan_numbers = list(unmatched_spectra)
+            spectra_per_file = {get_raw_file_name(mzml_file): scan_numbers for mzml_file in self._get_mzml_files()}
+        self._filter_files(unmatched_spectra=spectra_per_file)
+
+    def _filter_files(
+        self,
+        unmatched_spectra: Optional[Dict[str, List[int]]] = None,
+        matched_spectra: Optional[Dict[str, Set[int]]] = None,
+    ):
+        """
+        Filter every mzml file in mzml_dir, in a pool of worker processes if workers is larger than 1.
+
+        :param unmatched_spectra: dictionary mapping raw file names to the scan numbers to keep
+        :param matched_spectra: dictionary mapping raw file names to matched scan numbers, all other MS2 spectra are
+            kept. Only used if unmatched_spectra is None
+        :raises RuntimeError: if filtering one of the files failed, chained to the original exception
+        """
+        mzml_files = self._get_mzml_files()
+        tasks = []
         for mzml_file in mzml_files:
-            unmatched_file = mzml_file.with_name(f"{mzml_file.stem}_unmatched_spectra.mzML")
-            self.remove_spectra(mzml_file, unmatched_file, unmatched_spectra)
+            raw_file = get_raw_file_name(mzml_file)
+            unmatched_file = mzml_file.with_name(f"{raw_file}{_UNMATCHED_SUFFIX}{OUTPUT_FORMATS[self.output_format]}")
+            scans: Tuple[Optional[List[int]], Optional[Set[int]]]
+            if unmatched_spectra is not None:
+                scans = (unmatched_spectra.get(raw_file, []), None)
+            else:
+                scans = (None, (matched_spectra or {}).get(raw_file, set()))
+            tasks.append((mzml_file, unmatched_file, self.output_format, *scans))
+        if self.workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as executor:
+                futures = [executor.submit(_filter_file, *task) for task in tasks]
+                for mzml_file, future in zip(mzml_files, futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        for pending in futures:
+                            pending.cancel()
+                        raise RuntimeError(f"Failed to filter mzML file {mzml_file}: {e}") from e
+        else:
+            for task in tasks:
+                _filter_file(*task)
+
+    def _get_mzml_files(self) -> List[Path]:
+        """
+        Get the mzml files in mzml_dir, excluding the output of previous runs.
+
+        :return: list of mzml files
+        """
+        return [
+            mzml_file
+            for mzml_file in MSRaw.get_file_list(self.mzml_dir)
+            if not get_raw_file_name(mzml_file).endswith(_UNMATCHED_SUFFIX)
+        ]
 
     @staticmethod
-    def remove_spectra(mzml_file, unmatched_file, unmatched_spectra):
+    def remove_spectra(mzml_file: Union[str, Path], unmatched_file: Union[str, Path], unmatched_spectra: Iterable[int]):
+        """
+        Write a copy of an mzml file that only contains the given spectra.
+
+        The file is streamed spectrum by spectrum using the scan index, so memory usage does not depend on the file
+        size. The count of the spectrum list and the index attributes of the spectra are updated. If the input is an
+        indexedmzML file, the offset index and the SHA-1 checksum are regenerated, so the output can be opened by
+        indexed readers.
+
+        :param mzml_file: path to the mzml file, optionally gzipped
+        :param unmatched_file: path to the uncompressed output file
+        :param unmatched_spectra: scan numbers of the spectra to keep
+        :raises ValueError: if a spectrum found by the scan index does not start with a spectrum tag with an id
+        """
+        index = ScanIndex.for_file(mzml_file)
+        keep = np.isin(index.scan_numbers, np.fromiter(set(unmatched_spectra), dtype=np.int64))
+        order = np.argsort(index.offsets)
+        offsets = index.offsets[order]
+        keep = keep[order]
+
+        with open_mzml(mzml_file) as fh, open(unmatched_file, "wb") as out_file:
+            out = _ChecksumWriter(out_file)
+            if len(offsets) == 0:  # nothing to filter
+                shutil.copyfileobj(fh, out_file)
+                return
+            header = fh.read(offsets[0])
+            out.write(_SPECTRUM_LIST_COUNT_PATTERN.sub(rb"\g<1>%d\g<2>" % keep.sum(), header, count=1))
+
+            # locate the end of the last spectrum, everything after it is copied as trailer
+            fh.seek(offsets[-1])
+            trailer_start = offsets[-1] + len(read_spectrum(fh))
+            ends = np.append(offsets[1:], trailer_start)
+
+            new_offsets = []
+            for i, (offset, end) in enumerate(zip(offsets[keep], ends[keep])):
+                fh.seek(offset)
+                spectrum = fh.read(end - offset)
+                match = _SPECTRUM_START_PATTERN.match(spectrum)
+                if match is None:
+                    raise ValueError(f"No spectrum with an id attribute found at byte {offset} of {mzml_file}.")
+                new_offsets.append((match.group(1), out.tell()))
+                out.write(_SPECTRUM_INDEX_ATTRIBUTE_PATTERN.sub(rb"\g<1>%d" % i, spectrum, count=1))
+
+            # the trailer contains the end of the run and optionally the outdated index list, which is replaced
+            fh.seek(trailer_start)
+            copied, index_list = _copy_until(fh, out, b"<indexList")
+            if index_list is not None:
+                shift = out.tell() - (trailer_start + copied)
+                chromatogram_offsets = [
+                    (id_ref, offset + shift) for id_ref, offset in _get_chromatogram_offsets(index_list)
+                ]
+                _write_index_list(out, new_offsets, chromatogram_offsets)
+
+
+def _get_unmatched_scans(mzml_file: Path, matched_scans: Set[int]) -> List[int]:
     """
-    take mzml file and return a new file with the unmatched spectra
+    Get the MS2 scans of an mzml file that are not in matched_scans, reading only the scan metadata.
+
+    :param mzml_file: path to the mzml file
+    :param matched_scans: scan numbers matched to a peptide
+    :return: sorted list of unmatched scan numbers
     """
-        with open(mzml_file, 'r') as file:
-            lines = file.readlines()
+    scan_numbers = MSRaw.read_mzml(mzml_file, package="fast", decode_arrays=False)["SCAN_NUMBER"]
+    unmatched_scans = sorted(set(scan_numbers.astype(int)) - matched_scans)
+    logger.info(
+        f"{mzml_file.name}: {len(scan_numbers)} MS2 scans, {len(scan_numbers) - len(unmatched_scans)} matched, "
+        f"{len(unmatched_scans)} unmatched"
+    )
+    return unmatched_scans
 
-        output_lines = []
-        skip_next_lines = False
 
-        for line in lines:
-            if skip_next_lines:
-                if line.strip() == '</spectrum>':
-                    skip_next_lines = False
-                continue
+def _filter_file(
+    mzml_file: Path,
+    unmatched_file: Path,
+    output_format: str = "mzml",
+    unmatched_scans: Optional[List[int]] = None,
+    matched_scans: Optional[Set[int]] = None,
+):
+    """
+    Write the given or the unmatched MS2 spectra of a single mzml file, used as the unit of work of the process pool.
 
-            if '<spectrum id=' in line:
-                scan_number = int(line.split('scan=')[1].split()[0].strip('"'))
-                if scan_number not in unmatched_spectra:
-                    skip_next_lines = True
-                    continue
+    :param mzml_file: path to the mzml file
+    :param unmatched_file: path to the output file
+    :param output_format: format of the output file, either "mzml", "hdf5" or "mgf"
+    :param unmatched_scans: scan numbers of the spectra to write. Default: None, meaning all MS2 spectra that are
+        not in matched_scans
+    :param matched_scans: scan numbers matched to a peptide, only used if unmatched_scans is None
+    """
+    if unmatched_scans is None:
+        unmatched_scans = _get_unmatched_scans(mzml_file, matched_scans or set())
+    if output_format == "mzml":
+        SpectraFilter.remove_spectra(mzml_file, unmatched_file, unmatched_scans)
+    elif output_format == "hdf5":
+        hdf5.write_spectra(iter_spectra(mzml_file, unmatched_scans), unmatched_file)
+    else:
+        mgf.write_file(iter_spectra(mzml_file, unmatched_scans), unmatched_file)
 
-            output_lines.append(line)
 
-        with open(unmatched_file, 'w') as file:
-            file.writelines(output_lines)
+def iter_spectra(
+    mzml_file: Union[str, Path], scan_numbers: Iterable[int], batch_size: int = 10000
+) -> Iterator[pd.DataFrame]:
+    """
+    Read the given MS2 spectra of an mzml file including their precursor m/z and charge.
+
+    :param mzml_file: path to the mzml file, optionally gzipped
+    :param scan_numbers: the scan numbers to read
+    :param batch_size: maximum number of spectra per yielded dataframe
+    :yield: dataframes with the columns in MZML_DATA_COLUMNS, PRECURSOR_MZ and PRECURSOR_CHARGE
+    """
+    raw_file = get_raw_file_name(mzml_file)
+    mass_analyzer = get_mass_analyzer(mzml_file)
+    records = []
+    for spectrum in mzml_decoder.iter_spectra(mzml_file, list(scan_numbers), min_ms_level=2):
+        fragmentation, mz_range = parse_filter_string(spectrum.filter_string)
+        records.append(
+            [
+                raw_file,
+                spectrum.scan_number,
+                spectrum.intensity,
+                spectrum.mz,
+                mz_range,
+                spectrum.retention_time,
+                mass_analyzer,
+                fragmentation,
+                spectrum.precursor_mz,
+                spectrum.precursor_charge,
+            ]
+        )
+        if len(records) == batch_size:
+            yield pd.DataFrame(records, columns=_SPECTRA_COLUMNS)
+            records = []
+    if records:
+        yield pd.DataFrame(records, columns=_SPECTRA_COLUMNS)
+
+
+class _ChecksumWriter:
+    """Binary file writer that keeps track of the position and the SHA-1 checksum of the written bytes."""
+
+    def __init__(self, file: IO[bytes]):
+        """
+        Initialize a _ChecksumWriter object.
+
+        :param file: the binary file object to write to
+        """
+        self.file = file
+        self.sha1 = hashlib.sha1()  # noqa: S324 checksum required by the indexedmzML format
+        self.position = 0
+
+    def write(self, data: bytes):
+        """
+        Write bytes to the file and add them to the checksum.
+
+        :param data: the bytes to write
+        """
+        self.file.write(data)
+        self.sha1.update(data)
+        self.position += len(data)
+
+    def tell(self) -> int:
+        """
+        Get the number of bytes written so far, which is the byte offset of the next write.
+
+        :return: the current position in the file
+        """
+        return self.position
+
+
+def _copy_until(fh: IO[bytes], out: _ChecksumWriter, marker: bytes) -> Tuple[int, Optional[bytes]]:
+    """
+    Copy a file to the writer up to the first occurrence of marker.
+
+    :param fh: binary file object to copy from
+    :param out: the writer to copy to
+    :param marker: the bytes to stop at
+    :return: the number of copied bytes and the remainder of the file starting with marker, or None if the marker was
+        not found and the whole file was copied
+    """
+    copied = 0
+    buffer = b""
+    while True:
+        chunk = fh.read(_CHUNK_SIZE)
+        buffer += chunk
+        pos = buffer.find(marker)
+        if pos >= 0:
+            out.write(buffer[:pos])
+            return copied + pos, buffer[pos:] + fh.read()
+        if not chunk:
+            out.write(buffer)
+            return copied + len(buffer), None
+        # keep the end of the buffer in case the marker is split between two chunks
+        split = max(len(buffer) - len(marker) + 1, 0)
+        out.write(buffer[:split])
+        copied += split
+        buffer = buffer[split:]
+
+
+def _get_chromatogram_offsets(index_list: bytes) -> List[Tuple[bytes, int]]:
+    """
+    Get the chromatogram offsets of the index list of an indexed mzml file.
+
+    :param index_list: the end of the original file, starting with the index list
+    :return: the id and byte offset of each chromatogram in the original file, empty if the index list has no
+        chromatogram index
+    """
+    match = _CHROMATOGRAM_INDEX_PATTERN.search(index_list)
+    if match is None:
+        return []
+    return [(id_ref, int(offset)) for id_ref, offset in _OFFSET_PATTERN.findall(match.group(1))]
+
+
+def _write_index_list(
+    out: _ChecksumWriter, spectrum_offsets: List[Tuple[bytes, int]], chromatogram_offsets: List[Tuple[bytes, int]]
+):
+    """
+    Write the index list, the index list offset and the file checksum that complete an indexed mzml file.
+
+    The checksum covers all bytes up to and including the opening fileChecksum tag, so it is computed before writing
+    the checksum itself directly to the file.
+
+    :param out: the writer that wrote the filtered file so far
+    :param spectrum_offsets: the id and byte offset of each written spectrum
+    :param chromatogram_offsets: the id and byte offset of each chromatogram, omitted from the index list if empty
+    """
+    index_list_offset = out.tell()
+    indices = [(b"spectrum", spectrum_offsets)]
+    if chromatogram_offsets:
+        indices.append((b"chromatogram", chromatogram_offsets))
+    lines = [b'<indexList count="%d">' % len(indices)]
+    for name, offsets in indices:
+        lines.append(b'    <index name="%s">' % name)
+        lines.extend(b'      <offset idRef="%s">%d</offset>' % (id_ref, offset) for id_ref, offset in offsets)
+        lines.append(b"    </index>")
+    lines.append(b"  </indexList>")
+    lines.append(b"  <indexListOffset>%d</indexListOffset>" % index_list_offset)
+    lines.append(b"  <fileChecksum>")
+    out.write(b"\n".join(lines))
+    out.file.write(out.sha1.hexdigest().encode() + b"</fileChecksum>\n</indexedmzML>\n")
@@ -1,38 +1,78 @@
+import io
 import logging
 import warnings
 from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from xml.etree import ElementTree
 
+import numpy as np
 import pandas as pd
 import pymzml
 from pyteomics import mzml
 from spectrum_fundamentals.constants import MZML_DATA_COLUMNS
 
+from spectrum_io.file import mgf
+
+from . import mzml_decoder
+from .peak_filter import PeakFilter
+from .scan_index import ScanIndex, is_gzipped, open_mzml
+from .spectra_cache import SpectraCache
+
 logger = logging.getLogger(__name__)
 
+# pyteomics reads the header of a file before rewinding to the first spectrum
+_PYTEOMICS_HEAD_SIZE = 1 << 22
 
-def get_mass_analyzer(file_path: Path) -> str:
+
+def get_raw_file_name(file_path: Union[str, Path]) -> str:
+    """
+    Get the name of the raw file an mzml file was converted from.
+
+    :param file_path: path to the mzml file, optionally gzipped
+    :return: the file name without the .mzML or .mzML.gz extension
+    """
+    file_path = Path(file_path)
+    if is_gzipped(file_path):
+        file_path = file_path.with_suffix("")
+    return file_path.stem
+
+
+def get_mass_analyzer(file_path: Union[str, Path]) -> str:
     """
     Retrieve mass analyzer information from mzml file.
 
     This is using the description of the mzml format to check for specific accessions in the mzml file
     that are not covered by pyteomics or pymzml. The documentation can be found here:
     https://raw.githubusercontent.com/HUPO-PSI/psi-ms-CV/master/psi-ms.obo
+    Only the file header is parsed, stopping as soon as the instrument configuration has been read. Results are cached
+    per file path, modification time and size, so repeated calls for an unchanged file do not touch the file again.
+
+    :param file_path: The path to the mzml file to parse, optionally gzipped
+    :return: A string that is either FTMS or ITMS to represent the respective mass analyzer category.
+    """
+    file_path = Path(file_path)
+    stat = file_path.stat()
+    return _get_mass_analyzer(str(file_path.resolve()), stat.st_mtime_ns, stat.st_size)
+
 
-    :param file_path: The path to the mzml file to parse
+@lru_cache(maxsize=1024)
+def _get_mass_analyzer(file_path: str, mtime: int, size: int) -> str:
+    """
+    Retrieve mass analyzer information from the header of an mzml file.
+
+    mtime and size are not used directly but are part of the cache key, so that a changed file is parsed again.
+
+    :param file_path: The resolved path to the mzml file to parse
+    :param mtime: modification time of the file in nanoseconds
+    :param size: size of the file in bytes
     :raises AssertionError: if the mass analyzer metadata cannot be found in the file or the search
         was conducted with an unsupported mass analyzer.
     :return: A string that is either FTMS or ITMS to represent the respective mass analyzer category.
     """
-    tree = ElementTree.parse(file_path)
-    root = tree.getroot()
-    namespace = {"ns0": "http://psi.hupo.org/ms/mzml"}
-    analyzer = root.find(
-        ".//ns0:instrumentConfigurationList/ns0:instrumentConfiguration/ns0:componentList/ns0:analyzer/ns0:cvParam",
-        namespace,
-    )
+    analyzer = _find_analyzer_cv_param(file_path)
     if analyzer is None:
         raise AssertionError("The mass analyzer information can not be retrieved from the mzml file!")
 
@@ -49,6 +89,47 @@ def get_mass_analyzer(file_path: Path) -> str:
     return mass_analyzer
 
 
+def _find_analyzer_cv_param(file_path: Union[str, Path]) -> Optional[ElementTree.Element]:
+    """
+    Incrementally parse an mzml file until the first analyzer cvParam of the instrument configuration is found.
+
+    :param file_path: The path to the mzml file to parse, optionally gzipped
+    :return: the cvParam element of the analyzer or None if the instrument configuration does not contain one
+    """
+    in_analyzer = False
+    with open_mzml(file_path) as fh:
+        for event, elem in ElementTree.iterparse(fh, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                if tag == "analyzer":
+                    in_analyzer = True
+                elif tag == "run":  # the instrument configuration always precedes the run
+                    break
+            elif tag == "cvParam" and in_analyzer:
+                return elem
+            elif tag in ["analyzer", "instrumentConfigurationList"]:
+                in_analyzer = False
+                if tag == "instrumentConfigurationList":
+                    break
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_filter_string(filter_string: str) -> Tuple[str, str]:
+    """
+    Extract fragmentation method and m/z range from a thermo filter string.
+
+    The number of distinct filter strings in a run is small, so results are memoized.
+
+    :param filter_string: the filter string of a MS2 scan,
+        e.g. "FTMS + c NSI d Full ms2 500.00@hcd28.00 [100.00-1010.00]"
+    :return: tuple of the fragmentation method in upper case, e.g. "HCD", and the m/z range, e.g. "100.00-1010.00"
+    """
+    fragmentation = filter_string.split("@")[1][:3].upper()
+    mz_range = filter_string.split("[")[1][:-1]
+    return fragmentation, mz_range
+
+
 class MSRaw:
     """Main to read mzml file and generate dataframe containing intensities and m/z values."""
 
@@ -74,6 +155,10 @@ class MSRaw:
         search_type: str = "Maxquant",
         scanidx: Optional[List] = None,
         *args,
+        workers: int = 1,
+        cache: Optional[SpectraCache] = None,
+        decode_arrays: bool = True,
+        peak_filter: Optional[PeakFilter] = None,
         **kwargs,
     ) -> pd.DataFrame:
         """
@@ -81,52 +166,515 @@ class MSRaw:
 
         :param source: a directory containing mzml files, a list of files or a single file
         :param ext: file extension for searching a specified directory
-        :param package: package for parsing the mzml file. Can eiter be "pymzml" or "pyteomics"
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
         :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
         :param search_type: type of the search (Maxquant, Mascot, Msfragger)
+        :param workers: number of processes used to parse multiple files concurrently. The result is identical to
+            reading the files one after another in the order given by ``get_file_list``. Default: 1
+        :param cache: optional cache of parsed spectra. Files that were read with the same options before and did not
+            change since are loaded from the cache instead of being parsed again. Default: None
+        :param decode_arrays: whether to decode the intensity and m/z arrays. If False, only the metadata columns are
+            returned and the binary data is neither decoded nor allocated, which makes listing the scans of a file
+            considerably faster. Default: True
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum while parsing, e.g. to keep
+            only the top-N peaks or to convert the arrays to float32. Default: None
         :param args: additional positional arguments
         :param kwargs: additional keyword arguments
-        :raises AssertionError: if package has an unexpected type
-        :return: pd.DataFrame with intensities and m/z values
+        :return: pd.DataFrame with intensities and m/z values, or only the metadata if decode_arrays is False
         """
         file_list = MSRaw.get_file_list(source, ext)
-        data = {}  # type: Dict[str, Any]
-        if package == "pymzml":
-            with warnings.catch_warnings():
-                warnings.filterwarnings("ignore", category=ImportWarning)
-                for file_path in file_list:
-                    logger.info(f"Reading mzML file: {file_path}")
-                    MSRaw._get_scans_pymzml(file_path, data, scanidx, *args, **kwargs)
-        elif package == "pyteomics":
-            for file_path in file_list:
-                mass_analyzer = get_mass_analyzer(file_path)
-                logger.info(f"Reading mzML file: {file_path}")
-                data_iter = mzml.read(source=str(file_path), *args, **kwargs)
-                file_name = file_path.stem
-                for spec in data_iter:
-                    if spec["ms level"] != 1:  # filter out ms1 spectra if there are any
-                        spec_id = spec["id"].split("scan=")[-1]
-                        fragmentation = spec["scanList"]["scan"][0]["filter string"].split("@")[1][:3].upper()
-                        mz_range = spec["scanList"]["scan"][0]["filter string"].split("[")[1][:-1]
-                        rt = spec["scanList"]["scan"][0]["scan start time"]
-                        key = f"{file_name}_{spec_id}"
-                        data[key] = [
-                            file_name,
-                            spec_id,
-                            spec["intensity array"],
-                            spec["m/z array"],
-                            mz_range,
-                            rt,
-                            mass_analyzer,
-                            fragmentation,
-                        ]
-                data_iter.close()
+        MSRaw._get_scan_reader(package)
+        if workers > 1 and len(file_list) > 1:
+            return MSRaw._read_files_parallel(
+                file_list,
+                package,
+                [scanidx] * len(file_list),
+                workers,
+                cache,
+                decode_arrays,
+                peak_filter,
+                *args,
+                **kwargs,
+            )
+        results = [
+            MSRaw._read_file(file_path, package, scanidx, cache, decode_arrays, peak_filter, *args, **kwargs)
+            for file_path in file_list
+        ]
+        return MSRaw._concat(results, decode_arrays)
+
+    @staticmethod
+    def read_psm_spectra(
+        psms: pd.DataFrame,
+        source: Union[str, Path, List[Union[str, Path]]],
+        ext: str = "mzml",
+        package: str = "pyteomics",
+        *args,
+        workers: int = 1,
+        cache: Optional[SpectraCache] = None,
+        peak_filter: Optional[PeakFilter] = None,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Reads the spectra of the given PSMs and returns the PSMs annotated with their spectra.
+
+        Only the scans referenced by the PSMs are read from each file using the scan index, instead of parsing all
+        spectra and merging afterwards. Files are processed in parallel if workers is larger than 1. PSMs of raw files
+        without mzml file or of scans that are not in the mzml file are skipped with a warning. Columns of psms take
+        precedence over the spectrum columns of the same name, e.g. a RETENTION_TIME column of the search results.
+
+        :param psms: search results, e.g. returned by MaxQuant.read_result, with the columns RAW_FILE and SCAN_NUMBER
+        :param source: a directory containing mzml files, a list of files or a single file. Files are matched to the
+            RAW_FILE column by their name without the .mzML or .mzML.gz extension
+        :param ext: file extension for searching a specified directory
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
+        :param workers: number of processes used to read multiple files concurrently. Default: 1
+        :param cache: optional cache of parsed spectra. Default: None
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum while parsing. Default: None
+        :param args: additional positional arguments
+        :param kwargs: additional keyword arguments
+        :raises ValueError: if psms lacks the RAW_FILE or SCAN_NUMBER column
+        :return: pd.DataFrame with the columns of psms and the spectra columns for every PSM whose spectrum was found,
+            in the order of psms
+        """
+        missing_columns = {"RAW_FILE", "SCAN_NUMBER"} - set(psms.columns)
+        if missing_columns:
+            raise ValueError(f"psms is missing the columns {sorted(missing_columns)}.")
+        MSRaw._get_scan_reader(package)
+        files = {get_raw_file_name(file_path): file_path for file_path in MSRaw.get_file_list(source, ext)}
+        file_list = []
+        scanidx_list: List[Optional[List]] = []
+        for raw_file, scan_numbers in psms.groupby("RAW_FILE", sort=True)["SCAN_NUMBER"]:
+            if raw_file not in files:
+                logger.warning(f"No mzML file found for raw file {raw_file}, skipping its PSMs")
+                continue
+            file_list.append(files[raw_file])
+            scanidx_list.append(MSRaw._find_scans(files[raw_file], scan_numbers.astype(int)))
+
+        if workers > 1 and len(file_list) > 1:
+            spectra = MSRaw._read_files_parallel(
+                file_list, package, scanidx_list, workers, cache, True, peak_filter, *args, **kwargs
+            )
         else:
-            raise AssertionError("Choose either 'pymzml' or 'pyteomics'")
+            spectra = MSRaw._concat(
+                [
+                    MSRaw._read_file(file_path, package, scanidx, cache, True, peak_filter, *args, **kwargs)
+                    for file_path, scanidx in zip(file_list, scanidx_list)
+                ]
+            )
+        spectra = spectra.astype({"SCAN_NUMBER": psms["SCAN_NUMBER"].dtype})
+        overlapping_columns = (set(psms.columns) & set(spectra.columns)) - {"RAW_FILE", "SCAN_NUMBER"}
+        if overlapping_columns:
+            logger.info(f"Keeping the columns {sorted(overlapping_columns)} of psms instead of the spectrum columns")
+            spectra = spectra.drop(columns=sorted(overlapping_columns))
+        return psms.merge(spectra, on=["RAW_FILE", "SCAN_NUMBER"], how="inner")
+
+    @staticmethod
+    def _find_scans(file_path: Path, scan_numbers: pd.Series) -> List[int]:
+        """
+        Get the scan numbers of PSMs that exist in an mzml file, logging a warning for PSMs without spectrum.
+
+        :param file_path: path to the mzml file
+        :param scan_numbers: the scan numbers of the PSMs of the file
+        :return: the sorted unique scan numbers found in the file
+        """
+        found = scan_numbers.isin(ScanIndex.for_file(file_path).scan_numbers)
+        if not found.all():
+            logger.warning(
+                f"{(~found).sum()} PSMs reference scans that are not in {file_path}, e.g. scan "
+                f"{scan_numbers[~found].iloc[0]}, skipping them"
+            )
+        return sorted(pd.unique(scan_numbers[found]))
+
+    @staticmethod
+    def sample_mzml(
+        source: Union[str, Path, List[Union[str, Path]]],
+        n: int,
+        ext: str = "mzml",
+        package: str = "pyteomics",
+        stratified: bool = True,
+        seed: Optional[int] = None,
+        decode_arrays: bool = True,
+        peak_filter: Optional[PeakFilter] = None,
+        *args,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Reads a random sample of n MS2 spectra per mzml file, e.g. for collision energy calibration.
+
+        The scans are drawn from the scan index and only the drawn spectra are read by seeking to them, so the cost
+        depends on n rather than on the length of the run. MS1 scans among the drawn scans are replaced by drawing
+        again from the remaining scans until n MS2 spectra are found or the file is exhausted.
+
+        :param source: a directory containing mzml files, a list of files or a single file
+        :param n: number of MS2 spectra to read per file
+        :param ext: file extension for searching a specified directory
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
+        :param stratified: whether to spread the sample evenly over the retention time instead of drawing uniformly.
+            Default: True
+        :param seed: seed of the random selection, the same seed always returns the same spectra. Default: None
+        :param decode_arrays: whether to decode the intensity and m/z arrays. Default: True
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum while parsing. Default: None
+        :param args: additional positional arguments
+        :param kwargs: additional keyword arguments
+        :raises ValueError: if n is not a positive integer
+        :return: pd.DataFrame with intensities and m/z values of the sampled spectra, sorted by scan number per file
+        """
+        if n < 1:
+            raise ValueError(f"n must be a positive integer. Got {n}")
+        file_list = MSRaw.get_file_list(source, ext)
+        MSRaw._get_scan_reader(package)
+        rng = np.random.default_rng(seed)
+        results = []
+        for file_path in file_list:
+            index = ScanIndex.for_file(file_path)
+            drawn = np.empty(0, dtype=np.int64)
+            file_results = []  # type: List[pd.DataFrame]
+            found = 0
+            while found < n and len(drawn) < len(index):
+                scans = index.sample(n - found, stratified, rng, exclude=drawn)
+                drawn = np.concatenate([drawn, scans])
+                df = MSRaw._read_file(
+                    file_path, package, scans.tolist(), None, decode_arrays, peak_filter, *args, **kwargs
+                )
+                file_results.append(df)
+                found += len(df)
+            if len(file_results) > 1:
+                results.append(pd.concat(file_results).sort_values("SCAN_NUMBER", kind="stable"))
+            else:
+                results.extend(file_results)
+        return MSRaw._concat(results, decode_arrays)
+
+    @staticmethod
+    def read_mgf(
+        source: Union[str, Path, List[Union[str, Path]]],
+        ext: str = "mgf",
+        scanidx: Optional[List] = None,
+        mass_analyzer: Optional[str] = None,
+        fragmentation: Optional[str] = None,
+        mz_range: Optional[str] = None,
+        peak_filter: Optional[PeakFilter] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads mgf files, e.g. written by ThermoRawFileParser, and generates a dataframe in the layout of read_mzml.
+
+        mgf files contain neither the filter strings nor the instrument configuration, so the mass analyzer,
+        fragmentation method and m/z range cannot be determined from the file and are set to the given values.
+
+        :param source: a directory containing mgf files, a list of files or a single file
+        :param ext: file extension for searching a specified directory
+        :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param mass_analyzer: mass analyzer of all spectra, e.g. "FTMS". Default: None
+        :param fragmentation: fragmentation method of all spectra, e.g. "HCD". Default: None
+        :param mz_range: scan range of all spectra, e.g. "100.00-1010.00". Default: None
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum. Default: None
+        :return: pd.DataFrame with intensities and m/z values
+        """
+        results = []
+        for file_path in MSRaw.get_file_list(source, ext):
+            logger.info(f"Reading mgf file: {file_path}")
+            df = mgf.read_file(file_path)
+            if scanidx is not None:
+                df = df[df["SCAN_NUMBER"].isin(scanidx)]
+            scans = MSRaw._iter_converted_scans(
+                get_raw_file_name(file_path),
+                df["SCAN_NUMBER"],
+                df["INTENSITIES"],
+                df["MZ"],
+                df["RETENTION_TIME"],
+                (mass_analyzer, fragmentation, mz_range),
+            )
+            results.append(MSRaw._to_dataframe(dict(MSRaw._filter_peaks(scans, peak_filter))))
+        return MSRaw._concat(results)
+
+    @staticmethod
+    def read_parquet(
+        source: Union[str, Path, List[Union[str, Path]]],
+        ext: str = "parquet",
+        scanidx: Optional[List] = None,
+        mass_analyzer: Optional[str] = None,
+        fragmentation: Optional[str] = None,
+        mz_range: Optional[str] = None,
+        peak_filter: Optional[PeakFilter] = None,
+    ) -> pd.DataFrame:
+        """
+        Reads parquet files written by ThermoRawFileParser and generates a dataframe in the layout of read_mzml.
+
+        The parser writes one row per peak with the columns scan, level, rt, mz and intensity, among others. Only
+        these columns are loaded and the peaks are grouped into spectra with vectorized operations, which is much
+        faster than parsing the same spectra from an mzml file. Like mgf files, the parquet output does not contain
+        filter strings, so the mass analyzer, fragmentation method and m/z range are set to the given values.
+        Requires pyarrow or fastparquet.
+
+        :param source: a directory containing parquet files, a list of files or a single file
+        :param ext: file extension for searching a specified directory
+        :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param mass_analyzer: mass analyzer of all spectra, e.g. "FTMS". Default: None
+        :param fragmentation: fragmentation method of all spectra, e.g. "HCD". Default: None
+        :param mz_range: scan range of all spectra, e.g. "100.00-1010.00". Default: None
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum. Default: None
+        :return: pd.DataFrame with intensities and m/z values
+        """
+        results = []
+        for file_path in MSRaw.get_file_list(source, ext):
+            logger.info(f"Reading parquet file: {file_path}")
+            peaks = pd.read_parquet(file_path, columns=["scan", "level", "rt", "mz", "intensity"])
+            mask = peaks["level"].to_numpy() >= 2
+            if scanidx is not None:
+                mask &= peaks["scan"].isin(scanidx).to_numpy()
+            order = np.argsort(peaks["scan"].to_numpy()[mask], kind="stable")
+            scan_column = peaks["scan"].to_numpy()[mask][order]
+            scan_numbers, starts = np.unique(scan_column, return_index=True)
+            if len(scan_numbers) == 0:
+                intensities, mzs = [], []
+            else:
+                intensities = np.split(peaks["intensity"].to_numpy(dtype=float)[mask][order], starts[1:])
+                mzs = np.split(peaks["mz"].to_numpy(dtype=float)[mask][order], starts[1:])
+            scans = MSRaw._iter_converted_scans(
+                get_raw_file_name(file_path),
+                scan_numbers.tolist(),
+                intensities,
+                mzs,
+                peaks["rt"].to_numpy(dtype=float)[mask][order][starts],
+                (mass_analyzer, fragmentation, mz_range),
+            )
+            results.append(MSRaw._to_dataframe(dict(MSRaw._filter_peaks(scans, peak_filter))))
+        return MSRaw._concat(results)
+
+    @staticmethod
+    def _iter_converted_scans(
+        file_name: str,
+        scan_numbers: Iterable[int],
+        intensities: Iterable[np.ndarray],
+        mzs: Iterable[np.ndarray],
+        retention_times: Iterable[float],
+        metadata: Tuple[Optional[str], Optional[str], Optional[str]],
+    ) -> Iterator[Tuple[str, List[Any]]]:
+        """
+        Yield records in the order of MZML_DATA_COLUMNS for spectra read from formats without filter strings.
+
+        :param file_name: name of the raw file
+        :param scan_numbers: scan number of each spectrum
+        :param intensities: intensity array of each spectrum
+        :param mzs: m/z array of each spectrum
+        :param retention_times: retention time of each spectrum in minutes
+        :param metadata: tuple of mass analyzer, fragmentation method and m/z range used for all spectra
+        :yield: tuples of a unique key and the spectrum record in the order of MZML_DATA_COLUMNS
+        """
+        mass_analyzer, fragmentation, mz_range = metadata
+        for scan_number, intensity, mz, retention_time in zip(scan_numbers, intensities, mzs, retention_times):
+            yield f"{file_name}_{scan_number}", [
+                file_name,
+                scan_number,
+                intensity,
+                mz,
+                mz_range,
+                retention_time,
+                mass_analyzer,
+                fragmentation,
+            ]
+
+    @staticmethod
+    def _read_files_parallel(
+        file_list: List[Path],
+        package: str,
+        scanidx_list: List[Optional[List]],
+        workers: int,
+        cache: Optional[SpectraCache] = None,
+        decode_arrays: bool = True,
+        peak_filter: Optional[PeakFilter] = None,
+        *args,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Reads several mzml files in a process pool and concatenates the results in the order of file_list.
+
+        :param file_list: list of mzml files to read
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
+        :param scanidx_list: the scan numbers to extract for each file in file_list, None to extract all scans
+        :param workers: maximum number of worker processes
+        :param cache: optional cache of parsed spectra
+        :param decode_arrays: whether to decode the intensity and m/z arrays
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum
+        :param args: additional positional arguments
+        :param kwargs: additional keyword arguments
+        :raises RuntimeError: if reading one of the files failed, chained to the original exception
+        :return: pd.DataFrame with intensities and m/z values
+        """
+        with ProcessPoolExecutor(max_workers=min(workers, len(file_list))) as executor:
+            futures = [
+                executor.submit(
+                    MSRaw._read_file, file_path, package, scanidx, cache, decode_arrays, peak_filter, *args, **kwargs
+                )
+                for file_path, scanidx in zip(file_list, scanidx_list)
+            ]
+            results = []
+            for file_path, future in zip(file_list, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    for pending in futures:
+                        pending.cancel()
+                    raise RuntimeError(f"Failed to read mzML file {file_path}: {e}") from e
+        return MSRaw._concat(results, decode_arrays)
+
+    @staticmethod
+    def _read_file(
+        file_path: Path,
+        package: str,
+        scanidx: Optional[List] = None,
+        cache: Optional[SpectraCache] = None,
+        decode_arrays: bool = True,
+        peak_filter: Optional[PeakFilter] = None,
+        *args,
+        **kwargs,
+    ) -> pd.DataFrame:
+        """
+        Reads a single mzml file, used as the unit of work of the process pool.
+
+        :param file_path: path to a single mzml file
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
+        :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param cache: optional cache of parsed spectra, not used for metadata-only reads
+        :param decode_arrays: whether to decode the intensity and m/z arrays
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum
+        :param args: additional positional arguments
+        :param kwargs: additional keyword arguments
+        :return: pd.DataFrame with intensities and m/z values
+        """
+        options = {
+            "package": package,
+            "scanidx": None if scanidx is None else sorted(scanidx),
+            "peak_filter": repr(peak_filter),
+            "args": args,
+            "kwargs": kwargs,
+        }
+        if not decode_arrays:
+            cache = None
+        if cache is not None:
+            df = cache.get(file_path, options)
+            if df is not None:
+                return df
+        logger.info(f"Reading mzML file: {file_path}")
+        scan_reader = MSRaw._get_scan_reader(package)
+        scans = scan_reader(file_path, scanidx, decode_arrays, *args, **kwargs)
+        df = MSRaw._to_dataframe(dict(MSRaw._filter_peaks(scans, peak_filter)), decode_arrays)
+        if cache is not None:
+            cache.put(file_path, options, df)
+        return df
+
+    @staticmethod
+    def _concat(results: List[pd.DataFrame], decode_arrays: bool = True) -> pd.DataFrame:
+        """
+        Concatenate the dataframes of several files.
+
+        :param results: list of dataframes returned by ``_read_file``
+        :param decode_arrays: whether the dataframes contain the intensity and m/z arrays
+        :return: pd.DataFrame with intensities and m/z values of all files
+        """
+        if len(results) == 1:
+            return results[0]
+        if len(results) == 0:
+            return MSRaw._to_dataframe({}, decode_arrays)
+        return pd.concat(results)
+
+    @staticmethod
+    def iter_mzml(
+        source: Union[str, Path, List[Union[str, Path]]],
+        ext: str = "mzml",
+        package: str = "pyteomics",
+        search_type: str = "Maxquant",
+        scanidx: Optional[List] = None,
+        batch_size: int = 10000,
+        decode_arrays: bool = True,
+        peak_filter: Optional[PeakFilter] = None,
+        *args,
+        **kwargs,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Reads mzml files and yields dataframes containing at most batch_size spectra each.
+
+        Batches never span multiple files, so peak memory is bounded by the batch size instead of the size of the
+        whole run. Each batch has the same layout as the dataframe returned by ``read_mzml``.
+
+        :param source: a directory containing mzml files, a list of files or a single file
+        :param ext: file extension for searching a specified directory
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
+        :param search_type: type of the search (Maxquant, Mascot, Msfragger)
+        :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param batch_size: maximum number of spectra per yielded dataframe
+        :param decode_arrays: whether to decode the intensity and m/z arrays. If False, only the metadata columns are
+            returned. Default: True
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum while parsing. Default: None
+        :param args: additional positional arguments
+        :param kwargs: additional keyword arguments
+        :raises ValueError: if batch_size is not a positive integer
+        :yield: pd.DataFrame with intensities and m/z values of up to batch_size spectra
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be a positive integer. Got {batch_size}")
+        file_list = MSRaw.get_file_list(source, ext)
+        scan_reader = MSRaw._get_scan_reader(package)
+        for file_path in file_list:
+            logger.info(f"Reading mzML file: {file_path}")
+            batch = {}  # type: Dict[str, Any]
+            scans = scan_reader(file_path, scanidx, decode_arrays, *args, **kwargs)
+            for key, record in MSRaw._filter_peaks(scans, peak_filter):
+                batch[key] = record
+                if len(batch) == batch_size:
+                    yield MSRaw._to_dataframe(batch, decode_arrays)
+                    batch = {}
+            if batch:
+                yield MSRaw._to_dataframe(batch, decode_arrays)
 
-        data = pd.DataFrame.from_dict(data, orient="index", columns=MZML_DATA_COLUMNS)
-        data["SCAN_NUMBER"] = pd.to_numeric(data["SCAN_NUMBER"])
-        return data
+    @staticmethod
+    def _filter_peaks(
+        scans: Iterator[Tuple[str, List[Any]]], peak_filter: Optional[PeakFilter]
+    ) -> Iterator[Tuple[str, List[Any]]]:
+        """
+        Apply a peak filter to the records yielded by a scan reader before they are stored.
+
+        :param scans: tuples of unique spectrum key and record in the order of MZML_DATA_COLUMNS
+        :param peak_filter: the preprocessing to apply, records are passed through unchanged if None or if the arrays
+            were not decoded
+        :yield: tuples of unique spectrum key and record with filtered intensity and m/z arrays
+        """
+        for key, record in scans:
+            if peak_filter is not None and record[3] is not None:
+                record[3], record[2] = peak_filter(record[3], record[2])
+            yield key, record
+
+    @staticmethod
+    def _to_dataframe(data: Dict[str, Any], decode_arrays: bool = True) -> pd.DataFrame:
+        """
+        Create the spectra dataframe from a dictionary of records.
+
+        :param data: dictionary mapping unique spectrum keys to records in the order of MZML_DATA_COLUMNS
+        :param decode_arrays: whether the records contain the intensity and m/z arrays. If False, the array columns
+            are dropped
+        :return: pd.DataFrame with intensities and m/z values
+        """
+        df = pd.DataFrame.from_dict(data, orient="index", columns=MZML_DATA_COLUMNS)
+        df["SCAN_NUMBER"] = pd.to_numeric(df["SCAN_NUMBER"])
+        if not decode_arrays:
+            df.drop(columns=["INTENSITIES", "MZ"], inplace=True)
+        return df
+
+    @staticmethod
+    def _get_scan_reader(package: str) -> Callable[..., Iterator[Tuple[str, List[Any]]]]:
+        """
+        Get the function yielding the spectra of a single mzml file for the given package.
+
+        :param package: package for parsing the mzml file. Can eiter be "pymzml", "pyteomics" or "fast"
+        :raises AssertionError: if package has an unexpected type
+        :return: function yielding (key, record) tuples for each MS2 spectrum in a file
+        """
+        if package == "pymzml":
+            return MSRaw._iter_scans_pymzml
+        if package == "pyteomics":
+            return MSRaw._iter_scans_pyteomics
+        if package == "fast":
+            return MSRaw._iter_scans_fast
+        raise AssertionError("Choose either 'pymzml', 'pyteomics' or 'fast'")
 
     @staticmethod
     def get_file_list(source: Union[str, Path, List[Union[str, Path]]], ext: str = "mzml") -> List[Path]:
@@ -145,8 +693,12 @@ class MSRaw:
         if isinstance(source, Path):
             if source.is_file():
                 file_list = [source]
+            elif source.is_dir() and ext.lower() != "mzml":
+                file_list = sorted(source.glob("*." + "".join(f"[{c.lower()}{c.upper()}]" for c in ext)))
             elif source.is_dir():
-                file_list = list(source.glob("*[mM][zZ][mM][lL]"))
+                file_list = sorted(
+                    list(source.glob("*[mM][zZ][mM][lL]")) + list(source.glob("*[mM][zZ][mM][lL].[gG][zZ]"))
+                )
             else:
                 raise FileNotFoundError(f"{source} does not exist.")
         elif isinstance(source, list):
@@ -162,58 +714,134 @@ class MSRaw:
         return file_list
 
     @staticmethod
-    def _get_scans_pymzml(
-        file_path: Union[str, Path], data: Dict, scanidx: Optional[List] = None, *args, **kwargs
-    ) -> None:
+    def _iter_scans_pyteomics(
+        file_path: Union[str, Path], scanidx: Optional[List] = None, decode_arrays: bool = True, *args, **kwargs
+    ) -> Iterator[Tuple[str, List[Any]]]:
         """
-        Reads mzml and generates a dataframe containing intensities and m/z values.
+        Reads mzml using pyteomics and yields a record containing intensities and m/z values per MS2 spectrum.
 
         :param file_path: path to a single mzml file.
-        :param data: dictionary to be added to by this function
         :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param decode_arrays: whether to decode the intensity and m/z arrays. If False, None is used instead
         :param args: additional positional arguments
         :param kwargs: additional keyword arguments
+        :yield: tuples of a unique key and the spectrum record in the order of MZML_DATA_COLUMNS
         """
         if isinstance(file_path, str):
             file_path = Path(file_path)
-        data_iter = pymzml.run.Reader(file_path, args=args, kwargs=kwargs)
-        file_name = file_path.stem
         mass_analyzer = get_mass_analyzer(file_path)
-        if scanidx is None:
+        file_name = get_raw_file_name(file_path)
+        kwargs.setdefault("use_index", False)
+        source: IO[bytes]
+        if scanidx is not None:
+            # seek to the selected spectra using the scan index and parse only those
+            source = io.BytesIO(ScanIndex.for_file(file_path).read_document(file_path, scanidx))
+        else:
+            # pyteomics rewinds after reading the header, which has to stay seekable during threaded decompression
+            source = open_mzml(file_path, threaded=True, head_size=_PYTEOMICS_HEAD_SIZE)
+        with source as fh, mzml.MzML(fh, *args, decode_binary=decode_arrays, **kwargs) as data_iter:
             for spec in data_iter:
-                if spec.ms_level != 1:  # filter out ms1 spectra if there are any
-                    key = f"{file_name}_{spec.ID}"
+                if spec["ms level"] != 1:  # filter out ms1 spectra if there are any
+                    spec_id = spec["id"].split("scan=")[-1]
+                    scan = spec["scanList"]["scan"][0]
+                    fragmentation, mz_range = parse_filter_string(scan["filter string"])
+                    yield f"{file_name}_{spec_id}", [
+                        file_name,
+                        spec_id,
+                        spec["intensity array"] if decode_arrays else None,
+                        spec["m/z array"] if decode_arrays else None,
+                        mz_range,
+                        scan["scan start time"],
+                        mass_analyzer,
+                        fragmentation,
+                    ]
+
+    @staticmethod
+    def _iter_scans_fast(
+        file_path: Union[str, Path], scanidx: Optional[List] = None, decode_arrays: bool = True, *args, **kwargs
+    ) -> Iterator[Tuple[str, List[Any]]]:
+        """
+        Reads mzml using the built-in streaming decoder and yields a record per MS2 spectrum.
+
+        Only the fields in MZML_DATA_COLUMNS are extracted and binary arrays of MS1 spectra are never decoded. See
+        ``spectrum_io.raw.mzml_decoder.iter_spectra`` for details.
+
+        :param file_path: path to a single mzml file.
+        :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param decode_arrays: whether to decode the intensity and m/z arrays. If False, None is used instead
+        :param args: additional positional arguments, ignored by this package
+        :param kwargs: additional keyword arguments, ignored by this package
+        :yield: tuples of a unique key and the spectrum record in the order of MZML_DATA_COLUMNS
+        """
+        if isinstance(file_path, str):
+            file_path = Path(file_path)
+        mass_analyzer = get_mass_analyzer(file_path)
+        file_name = get_raw_file_name(file_path)
+        for spec in mzml_decoder.iter_spectra(file_path, scanidx, min_ms_level=2, decode_arrays=decode_arrays):
+            fragmentation, mz_range = parse_filter_string(spec.filter_string)
+            yield f"{file_name}_{spec.scan_number}", [
+                file_name,
+                spec.scan_number,
+                spec.intensity,
+                spec.mz,
+                mz_range,
+                spec.retention_time,
+                mass_analyzer,
+                fragmentation,
+            ]
+
+    @staticmethod
+    def _iter_scans_pymzml(
+        file_path: Union[str, Path], scanidx: Optional[List] = None, decode_arrays: bool = True, *args, **kwargs
+    ) -> Iterator[Tuple[str, List[Any]]]:
+        """
+        Reads mzml using pymzml and yields a record containing intensities and m/z values per MS2 spectrum.
+
+        :param file_path: path to a single mzml file.
+        :param scanidx: optional list of scan numbers to extract. if not specified, all scans will be extracted
+        :param decode_arrays: whether to decode the intensity and m/z arrays. If False, None is used instead
+        :param args: additional positional arguments
+        :param kwargs: additional keyword arguments
+        :yield: tuples of a unique key and the spectrum record in the order of MZML_DATA_COLUMNS
+        """
+        if isinstance(file_path, str):
+            file_path = Path(file_path)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=ImportWarning)
+            data_iter = pymzml.run.Reader(file_path, args=args, kwargs=kwargs)
+            file_name = get_raw_file_name(file_path)
+            mass_analyzer = get_mass_analyzer(file_path)
+            if scanidx is None and is_gzipped(file_path):
+                # pymzml decompresses gzipped files serially, stream the elements with threaded decompression instead
+                warnings.filterwarnings("ignore", category=FutureWarning)  # pymzml tests lxml elements for truth
+                spectra = (
+                    pymzml.spec.Spectrum(element, obo_version=data_iter.OT.version)
+                    for element in mzml_decoder.iterparse_spectra(file_path)
+                )
+            elif scanidx is None:
+                spectra = iter(data_iter)
+            else:
+                # pymzml's own random access data_iter[idx] does not work if some spectra are filtered out, e.g.
+                # mzML files with only MS2 spectra, hence the spectra are looked up in the scan index instead
+                spectra = (
+                    pymzml.spec.Spectrum(ElementTree.fromstring(xml), obo_version=data_iter.OT.version)
+                    for _, xml in ScanIndex.for_file(file_path).iter_spectra(file_path, scanidx)
+                )
+            try:
+                for spec in spectra:
+                    if spec.ms_level == 1:  # filter out ms1 spectra if there are any
+                        continue
                     filter_string = str(spec.element.find(".//*[@accession='MS:1000512']").get("value"))
-                    fragmentation = filter_string.split("@")[1][:3].upper()
-                    mz_range = filter_string.split("[")[1][:-1]
-                    data[key] = [
+                    fragmentation, mz_range = parse_filter_string(filter_string)
+                    yield f"{file_name}_{spec.ID}", [
                         file_name,
                         spec.ID,
-                        spec.i,
-                        spec.mz,
+                        spec.i if decode_arrays else None,
+                        spec.mz if decode_arrays else None,
                         mz_range,
                         spec.scan_time_in_minutes(),
                         mass_analyzer,
                         fragmentation,
                     ]
-        else:
-            for idx in scanidx:
-                spec = data_iter[idx]
-                # this does not work if some spectra are filtered out, e.g. mzML files with only MS2 spectra, see:
-                # https://github.com/pymzml/pymzML/blob/a883ff0e61fd97465b0a74667233ff594238e335/pymzml/file_classes
-                # /standardMzml.py#L81-L84
-                key = f"{file_name}_{spec.ID}"
-                filter_string = str(spec.element.find(".//*[@accession='MS:1000512']").get("value"))
-                fragmentation = filter_string.split("@")[1][:3].upper()
-                mz_range = filter_string.split("[")[1][:-1]
-                data[key] = [
-                    file_name,
-                    spec.ID,
-                    spec.i,
-                    spec.mz,
-                    mz_range,
-                    spec.scan_time_in_minutes(),
-                    mass_analyzer,
-                    fragmentation,
-                ]
-        data_iter.close()
+            finally:
+                data_iter.close()
@@ -0,0 +1,310 @@
+import base64
+import logging
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from lxml import etree
+
+from .scan_index import ScanIndex, open_mzml
+
+try:
+    import pynumpress
+except ImportError:
+    pynumpress = None
+
+logger = logging.getLogger(__name__)
+
+MS_LEVEL = "MS:1000511"
+SCAN_START_TIME = "MS:1000016"
+FILTER_STRING = "MS:1000512"
+SELECTED_ION_MZ = "MS:1000744"
+CHARGE_STATE = "MS:1000041"
+MZ_ARRAY = "MS:1000514"
+INTENSITY_ARRAY = "MS:1000515"
+UNIT_SECOND = "UO:0000010"
+
+DTYPES: Dict[str, np.dtype] = {
+    "MS:1000519": np.dtype("<i4"),  # 32-bit integer
+    "MS:1000521": np.dtype("<f4"),  # 32-bit float
+    "MS:1000522": np.dtype("<i8"),  # 64-bit integer
+    "MS:1000523": np.dtype("<f8"),  # 64-bit float
+}
+
+_DECOMPRESS_CHUNK_SIZE = 1 << 16
+
+NO_COMPRESSION = "MS:1000576"
+ZLIB = "MS:1000574"
+NUMPRESS = {
+    "MS:1002312": ("linear", False),
+    "MS:1002313": ("pic", False),
+    "MS:1002314": ("slof", False),
+    "MS:1002746": ("linear", True),
+    "MS:1002747": ("pic", True),
+    "MS:1002748": ("slof", True),
+}
+
+_SPECTRUM_TAG = "{*}spectrum"
+
+
+class SpectrumElement:
+    """Fields of a single spectrum element that are needed to fill MZML_DATA_COLUMNS."""
+
+    __slots__ = [
+        "scan_number",
+        "ms_level",
+        "retention_time",
+        "filter_string",
+        "mz",
+        "intensity",
+        "precursor_mz",
+        "precursor_charge",
+    ]
+
+    def __init__(
+        self,
+        scan_number: int,
+        ms_level: int,
+        retention_time: float,
+        filter_string: str,
+        mz: Optional[np.ndarray],
+        intensity: Optional[np.ndarray],
+        precursor_mz: float = np.nan,
+        precursor_charge: int = 0,
+    ):
+        """
+        Initialize a SpectrumElement object.
+
+        :param scan_number: scan number parsed from the native id of the spectrum
+        :param ms_level: ms level of the spectrum
+        :param retention_time: scan start time in minutes
+        :param filter_string: thermo filter string of the scan
+        :param mz: decoded m/z array
+        :param intensity: decoded intensity array
+        :param precursor_mz: m/z of the selected precursor ion, nan for MS1 spectra
+        :param precursor_charge: charge state of the selected precursor ion, 0 if unknown
+        """
+        self.scan_number = scan_number
+        self.ms_level = ms_level
+        self.retention_time = retention_time
+        self.filter_string = filter_string
+        self.mz = mz
+        self.intensity = intensity
+        self.precursor_mz = precursor_mz
+        self.precursor_charge = precursor_charge
+
+
+def iter_spectra(
+    file_path: Union[str, Path],
+    scanidx: Optional[List[int]] = None,
+    min_ms_level: int = 1,
+    decode_arrays: bool = True,
+) -> Iterator[SpectrumElement]:
+    """
+    Stream the spectra of an mzml file, extracting only the fields needed for MZML_DATA_COLUMNS.
+
+    Instead of converting each spectrum to nested python objects, the xml is streamed with lxml's iterparse and only
+    the ms level, scan start time, filter string and binary arrays are read. Binary arrays of spectra with an ms level
+    below min_ms_level are never decoded.
+
+    :param file_path: path to the mzml file
+    :param scanidx: optional list of scan numbers to extract using the scan index. if not specified, all scans will
+        be extracted
+    :param min_ms_level: the lowest ms level to return, e.g. 2 to skip MS1 spectra
+    :param decode_arrays: whether to decode the binary arrays. If False, mz and intensity of the spectra are None
+    :yield: one SpectrumElement per spectrum in the order of the file
+    """
+    if scanidx is None:
+        elements = iterparse_spectra(file_path)
+    else:
+        elements = (etree.fromstring(xml) for _, xml in ScanIndex.for_file(file_path).iter_spectra(file_path, scanidx))
+    for element in elements:
+        spectrum = parse_spectrum(element, min_ms_level, decode_arrays)
+        if spectrum is not None:
+            yield spectrum
+
+
+def iterparse_spectra(file_path: Union[str, Path]) -> Iterator[etree._Element]:
+    """
+    Stream spectrum elements from an mzml file, releasing each element after it was consumed.
+
+    Gzipped files are decompressed in a background thread while the elements are parsed.
+
+    :param file_path: path to the mzml file, optionally gzipped
+    :yield: spectrum elements
+    """
+    with open_mzml(file_path, threaded=True) as fh:
+        for _, element in etree.iterparse(fh, events=("end",), tag=_SPECTRUM_TAG, huge_tree=True):
+            yield element
+            # free the element and all already processed siblings to keep memory usage constant
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def parse_spectrum(
+    element: etree._Element, min_ms_level: int = 1, decode_arrays: bool = True
+) -> Optional[SpectrumElement]:
+    """
+    Extract the fields needed for MZML_DATA_COLUMNS from a spectrum element.
+
+    :param element: the spectrum element
+    :param min_ms_level: the lowest ms level to return
+    :param decode_arrays: whether to decode the binary arrays
+    :return: the parsed spectrum or None if its ms level is below min_ms_level
+    """
+    ms_level = 0
+    for cv_param in element.iterchildren("{*}cvParam"):
+        if cv_param.get("accession") == MS_LEVEL:
+            ms_level = int(cv_param.get("value"))
+            break
+    if ms_level < min_ms_level:
+        return None
+
+    retention_time = np.nan
+    filter_string = ""
+    scan = element.find("{*}scanList/{*}scan")
+    if scan is not None:
+        for cv_param in scan.iterchildren("{*}cvParam"):
+            accession = cv_param.get("accession")
+            if accession == SCAN_START_TIME:
+                retention_time = float(cv_param.get("value"))
+                if cv_param.get("unitAccession") == UNIT_SECOND:
+                    retention_time /= 60
+            elif accession == FILTER_STRING:
+                filter_string = cv_param.get("value")
+
+    precursor_mz, precursor_charge = _parse_selected_ion(element)
+    arrays = _decode_binary_arrays(element, int(element.get("defaultArrayLength", 0))) if decode_arrays else {}
+    return SpectrumElement(
+        scan_number=int(element.get("id").split("scan=")[-1].split()[0]),
+        ms_level=ms_level,
+        retention_time=retention_time,
+        filter_string=filter_string,
+        mz=arrays.get(MZ_ARRAY),
+        intensity=arrays.get(INTENSITY_ARRAY),
+        precursor_mz=precursor_mz,
+        precursor_charge=precursor_charge,
+    )
+
+
+def _parse_selected_ion(element: etree._Element) -> Tuple[float, int]:
+    """
+    Extract m/z and charge state of the first selected precursor ion of a spectrum element.
+
+    :param element: the spectrum element
+    :return: tuple of precursor m/z, nan if not present, and charge state, 0 if not present
+    """
+    precursor_mz = np.nan
+    precursor_charge = 0
+    selected_ion = element.find("{*}precursorList/{*}precursor/{*}selectedIonList/{*}selectedIon")
+    if selected_ion is not None:
+        for cv_param in selected_ion.iterchildren("{*}cvParam"):
+            accession = cv_param.get("accession")
+            if accession == SELECTED_ION_MZ:
+                precursor_mz = float(cv_param.get("value"))
+            elif accession == CHARGE_STATE:
+                precursor_charge = int(cv_param.get("value"))
+    return precursor_mz, precursor_charge
+
+
+def _decode_binary_arrays(element: etree._Element, length: int) -> Dict[str, np.ndarray]:
+    """
+    Decode the m/z and intensity arrays of a spectrum element.
+
+    :param element: the spectrum element
+    :param length: the default array length of the spectrum
+    :return: dictionary mapping the array type accession to the decoded array
+    """
+    arrays = {}
+    for binary_array in element.iterfind("{*}binaryDataArrayList/{*}binaryDataArray"):
+        array_type = None
+        dtype = DTYPES["MS:1000523"]
+        compression = NO_COMPRESSION
+        for cv_param in binary_array.iterchildren("{*}cvParam"):
+            accession = cv_param.get("accession")
+            if accession in [MZ_ARRAY, INTENSITY_ARRAY]:
+                array_type = accession
+            elif accession in DTYPES:
+                dtype = DTYPES[accession]
+            elif accession == ZLIB or accession in NUMPRESS:
+                compression = accession
+        if array_type is None:
+            continue
+        binary = binary_array.find("{*}binary")
+        arrays[array_type] = decode_binary(binary.text or "", dtype, compression, length)
+    return arrays
+
+
+def decode_binary(text: str, dtype: np.dtype, compression: str, length: int) -> np.ndarray:
+    """
+    Decode a base64 encoded binary array of an mzml file.
+
+    The values are decompressed directly into an array of the expected length, which avoids holding the
+    decompressed bytes and a copy of them at the same time. If the length does not match the data, the array is
+    sized by the decompressed data instead.
+
+    :param text: the base64 encoded content of the binary element
+    :param dtype: the data type of the encoded values
+    :param compression: accession of the compression, either no compression, zlib or one of the MS-Numpress variants
+    :param length: the expected number of values, i.e. the defaultArrayLength of the spectrum
+    :return: the decoded values
+    """
+    data = base64.b64decode(text)
+    if compression in NUMPRESS:
+        method, zlib_compressed = NUMPRESS[compression]
+        if zlib_compressed:
+            data = zlib.decompress(data)
+        return _decode_numpress(data, method)
+    values = np.empty(length, dtype=dtype)
+    buffer = values.data.cast("B")
+    if compression == ZLIB:
+        if not _decompress_into(data, buffer):
+            logger.debug(f"defaultArrayLength {length} does not match the decompressed array, resizing")
+            values = np.frombuffer(zlib.decompress(data), dtype=dtype).copy()
+    elif len(data) == len(buffer):
+        buffer[:] = data
+    else:
+        values = np.frombuffer(data, dtype=dtype).copy()
+    if not values.dtype.isnative:
+        values = values.byteswap().view(values.dtype.newbyteorder("="))
+    return values
+
+
+def _decompress_into(data: bytes, buffer: memoryview) -> bool:
+    """
+    Decompress zlib compressed data into a buffer, in chunks of at most _DECOMPRESS_CHUNK_SIZE bytes.
+
+    :param data: the compressed bytes
+    :param buffer: the byte buffer to fill
+    :return: whether the decompressed data filled the buffer exactly
+    """
+    decompressor = zlib.decompressobj()
+    position = 0
+    while position < len(buffer):
+        chunk = decompressor.decompress(data, min(_DECOMPRESS_CHUNK_SIZE, len(buffer) - position))
+        if not chunk:
+            break
+        buffer[position : position + len(chunk)] = chunk
+        position += len(chunk)
+        data = decompressor.unconsumed_tail
+    # the remaining input may only contain the end of the stream
+    return position == len(buffer) and not decompressor.decompress(data, 1) and decompressor.eof
+
+
+def _decode_numpress(data: bytes, method: str) -> np.ndarray:
+    """
+    Decode MS-Numpress compressed values.
+
+    Uses the C implementation pynumpress if it is installed and the python implementation of pymzml otherwise.
+
+    :param data: the compressed bytes
+    :param method: the numpress method, either "linear", "pic" or "slof"
+    :return: the decoded values as float64 array
+    """
+    if pynumpress is not None:
+        return np.asarray(getattr(pynumpress, f"decode_{method}")(np.frombuffer(data, dtype=np.uint8)), dtype=float)
+    from pymzml.ms_numpress import MSNumpress
+
+    return np.asarray(getattr(MSNumpress(bytearray(data)), f"decode_{method}")(), dtype=float)
@@ -0,0 +1,75 @@
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+
+class PeakFilter:
+    """
+    Preprocessing of the peaks of a spectrum applied while reading mzml files.
+
+    All steps are vectorized per spectrum and applied before the spectra are stored, so removed peaks never reach the
+    resulting dataframe. The steps are applied in the following order: m/z range clipping, relative intensity
+    threshold, top-N selection and dtype conversion. The remaining peaks keep their original order.
+    """
+
+    def __init__(
+        self,
+        top_n: Optional[int] = None,
+        min_relative_intensity: Optional[float] = None,
+        mz_range: Optional[Tuple[float, float]] = None,
+        dtype: Optional[Union[str, np.dtype]] = None,
+    ):
+        """
+        Initialize a PeakFilter object.
+
+        :param top_n: keep only the n most intense peaks of each spectrum
+        :param min_relative_intensity: remove peaks with an intensity below this fraction of the base peak intensity
+        :param mz_range: tuple of the lowest and highest m/z value to keep, both inclusive
+        :param dtype: data type to convert the m/z and intensity arrays to, e.g. "float32"
+        :raises ValueError: if any of the parameters is out of range
+        """
+        if top_n is not None and top_n < 1:
+            raise ValueError(f"top_n must be a positive integer. Got {top_n}")
+        if min_relative_intensity is not None and not 0 <= min_relative_intensity <= 1:
+            raise ValueError(f"min_relative_intensity must be between 0 and 1. Got {min_relative_intensity}")
+        if mz_range is not None and mz_range[0] > mz_range[1]:
+            raise ValueError(f"mz_range must be a tuple of lower and upper bound. Got {mz_range}")
+        self.top_n = top_n
+        self.min_relative_intensity = min_relative_intensity
+        self.mz_range = None if mz_range is None else (float(mz_range[0]), float(mz_range[1]))
+        self.dtype = None if dtype is None else np.dtype(dtype)
+
+    def __repr__(self) -> str:
+        """Representation containing all parameters, also used as part of the spectra cache key."""
+        return (
+            f"PeakFilter(top_n={self.top_n}, min_relative_intensity={self.min_relative_intensity}, "
+            f"mz_range={self.mz_range}, dtype={self.dtype})"
+        )
+
+    def __call__(self, mz: np.ndarray, intensity: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Apply the filter to the peaks of a single spectrum.
+
+        :param mz: m/z values of the spectrum
+        :param intensity: intensities of the spectrum in the same order as mz
+        :return: tuple of the filtered m/z and intensity arrays
+        """
+        mask = None
+        if self.mz_range is not None:
+            mask = (mz >= self.mz_range[0]) & (mz <= self.mz_range[1])
+        if self.min_relative_intensity is not None and len(intensity) > 0:
+            base_peak = intensity.max() if mask is None else intensity.max(initial=0, where=mask)
+            above_threshold = intensity >= self.min_relative_intensity * base_peak
+            mask = above_threshold if mask is None else mask & above_threshold
+        if mask is not None:
+            mz = mz[mask]
+            intensity = intensity[mask]
+        if self.top_n is not None and len(intensity) > self.top_n:
+            # argpartition selects the n most intense peaks in linear time, sorting restores the m/z order
+            keep = np.sort(np.argpartition(intensity, -self.top_n)[-self.top_n :])
+            mz = mz[keep]
+            intensity = intensity[keep]
+        if self.dtype is not None:
+            mz = mz.astype(self.dtype, copy=False)
+            intensity = intensity.astype(self.dtype, copy=False)
+        return mz, intensity
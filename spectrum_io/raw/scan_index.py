@@ -0,0 +1,526 @@
+import gzip
+import io
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional, Tuple, Union, cast
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = ".scanidx.npz"
+
+_CHUNK_SIZE = 1 << 20
+_CHUNK_OVERLAP = 1 << 16
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+_INDEX_LIST_OFFSET_PATTERN = re.compile(rb"<indexListOffset>\s*(\d+)\s*</indexListOffset>")
+_SPECTRUM_INDEX_PATTERN = re.compile(rb'<index\s+name="spectrum"\s*>(.*?)</index>', re.DOTALL)
+_OFFSET_PATTERN = re.compile(rb'<offset\s+idRef="[^"]*?scan=(\d+)[^"]*"[^>]*>\s*(\d+)\s*</offset>')
+_SPECTRUM_PATTERN = re.compile(rb'<spectrum\s[^>]*?\bid="[^"]*?scan=(\d+)')
+_SPECTRUM_END = b"</spectrum>"
+
+
+class ScanIndex:
+    """
+    Mapping of scan numbers to the byte offsets of the corresponding spectrum elements in an mzml file.
+
+    The index is taken from the offset list of indexedmzML files if present, otherwise it is built by a single regex
+    pass over the file. It is stored as a sidecar file next to the mzml file and reused as long as the mzml file is
+    unchanged, allowing to retrieve arbitrary spectra by seeking directly to them.
+    """
+
+    def __init__(self, scan_numbers: np.ndarray, offsets: np.ndarray):
+        """
+        Initialize a ScanIndex object.
+
+        :param scan_numbers: scan numbers of all spectra in the file
+        :param offsets: byte offsets of the spectrum elements in the same order as scan_numbers
+        """
+        scan_numbers = np.asarray(scan_numbers, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        order = np.argsort(scan_numbers, kind="stable")
+        self.scan_numbers = scan_numbers[order]
+        self.offsets = offsets[order]
+
+    def __len__(self) -> int:
+        """Number of indexed spectra."""
+        return len(self.scan_numbers)
+
+    def __contains__(self, scan_number: int) -> bool:
+        """
+        Check if a scan number is part of the index.
+
+        :param scan_number: the scan number to look up
+        :return: whether the scan number is part of the index
+        """
+        pos = np.searchsorted(self.scan_numbers, scan_number)
+        return bool(pos < len(self.scan_numbers) and self.scan_numbers[pos] == scan_number)
+
+    def get_offsets(self, scan_numbers: Iterable[int]) -> np.ndarray:
+        """
+        Get the byte offsets of the given scans.
+
+        :param scan_numbers: the scan numbers to look up
+        :raises KeyError: if any of the scan numbers is not part of the index
+        :return: array of byte offsets in the order of the given scan numbers
+        """
+        scan_numbers = np.asarray(list(scan_numbers), dtype=np.int64)
+        pos = np.searchsorted(self.scan_numbers, scan_numbers)
+        pos = np.minimum(pos, max(len(self.scan_numbers) - 1, 0))
+        found = self.scan_numbers[pos] == scan_numbers if len(self.scan_numbers) else np.zeros(len(pos), dtype=bool)
+        if not np.all(found):
+            raise KeyError(f"Scan numbers not found in the mzml file: {scan_numbers[~found].tolist()}")
+        return self.offsets[pos]
+
+    def sample(
+        self,
+        n: int,
+        stratified: bool = True,
+        seed: Optional[Union[int, np.random.Generator]] = None,
+        exclude: Optional[Iterable[int]] = None,
+    ) -> np.ndarray:
+        """
+        Draw a random subset of the indexed scan numbers without replacement.
+
+        With stratified sampling the scans are split into n contiguous blocks of equal size and one scan is drawn from
+        each block. Since scan numbers increase with the retention time, this spreads the selection evenly over the
+        gradient without reading the retention times from the file.
+
+        :param n: number of scans to draw, all remaining scans are returned if there are fewer
+        :param stratified: whether to draw one scan per block of consecutive scans instead of uniformly
+        :param seed: seed or random generator used for the selection
+        :param exclude: scan numbers that must not be drawn, e.g. scans drawn previously
+        :return: sorted array of the drawn scan numbers
+        """
+        candidates = self.scan_numbers
+        if exclude is not None:
+            candidates = np.setdiff1d(candidates, np.asarray(list(exclude), dtype=np.int64), assume_unique=True)
+        if n >= len(candidates):
+            return candidates.copy()
+        rng = np.random.default_rng(seed)
+        if stratified:
+            bounds = np.linspace(0, len(candidates), n + 1).astype(np.int64)
+            return candidates[rng.integers(bounds[:-1], bounds[1:])]
+        return np.sort(rng.choice(candidates, n, replace=False))
+
+    def iter_spectra(self, file_path: Union[str, Path], scan_numbers: Iterable[int]) -> Iterator[Tuple[int, bytes]]:
+        """
+        Read the xml of the given scans from an mzml file by seeking to their offsets.
+
+        Spectra are read in the order in which they appear in the file, so gzipped files are read in a single pass.
+
+        :param file_path: path to the mzml file this index was built for
+        :param scan_numbers: the scan numbers to read
+        :yield: tuples of scan number and the raw xml of the spectrum element
+        """
+        scan_numbers = np.unique(np.asarray(list(scan_numbers), dtype=np.int64))
+        offsets = self.get_offsets(scan_numbers)
+        order = np.argsort(offsets)
+        with open_mzml(file_path) as fh:
+            for scan_number, offset in zip(scan_numbers[order], offsets[order]):
+                fh.seek(offset)
+                yield int(scan_number), read_spectrum(fh)
+
+    def read_document(self, file_path: Union[str, Path], scan_numbers: Iterable[int]) -> bytes:
+        """
+        Build a standalone mzml document containing only the given scans of an mzml file.
+
+        The document consists of the header of the file up to the first spectrum, the xml of the given spectra read by
+        seeking to their offsets and the closing tags, so that it can be parsed by any mzml reader.
+
+        :param file_path: path to the mzml file this index was built for
+        :param scan_numbers: the scan numbers to read
+        :return: the mzml document
+        """
+        with open_mzml(file_path) as fh:
+            header = fh.read(int(self.offsets.min()) if len(self.offsets) else 0)
+        footer = b"</spectrumList></run></mzML>"
+        if b"<indexedmzML" in header:
+            footer += b"</indexedmzML>"
+        return header + b"".join(xml for _, xml in self.iter_spectra(file_path, scan_numbers)) + footer
+
+    @classmethod
+    def for_file(cls, file_path: Union[str, Path], use_sidecar: bool = True) -> "ScanIndex":
+        """
+        Get the index of an mzml file, loading it from the sidecar file or building it if needed.
+
+        :param file_path: path to the mzml file
+        :param use_sidecar: whether to load the index from and store it to a sidecar file next to the mzml file
+        :return: the ScanIndex of the file
+        """
+        file_path = Path(file_path)
+        sidecar_path = get_sidecar_path(file_path)
+        if use_sidecar:
+            index = cls.load(sidecar_path, file_path)
+            if index is not None:
+                return index
+        index = cls.build(file_path)
+        if use_sidecar:
+            index.save(sidecar_path, file_path)
+        return index
+
+    @classmethod
+    def build(cls, file_path: Union[str, Path]) -> "ScanIndex":
+        """
+        Build the index of an mzml file.
+
+        :param file_path: path to the mzml file
+        :return: the ScanIndex of the file
+        """
+        index = None
+        if not is_gzipped(file_path):
+            index = cls._from_index_list(file_path)
+        if index is None:
+            logger.info(f"Building scan index of {file_path}")
+            index = cls._from_scan(file_path)
+        return index
+
+    @classmethod
+    def _from_index_list(cls, file_path: Union[str, Path]) -> Optional["ScanIndex"]:
+        """
+        Read the spectrum offsets from the index list at the end of an indexedmzML file.
+
+        :param file_path: path to the mzml file
+        :return: the ScanIndex of the file or None if the file does not contain a valid index list
+        """
+        with open(file_path, "rb") as fh:
+            fh.seek(0, os.SEEK_END)
+            fh.seek(max(fh.tell() - 4096, 0))
+            match = _INDEX_LIST_OFFSET_PATTERN.search(fh.read())
+            if match is None:
+                return None
+            fh.seek(int(match.group(1)))
+            index_list = _SPECTRUM_INDEX_PATTERN.search(fh.read())
+        if index_list is None:
+            return None
+        entries = np.array(_OFFSET_PATTERN.findall(index_list.group(1)), dtype=np.int64).reshape(-1, 2)
+        return cls(entries[:, 0], entries[:, 1])
+
+    @classmethod
+    def _from_scan(cls, file_path: Union[str, Path]) -> "ScanIndex":
+        """
+        Build the index by searching the whole file for spectrum start tags.
+
+        :param file_path: path to the mzml file
+        :return: the ScanIndex of the file
+        """
+        scan_numbers = []
+        offsets = []
+        buffer = b""
+        buffer_start = 0
+        with open_mzml(file_path, threaded=True) as fh:
+            while True:
+                chunk = fh.read(_CHUNK_SIZE)
+                buffer += chunk
+                # keep an overlap so that start tags crossing the chunk border are found in the next iteration
+                limit = len(buffer) - _CHUNK_OVERLAP if chunk else len(buffer)
+                for match in _SPECTRUM_PATTERN.finditer(buffer):
+                    if match.start() >= limit:
+                        break
+                    scan_numbers.append(int(match.group(1)))
+                    offsets.append(buffer_start + match.start())
+                if not chunk:
+                    break
+                if limit > 0:
+                    buffer = buffer[limit:]
+                    buffer_start += limit
+        return cls(np.array(scan_numbers, dtype=np.int64), np.array(offsets, dtype=np.int64))
+
+    def save(self, path: Union[str, Path], file_path: Union[str, Path]):
+        """
+        Store the index together with the size and modification time of the indexed mzml file.
+
+        :param path: path to the sidecar file
+        :param file_path: path to the indexed mzml file
+        """
+        path = Path(path)
+        stat = Path(file_path).stat()
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as fh:
+                np.savez(
+                    fh,
+                    scan_numbers=self.scan_numbers,
+                    offsets=self.offsets,
+                    source_stat=np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64),
+                )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not store scan index at {path}: {e}")
+            if tmp_path.is_file():
+                tmp_path.unlink()
+
+    @classmethod
+    def load(cls, path: Union[str, Path], file_path: Union[str, Path]) -> Optional["ScanIndex"]:
+        """
+        Load an index stored with ``save`` if it is still valid for the given mzml file.
+
+        :param path: path to the sidecar file
+        :param file_path: path to the indexed mzml file
+        :return: the stored ScanIndex or None if there is no sidecar file or the mzml file changed since
+        """
+        if not Path(path).is_file():
+            return None
+        stat = Path(file_path).stat()
+        try:
+            with np.load(path) as data:
+                if data["source_stat"].tolist() != [stat.st_size, stat.st_mtime_ns]:
+                    logger.info(f"Scan index at {path} is outdated, rebuilding it")
+                    return None
+                return cls(data["scan_numbers"], data["offsets"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load scan index from {path}: {e}")
+            return None
+
+
+def get_sidecar_path(file_path: Union[str, Path]) -> Path:
+    """
+    Get the path of the sidecar file storing the scan index of an mzml file.
+
+    :param file_path: path to the mzml file
+    :return: path to the sidecar file
+    """
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + SIDECAR_SUFFIX)
+
+
+def open_mzml(file_path: Union[str, Path], threaded: bool = False, head_size: int = 0) -> IO[bytes]:
+    """
+    Open an mzml file for binary reading, transparently decompressing gzipped files.
+
+    :param file_path: The path to the mzml file, gzipped files are recognized by the suffix .gz
+    :param threaded: whether to decompress gzipped files in a background thread, so that decompression overlaps with
+        parsing. The returned file object is not seekable in this case, so only use it for reading the file once from
+        start to end. Has no effect on uncompressed files
+    :param head_size: with threaded decompression, number of bytes at the start of the file that can still be sought
+        to after reading them, for parsers like pyteomics that read the header first and rewind afterwards. Default: 0
+    :return: a binary file object
+    """
+    if is_gzipped(file_path):
+        if threaded and head_size > 0:
+            return io.BufferedReader(RewindableReader(ThreadedGzipReader(file_path), head_size), _CHUNK_SIZE)
+        if threaded:
+            return io.BufferedReader(ThreadedGzipReader(file_path), buffer_size=_CHUNK_SIZE)
+        # GzipFile implements the binary file interface, but is not declared as IO[bytes]
+        return cast(IO[bytes], gzip.open(file_path, "rb"))
+    return open(file_path, "rb")
+
+
+def is_gzipped(file_path: Union[str, Path]) -> bool:
+    """
+    Check if a file is gzipped based on its suffix.
+
+    :param file_path: path to the file
+    :return: whether the file name ends with .gz
+    """
+    return str(file_path).lower().endswith(".gz")
+
+
+class ThreadedGzipReader(io.RawIOBase):
+    """
+    Sequential reader of gzipped files that decompresses in a background thread.
+
+    Compressed chunks are inflated with a single zlib call each. zlib releases the GIL during that call, so the
+    decompression of the next chunks runs in parallel to the parsing of the current one. Decompressed chunks are
+    handed over through a bounded queue, limiting the read-ahead to queue_size chunks.
+    """
+
+    def __init__(self, file_path: Union[str, Path], chunk_size: int = _CHUNK_SIZE, queue_size: int = 8):
+        """
+        Initialize a ThreadedGzipReader object and start the background thread.
+
+        :param file_path: path to the gzipped file
+        :param chunk_size: number of compressed bytes inflated at once
+        :param queue_size: maximum number of decompressed chunks kept in memory
+        """
+        super().__init__()
+        self._file = open(file_path, "rb")
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=queue_size)  # type: queue.Queue
+        self._stop = threading.Event()
+        self._buffer = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._decompress, daemon=True)
+        self._thread.start()
+
+    def _decompress(self):
+        """Put decompressed chunks into the queue until the end of the file, an error or close is reached."""
+        try:
+            decompressor = zlib.decompressobj(wbits=_GZIP_WBITS)
+            in_member = False
+            while not self._stop.is_set():
+                data = self._file.read(self._chunk_size)
+                if not data:
+                    break
+                while data:
+                    in_member = True
+                    chunk = decompressor.decompress(data)
+                    if chunk:
+                        self._put(chunk)
+                    if not decompressor.eof:
+                        break
+                    # gzip files may consist of several members, e.g. after concatenating files
+                    in_member = False
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=_GZIP_WBITS)
+            if in_member and not self._stop.is_set():
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+            self._put(b"")
+        except zlib.error as e:
+            self._put(gzip.BadGzipFile(f"Invalid gzip data: {e}"))
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item: Union[bytes, Exception]):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        """Whether the file can be read, always True."""
+        return True
+
+    def readinto(self, buffer) -> int:
+        """
+        Read decompressed bytes into a pre-allocated buffer.
+
+        :param buffer: writable buffer to fill
+        :raises item: any error raised while decompressing, e.g. OSError for a corrupt file
+        :return: the number of bytes read, 0 at the end of the file
+        """
+        if not self._buffer:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buffer = memoryview(item)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        """Stop the background thread and close the file."""
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._file.close()
+        super().close()
+
+
+class RewindableReader(io.RawIOBase):
+    """
+    Sequential reader that keeps the start of an unseekable stream, so that it can be read again.
+
+    Seeking is supported to any position within the kept head of the stream as long as reading did not continue
+    beyond it, and to the current position.
+    """
+
+    def __init__(self, raw: io.RawIOBase, head_size: int):
+        """
+        Initialize a RewindableReader object.
+
+        :param raw: the unseekable stream
+        :param head_size: maximum number of bytes kept from the start of the stream
+        """
+        super().__init__()
+        self._raw = raw
+        self._head_size = head_size
+        self._head = bytearray()
+        self._pos = 0
+        self._raw_pos = 0
+
+    def readable(self) -> bool:
+        """Whether the file can be read, always True."""
+        return True
+
+    def seekable(self) -> bool:
+        """Whether the file supports seeking, always True even though seeking is limited to the head."""
+        return True
+
+    def tell(self) -> int:
+        """
+        Get the current position.
+
+        :return: the current position
+        """
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Change the current position.
+
+        :param offset: the new position, relative to the current position if whence is SEEK_CUR
+        :param whence: SEEK_SET or SEEK_CUR
+        :raises UnsupportedOperation: if the position is no longer available
+        :return: the new position
+        """
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("Can only seek relative to the start or the current position.")
+        if offset != self._raw_pos and not (0 <= offset <= self._raw_pos == len(self._head)):
+            raise io.UnsupportedOperation(f"Cannot seek to {offset}, only the first {len(self._head)} bytes are kept.")
+        self._pos = offset
+        return offset
+
+    def readinto(self, buffer) -> int:
+        """
+        Read bytes into a pre-allocated buffer, from the kept head if the position lies within it.
+
+        :param buffer: writable buffer to fill
+        :return: the number of bytes read, 0 at the end of the file
+        """
+        if self._pos < self._raw_pos:
+            size = min(len(buffer), self._raw_pos - self._pos)
+            buffer[:size] = self._head[self._pos : self._pos + size]
+            self._pos += size
+            return size
+        size = self._raw.readinto(buffer)
+        if self._raw_pos == len(self._head) and self._raw_pos + size <= self._head_size:
+            self._head += memoryview(buffer)[:size]
+        else:
+            self._head = bytearray()  # reading continued beyond the head, it can no longer be sought to
+        self._raw_pos += size
+        self._pos = self._raw_pos
+        return size
+
+    def close(self):
+        """Close the underlying stream."""
+        if not self.closed:
+            self._raw.close()
+        super().close()
+
+
+def read_spectrum(fh: IO[bytes]) -> bytes:
+    """
+    Read a spectrum element starting at the current position of a file.
+
+    :param fh: binary file object positioned at the start of a spectrum element
+    :raises ValueError: if the file ends before the end tag of the spectrum
+    :return: the raw xml of the spectrum element including its end tag
+    """
+    buffer = b""
+    search_start = 0
+    while True:
+        chunk = fh.read(_CHUNK_OVERLAP)
+        if not chunk:
+            raise ValueError("Unexpected end of file while reading spectrum.")
+        buffer += chunk
+        end = buffer.find(_SPECTRUM_END, search_start)
+        if end >= 0:
+            return buffer[: end + len(_SPECTRUM_END)]
+        search_start = max(len(buffer) - len(_SPECTRUM_END), 0)
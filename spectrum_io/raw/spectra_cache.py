@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import pandas as pd
+
+from .spectrum_batch import SpectrumBatch
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = ".spectra.npz"
+
+
+class SpectraCache:
+    """
+    On-disk cache of parsed spectra.
+
+    Entries are keyed by the resolved path, size and modification time of the mzml file and the options used for
+    reading it, so a changed file or different reader options never return stale results. Parsed spectra are stored
+    as uncompressed ragged arrays, turning repeated reads into plain file loads. The cache is limited in size and
+    evicts the least recently used entries first.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_size: int = 10 * 1024**3):
+        """
+        Initialize a SpectraCache object.
+
+        :param cache_dir: directory to store the cached spectra in, created if it does not exist
+        :param max_size: maximum total size of all cache entries in bytes. Default: 10 GiB
+        """
+        if isinstance(cache_dir, str):
+            cache_dir = Path(cache_dir)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, file_path: Union[str, Path], options: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Load the parsed spectra of a file from the cache.
+
+        :param file_path: path to the mzml file
+        :param options: the reader options used to parse the file
+        :return: the cached dataframe or None if the file was not read with these options before
+        """
+        entry_path = self._get_entry_path(file_path, options)
+        try:
+            df = SpectrumBatch.load(entry_path).to_dataframe()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {entry_path}: {e}")
+            return None
+        try:
+            os.utime(entry_path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another process after loading, the loaded spectra are still valid
+        logger.info(f"Loaded spectra of {file_path} from cache")
+        return df
+
+    def put(self, file_path: Union[str, Path], options: Dict[str, Any], df: pd.DataFrame):
+        """
+        Store the parsed spectra of a file in the cache and evict old entries if the size limit is exceeded.
+
+        Entries of previous versions of the same file are removed.
+
+        :param file_path: path to the mzml file
+        :param options: the reader options used to parse the file
+        :param df: the dataframe returned by reading the file
+        """
+        entry_path = self._get_entry_path(file_path, options)
+        path_key = entry_path.name.split("_")[0]
+        for stale_path in self.cache_dir.glob(f"{path_key}_*{CACHE_SUFFIX}"):
+            if stale_path != entry_path and not self._has_current_stat(stale_path, entry_path):
+                _unlink(stale_path)
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+        try:
+            SpectrumBatch.from_dataframe(df).save(tmp_path)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            logger.warning(f"Could not store spectra of {file_path} in cache: {e}")
+            _unlink(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the total size is within the limit."""
+        entries = []
+        for entry_path in self.cache_dir.glob(f"*{CACHE_SUFFIX}"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:  # removed by a concurrent process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logger.info(f"Evicting {entry_path} from cache")
+            _unlink(entry_path)
+            total_size -= size
+
+    def clear(self):
+        """Remove all entries."""
+        for entry_path in self.cache_dir.glob(f"*{CACHE_SUFFIX}"):
+            _unlink(entry_path)
+
+    def _get_entry_path(self, file_path: Union[str, Path], options: Dict[str, Any]) -> Path:
+        """
+        Get the path of the cache entry for a file and reader options.
+
+        The name consists of a hash of the file path, so that entries of older versions of a file can be found, and a
+        hash of the file size, modification time and options.
+
+        :param file_path: path to the mzml file
+        :param options: the reader options used to parse the file
+        :return: path to the cache entry
+        """
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+        path_key = _hash(str(file_path))
+        content_key = _hash(json.dumps([stat.st_size, stat.st_mtime_ns, options], sort_keys=True, default=str))
+        return self.cache_dir / f"{path_key}_{stat.st_size}-{stat.st_mtime_ns}_{content_key}{CACHE_SUFFIX}"
+
+    @staticmethod
+    def _has_current_stat(path: Path, entry_path: Path) -> bool:
+        """
+        Check if a cache entry belongs to the same version of a file as entry_path, but with other reader options.
+
+        :param path: path to another cache entry of the same file
+        :param entry_path: path to the current cache entry
+        :return: whether both entries were created for the same file size and modification time
+        """
+        return path.name.split("_")[1] == entry_path.name.split("_")[1]
+
+
+def _hash(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def _unlink(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,202 @@
+import logging
+from pathlib import Path
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from spectrum_fundamentals.constants import MZML_DATA_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+META_DATA_COLUMNS = [col for col in MZML_DATA_COLUMNS if col not in ["INTENSITIES", "MZ"]]
+CATEGORICAL_COLUMNS = ["RAW_FILE", "MZ_RANGE", "MASS_ANALYZER", "FRAGMENTATION"]
+
+
+class SpectrumBatch:
+    """
+    Compact ragged-array representation of a batch of spectra.
+
+    The peaks of all spectra are stored in two flat contiguous arrays. The peaks of spectrum i are found at
+    mz[offsets[i]:offsets[i + 1]] and intensity[offsets[i]:offsets[i + 1]]. Per-spectrum information is kept in a
+    metadata dataframe with typed columns instead of python objects.
+    """
+
+    def __init__(
+        self,
+        mz: np.ndarray,
+        intensity: np.ndarray,
+        offsets: np.ndarray,
+        metadata: pd.DataFrame,
+    ):
+        """
+        Initialize a SpectrumBatch object.
+
+        :param mz: flat array containing the m/z values of all spectra
+        :param intensity: flat array containing the intensities of all spectra
+        :param offsets: array of length n + 1 with the start of each spectrum in mz and intensity and the total
+            number of peaks as the last element
+        :param metadata: dataframe with one row per spectrum containing the columns in META_DATA_COLUMNS
+        :raises ValueError: if the arrays and the metadata are not consistent
+        """
+        mz = np.ascontiguousarray(mz)
+        intensity = np.ascontiguousarray(intensity)
+        offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        if mz.ndim != 1 or intensity.ndim != 1 or len(mz) != len(intensity):
+            raise ValueError("mz and intensity must be one-dimensional arrays of the same length.")
+        if offsets.ndim != 1 or len(offsets) != len(metadata) + 1:
+            raise ValueError(f"offsets must have length {len(metadata) + 1}. Got {len(offsets)}")
+        if offsets[0] != 0 or offsets[-1] != len(mz) or np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must increase monotonically from 0 to the total number of peaks.")
+        missing_columns = set(META_DATA_COLUMNS) - set(metadata.columns)
+        if missing_columns:
+            raise ValueError(f"metadata is missing the columns {sorted(missing_columns)}.")
+
+        self.mz = mz
+        self.intensity = intensity
+        self.offsets = offsets
+        self.metadata = SpectrumBatch._convert_metadata(metadata)
+
+    def __len__(self) -> int:
+        """Number of spectra in the batch."""
+        return len(self.metadata)
+
+    @property
+    def num_peaks(self) -> np.ndarray:
+        """Number of peaks of each spectrum."""
+        return np.diff(self.offsets)
+
+    def get_spectrum(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the peaks of a single spectrum without copying.
+
+        :param i: position of the spectrum in the batch
+        :return: tuple of views into the m/z and intensity arrays
+        """
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.mz[start:end], self.intensity[start:end]
+
+    @staticmethod
+    def _convert_metadata(metadata: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convert the metadata columns to compact dtypes.
+
+        :param metadata: dataframe with one row per spectrum containing the columns in META_DATA_COLUMNS
+        :return: dataframe with integer scan numbers, float retention times and categorical string columns
+        """
+        metadata = metadata[META_DATA_COLUMNS].reset_index(drop=True)
+        metadata["SCAN_NUMBER"] = pd.to_numeric(metadata["SCAN_NUMBER"]).astype(np.int64)
+        metadata["RETENTION_TIME"] = metadata["RETENTION_TIME"].astype(np.float64)
+        for col in CATEGORICAL_COLUMNS:
+            metadata[col] = metadata[col].astype("category")
+        return metadata
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "SpectrumBatch":
+        """
+        Create a SpectrumBatch from a dataframe in the layout returned by MSRaw.read_mzml.
+
+        :param df: dataframe with the columns in MZML_DATA_COLUMNS and one array of peaks per row
+        :return: SpectrumBatch containing the same spectra
+        """
+        return cls.from_arrays(list(df["MZ"]), list(df["INTENSITIES"]), df)
+
+    @classmethod
+    def from_arrays(
+        cls, mz: Sequence[np.ndarray], intensity: Sequence[np.ndarray], metadata: pd.DataFrame
+    ) -> "SpectrumBatch":
+        """
+        Create a SpectrumBatch from per-spectrum peak arrays.
+
+        :param mz: one m/z array per spectrum
+        :param intensity: one intensity array per spectrum
+        :param metadata: dataframe with one row per spectrum containing the columns in META_DATA_COLUMNS
+        :return: SpectrumBatch containing the given spectra
+        """
+        offsets = np.zeros(len(mz) + 1, dtype=np.int64)
+        np.cumsum([len(peaks) for peaks in mz], out=offsets[1:])
+        return cls(_concatenate(mz), _concatenate(intensity), offsets, metadata)
+
+    @classmethod
+    def concat(cls, batches: List["SpectrumBatch"]) -> "SpectrumBatch":
+        """
+        Concatenate several batches into one.
+
+        :param batches: list of SpectrumBatch objects
+        :return: SpectrumBatch containing the spectra of all batches in the given order
+        """
+        offsets = [np.zeros(1, dtype=np.int64)]
+        total = 0
+        for batch in batches:
+            offsets.append(batch.offsets[1:] + total)
+            total += batch.offsets[-1]
+        if batches:
+            metadata = pd.concat([batch.metadata for batch in batches], ignore_index=True)
+        else:
+            metadata = pd.DataFrame(columns=META_DATA_COLUMNS)
+        return cls(
+            _concatenate([batch.mz for batch in batches]),
+            _concatenate([batch.intensity for batch in batches]),
+            np.concatenate(offsets),
+            metadata,
+        )
+
+    def save(self, path: Union[str, Path]):
+        """
+        Store the batch in an uncompressed npz file.
+
+        :param path: path to the npz file
+        """
+        arrays = {col: self.metadata[col].to_numpy() for col in META_DATA_COLUMNS}
+        for col in CATEGORICAL_COLUMNS:
+            arrays[col] = arrays[col].astype(str)
+        with open(path, "wb") as fh:
+            np.savez(fh, mz=self.mz, intensity=self.intensity, offsets=self.offsets, **arrays)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "SpectrumBatch":
+        """
+        Load a batch stored with ``save``.
+
+        :param path: path to the npz file
+        :return: the stored SpectrumBatch
+        """
+        with np.load(path, allow_pickle=False) as data:
+            metadata = pd.DataFrame({col: data[col] for col in META_DATA_COLUMNS})
+            return cls(data["mz"], data["intensity"], data["offsets"], metadata)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Convert the batch to the dataframe layout returned by MSRaw.read_mzml.
+
+        The per-row arrays are views into the flat arrays of this batch, no peaks are copied.
+
+        :return: dataframe with the columns in MZML_DATA_COLUMNS
+        """
+        df = self.metadata.copy()
+        for col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype(object)
+        df["INTENSITIES"] = split_peaks(self.intensity, self.offsets)
+        df["MZ"] = split_peaks(self.mz, self.offsets)
+        df.index = df["RAW_FILE"].astype(str) + "_" + df["SCAN_NUMBER"].astype(str)
+        return df[MZML_DATA_COLUMNS]
+
+
+def _concatenate(arrays: Sequence[np.ndarray]) -> np.ndarray:
+    if len(arrays) == 0:
+        return np.empty(0, dtype=np.float64)
+    return np.concatenate(arrays)
+
+
+def split_peaks(flat: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Split a flat peak array into one array per spectrum.
+
+    :param flat: the concatenated peaks of all spectra
+    :param offsets: the peaks of spectrum i are found between offsets[i] and offsets[i + 1]
+    :return: object array of views into flat, one per spectrum
+    """
+    # fill an object array element-wise, otherwise numpy stacks equally sized spectra into a 2D array
+    spectra = np.empty(len(offsets) - 1, dtype=object)
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        spectra[i] = flat[start:end]
+    return spectra
@@ -1,13 +1,35 @@
+import json
 import logging
+import os
+import shutil
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 from pathlib import Path
 from sys import platform
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from .msraw import MSRaw
+import numpy as np
+import pandas as pd
+
+from .conversion_manifest import ConversionManifest
+from .msraw import MSRaw, parse_filter_string
+from .mzml_decoder import FILTER_STRING, SCAN_START_TIME
+from .peak_filter import PeakFilter
+from .spectra_cache import SpectraCache
 
 logger = logging.getLogger(__name__)
 
+THERMO_RAW_FILE_PARSER = Path(__file__).parent.absolute() / "utils/ThermoRawFileParser/ThermoRawFileParser.exe"
+
+SCAN_NUMBER = "MS:1008025"
+
+# output format of the parser mapped to its file extension and the value of the --format option
+OUTPUT_FORMATS = {"mzml": (".mzML", None), "mgf": (".mgf", "0"), "parquet": (".parquet", "3")}
+
 
 def _type_check(var: Any, varname: str, types: Union[type, Tuple[type, ...]]):
     if isinstance(var, types):
@@ -20,25 +42,247 @@ def _type_check(var: Any, varname: str, types: Union[type, Tuple[type, ...]]):
     raise TypeError(f"{varname} must be of type {possible_types_str}")
 
 
-def _assemble_arg_list(input_path: Path, output_path: Path, ms_level: List[int], gzip: bool) -> List[Union[str, Path]]:
-    exec_path = Path(__file__).parent.absolute()  # get path of parent directory of this file
-    exec_path /= "utils/ThermoRawFileParser/ThermoRawFileParser.exe"
-    exec_arg_list: List[Union[str, Path]] = [
-        exec_path,
+def _check_output_format(output_format: str) -> str:
+    _type_check(output_format, "output_format", str)
+    output_format = output_format.lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {list(OUTPUT_FORMATS)}. Got {output_format}")
+    return output_format
+
+
+def _output_suffix(output_format: str, gzip: bool) -> str:
+    extension = OUTPUT_FORMATS[output_format][0]
+    return f"{extension}.gz" if gzip else extension
+
+
+def _check_ms_level(ms_level: Union[int, List[int]]) -> List[int]:
+    _type_check(ms_level, "ms_level", (int, list))
+    if isinstance(ms_level, int):
+        ms_level = [ms_level]
+    for level in ms_level:
+        _type_check(level, "all ms_levels in list", int)
+        if not 1 <= level <= 3:
+            raise ValueError(f"Value of all ms_levels must be within [1,3]. Got {level}")
+    return ms_level
+
+
+def _assemble_arg_list(
+    input_path: Path,
+    output_path: Path,
+    ms_level: List[int],
+    gzip: bool,
+    executable: Optional[Union[str, Path]] = None,
+    directory_mode: bool = False,
+    output_format: str = "mzml",
+) -> List[Union[str, Path]]:
+    exec_arg_list = _parser_command(executable) + [
         f"--msLevel={','.join([str(l) for l in ms_level])}",
-        "-i",
+        "-d" if directory_mode else "-i",
         input_path,
-        "-b",
+        "-o" if directory_mode else "-b",
         output_path,
     ]
+    format_arg = OUTPUT_FORMATS[output_format][1]
+    if format_arg is not None:
+        exec_arg_list.append(f"--format={format_arg}")
     if gzip:
         exec_arg_list.append("-g")
-    if "linux" in platform or platform == "darwin":
-        exec_arg_list.insert(0, "mono")
 
     return exec_arg_list
 
 
+def _assemble_query_arg_list(
+    input_path: Path, output_path: Path, scan_numbers: List[int], executable: Optional[Union[str, Path]] = None
+) -> List[Union[str, Path]]:
+    return _parser_command(executable) + [
+        "query",
+        "-i",
+        input_path,
+        "-n",
+        _format_scan_ranges(scan_numbers),
+        "-b",
+        output_path,
+    ]
+
+
+def _parser_command(executable: Optional[Union[str, Path]] = None) -> List[Union[str, Path]]:
+    exec_path = Path(executable) if executable is not None else THERMO_RAW_FILE_PARSER
+    # only the .NET executable needs mono, this allows to replace the parser by a native executable or script
+    if exec_path.suffix == ".exe" and ("linux" in platform or platform == "darwin"):
+        return ["mono", exec_path]
+    return [exec_path]
+
+
+def _format_scan_ranges(scan_numbers: List[int]) -> str:
+    """
+    Format sorted scan numbers as the comma separated list of scans and scan ranges expected by the parser.
+
+    :param scan_numbers: sorted and unique scan numbers
+    :return: the scan list, e.g. "1-3,7,10-11"
+    """
+    ranges = []
+    start = end = scan_numbers[0]
+    for scan_number in scan_numbers[1:] + [None]:
+        if scan_number is not None and scan_number == end + 1:
+            end = scan_number
+            continue
+        ranges.append(str(start) if start == end else f"{start}-{end}")
+        if scan_number is not None:
+            start = end = scan_number
+    return ",".join(ranges)
+
+
+def _conversion_parameters(ms_level: List[int], gzip: bool, output_format: str) -> Dict[str, Any]:
+    return {"ms_level": sorted(ms_level), "gzip": gzip, "output_format": output_format}
+
+
+def _run_parser(exec_arg_list: List[Union[str, Path]]):
+    logger.info(f"Running ThermoRawFileParser with the command: {' '.join([str(arg) for arg in exec_arg_list])}")
+    subprocess.run(exec_arg_list, shell=False, check=True)
+
+
+def _convert_file(
+    input_path: Path,
+    output_path: Path,
+    ms_level: List[int],
+    gzip: bool,
+    executable: Optional[Union[str, Path]],
+    output_format: str = "mzml",
+) -> Path:
+    """
+    Convert a single raw file, writing to a temporary file that is renamed to output_path once the parser succeeded.
+
+    :param input_path: file path of the Thermo Rawfile
+    :param output_path: file path of the converted file
+    :param ms_level: list of ms levels to convert
+    :param gzip: whether to gzip the file
+    :param executable: path to the ThermoRawFileParser executable
+    :param output_format: output format of the parser, one of OUTPUT_FORMATS
+    :raises FileNotFoundError: if the parser did not create the output file
+    :return: output_path
+    """
+    manifest = ConversionManifest(output_path)
+    parameters = _conversion_parameters(ms_level, gzip, output_format)
+    with manifest.lock():
+        if manifest.is_current(input_path, parameters):
+            logger.info(f"Found converted file at {output_path}, skipping conversion")
+            return output_path
+        # the temporary file keeps the suffix, so the parser does not append another extension, except that it may
+        # append .gz to gzipped files regardless of the given name
+        tmp_path = output_path.with_name(f".{os.getpid()}-{threading.get_ident()}.tmp.{output_path.name}")
+        candidates = [tmp_path, tmp_path.with_name(f"{tmp_path.name}.gz")]
+        try:
+            _run_parser(_assemble_arg_list(input_path, tmp_path, ms_level, gzip, executable, False, output_format))
+            converted_path = next((path for path in candidates if path.is_file()), None)
+            if converted_path is None:
+                raise FileNotFoundError(f"ThermoRawFileParser did not create {tmp_path}")
+            manifest.invalidate()
+            os.replace(converted_path, output_path)
+            manifest.write(input_path, parameters)
+        finally:
+            for path in candidates:
+                if path.is_file():
+                    path.unlink()  # never leave a partially written file behind
+    return output_path
+
+
+def _convert_directory(
+    input_paths: List[Path],
+    output_paths: List[Path],
+    ms_level: List[int],
+    gzip: bool,
+    executable: Optional[Union[str, Path]],
+    output_format: str = "mzml",
+) -> List[Path]:
+    """
+    Convert multiple raw files with a single parser process using its directory mode.
+
+    The raw files are linked into a temporary input directory, so that only the requested files are converted, and
+    the results are written to a temporary output directory next to the final files. Each converted file is renamed
+    into place once the parser succeeded.
+
+    :param input_paths: file paths of the Thermo Rawfiles
+    :param output_paths: file paths of the converted files in the same order as input_paths
+    :param ms_level: list of ms levels to convert
+    :param gzip: whether to gzip the files
+    :param executable: path to the ThermoRawFileParser executable
+    :param output_format: output format of the parser, one of OUTPUT_FORMATS
+    :return: output_paths
+    """
+    parameters = _conversion_parameters(ms_level, gzip, output_format)
+    manifests = [ConversionManifest(output_path) for output_path in output_paths]
+    with ExitStack() as stack:
+        # acquiring the locks in a fixed order prevents deadlocks between overlapping groups
+        for manifest in sorted(manifests, key=lambda m: str(m.output_path)):
+            stack.enter_context(manifest.lock())
+        pending = [
+            (input_path, manifest)
+            for input_path, manifest in zip(input_paths, manifests)
+            if not manifest.is_current(input_path, parameters)
+        ]
+        if pending:
+            _run_parser_on_directory([p for p, _ in pending], [m for _, m in pending], parameters, executable)
+    return output_paths
+
+
+def _run_parser_on_directory(
+    input_paths: List[Path],
+    manifests: List[ConversionManifest],
+    parameters: Dict[str, Any],
+    executable: Optional[Union[str, Path]],
+):
+    """
+    Convert raw files with a single parser process and move the results to the locked output files.
+
+    :param input_paths: file paths of the Thermo Rawfiles
+    :param manifests: the manifests of the output files in the same order as input_paths
+    :param parameters: the conversion parameters
+    :param executable: path to the ThermoRawFileParser executable
+    :raises FileNotFoundError: if the parser did not create an output file for one of the raw files
+    """
+    ms_level, gzip, output_format = parameters["ms_level"], parameters["gzip"], parameters["output_format"]
+    with tempfile.TemporaryDirectory(prefix=".raw-") as input_dir, tempfile.TemporaryDirectory(
+        prefix=".mzml-", dir=manifests[0].output_path.parent
+    ) as output_dir:
+        for input_path in input_paths:
+            _stage_file(input_path.absolute(), Path(input_dir) / input_path.name)
+        _run_parser(
+            _assemble_arg_list(Path(input_dir), Path(output_dir), ms_level, gzip, executable, True, output_format)
+        )
+        converted_paths = []
+        suffix = _output_suffix(output_format, gzip)
+        for input_path in input_paths:
+            converted_path = Path(output_dir) / f"{input_path.stem}{suffix}"
+            if not converted_path.is_file():
+                raise FileNotFoundError(f"ThermoRawFileParser did not create a {suffix} file for {input_path}")
+            converted_paths.append(converted_path)
+        for input_path, converted_path, manifest in zip(input_paths, converted_paths, manifests):
+            manifest.invalidate()
+            os.replace(converted_path, manifest.output_path)
+            manifest.write(input_path, parameters)
+
+
+def _stage_file(source: Path, target: Path):
+    """
+    Make a file available at another path, without copying it if possible.
+
+    Creating symlinks requires special privileges on Windows, so hardlinks are used instead if that fails and a copy
+    if the target is on another file system.
+
+    :param source: path to the existing file
+    :param target: path at which the file is made available
+    """
+    try:
+        os.symlink(source, target)
+        return
+    except OSError:
+        pass
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
 class ThermoRaw(MSRaw):
     """Main to convert a ThermoRaw file into mzml file."""
 
@@ -48,52 +292,251 @@ class ThermoRaw(MSRaw):
         gzip: bool = False,
         ms_level: Union[int, List[int]] = 2,
         output_path: Optional[Union[Path, str]] = None,
+        executable: Optional[Union[Path, str]] = None,
+        output_format: str = "mzml",
     ) -> Path:
         """Converts a ThermoRaw file to mzML.
 
-        Use https://github.com/compomics/ThermoRawFileParser for conversion.
+        Use https://github.com/compomics/ThermoRawFileParser for conversion. The parser can also write mgf or parquet
+        files directly, which can be read with ``MSRaw.read_mgf`` and ``MSRaw.read_parquet`` without the
+        overhead of writing and parsing xml.
+
+        An existing output file is only reused if its ``ConversionManifest`` shows that it was converted from the
+        current raw file with the same parameters and has not been truncated or modified since. Concurrent conversions
+        of the same output file, e.g. by several cluster jobs, are serialized with a lock file.
+
+        Raises subprocess.CalledProcessError if the parser failed and ValueError if ms_level contains levels other
+        than 1, 2 or 3 or the output format is not supported.
 
         :param input_path: file path of the Thermo Rawfile
         :param gzip: whether to gzip the file
         :param ms_level: level of MS, can be a single integer (1, 2, 3) or any combination of that provided as a list
-        :param output_path: file path of the mzML path
-        :raises subprocess.CalledProcessError: if the subprocess for conversion failed
-        :raises ValueError: if ms_level(s) provided are other than 1, 2 or 3.
+        :param output_path: file path of the mzML path. If gzip is set, .gz is appended unless the path already ends
+            with it. Default: the raw file path with the extension of the format
+        :param executable: path to the ThermoRawFileParser executable. Default: the bundled ThermoRawFileParser.exe
+        :param output_format: output format, either "mzml", "mgf" or "parquet". Default: "mzml"
         :return: path to converted file as string
         """
         _type_check(input_path, "input_path", (Path, str))
         input_path = Path(input_path)
+        output_format = _check_output_format(output_format)
         if output_path is None:
-            output_path = input_path.with_suffix(".mzML")
+            output_path = input_path.with_name(input_path.stem + _output_suffix(output_format, gzip))
         _type_check(output_path, "output_path", (Path, str))
         output_path = Path(output_path)
+        if gzip and output_path.suffix != ".gz":
+            # readers recognize gzipped files by their suffix
+            output_path = output_path.with_name(f"{output_path.name}.gz")
 
-        _type_check(ms_level, "ms_level", (int, list))
-        if isinstance(ms_level, int):
-            ms_level = [ms_level]
-        for level in ms_level:
-            _type_check(level, "all ms_levels in list", int)
-            if not 1 <= level <= 3:
-                raise ValueError(f"Value of all ms_levels must be within [1,3]. Got {level}")
+        ms_level = _check_ms_level(ms_level)
 
-        if output_path.is_file():
-            logger.info(f"Found converted file at {output_path}, skipping conversion")
-            return output_path
+        return _convert_file(input_path, output_path, ms_level, gzip, executable, output_format)
 
-        exec_arg_list = _assemble_arg_list(input_path, output_path, ms_level, gzip)
+    @staticmethod
+    def convert_raw_mzml_batch(
+        input_paths: Sequence[Union[Path, str]],
+        output_dir: Optional[Union[Path, str]] = None,
+        gzip: bool = False,
+        ms_level: Union[int, List[int]] = 2,
+        max_workers: Optional[int] = None,
+        directory_mode: bool = False,
+        executable: Optional[Union[Path, str]] = None,
+        executor: Optional[Executor] = None,
+        output_format: str = "mzml",
+    ) -> Dict[Path, "Future[Path]"]:
+        """Converts multiple ThermoRaw files to mzML concurrently.
 
-        logger.info(
-            f"Converting thermo rawfile to mzml with the command: {' '.join([str(arg) for arg in exec_arg_list])}"
-        )
+        The conversions are scheduled on a thread pool, each thread waiting for one ThermoRawFileParser process, so at
+        most max_workers files are converted at the same time. In directory mode, the files are instead split into at
+        most max_workers groups and each group is converted by a single parser process, paying the startup cost of
+        the parser only once per group. Converted files are written to temporary files first and atomically renamed
+        into place, so an existing output file is always complete. Files with an output that is current according
+        to its ``ConversionManifest`` are skipped, all others are converted again.
 
-        try:
-            subprocess.run(exec_arg_list, shell=False, check=True)
-        except subprocess.CalledProcessError:
-            if output_path.is_file():
-                output_path.unlink()
-            raise  # reraise only after removing a corrupted file
+        This function returns immediately. Use concurrent.futures.wait or as_completed on the returned futures to
+        wait for the conversions or to report progress, or add a done callback to the futures.
+
+        :param input_paths: file paths of the Thermo Rawfiles
+        :param output_dir: directory of the converted files. Default: the directory of each raw file
+        :param gzip: whether to gzip the files, which get the suffix .gz
+        :param ms_level: level of MS, can be a single integer (1, 2, 3) or any combination of that provided as a list
+        :param max_workers: maximum number of concurrent parser processes. Default: number of CPUs
+        :param directory_mode: whether to convert groups of files with a single parser process
+        :param executable: path to the ThermoRawFileParser executable. Default: the bundled ThermoRawFileParser.exe
+        :param executor: optional executor to schedule the conversions on instead of a new thread pool
+        :param output_format: output format, either "mzml", "mgf" or "parquet". Default: "mzml"
+        :return: dictionary mapping each raw file path to a future resolving to the path of the converted file. The
+            future raises subprocess.CalledProcessError if the conversion failed.
+        """
+        ms_level = _check_ms_level(ms_level)
+        output_format = _check_output_format(output_format)
+        parameters = _conversion_parameters(ms_level, gzip, output_format)
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if output_dir is not None:
+            _type_check(output_dir, "output_dir", (Path, str))
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        futures: Dict[Path, Future] = {}
+        pending: Dict[Path, List[Tuple[Path, Path]]] = {}
+        for input_path in input_paths:
+            _type_check(input_path, "input_path", (Path, str))
+            input_path = Path(input_path)
+            output_dir_of_file = Path(output_dir) if output_dir is not None else input_path.parent
+            output_path = output_dir_of_file / f"{input_path.stem}{_output_suffix(output_format, gzip)}"
+            future: Future = Future()
+            futures[input_path] = future
+            # checked again by the worker while holding the lock of the output file
+            if ConversionManifest(output_path).is_current(input_path, parameters):
+                logger.info(f"Found converted file at {output_path}, skipping conversion")
+                future.set_result(output_path)
+            else:
+                pending.setdefault(output_path.parent, []).append((input_path, output_path))
+
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            shutdown = True
+        else:
+            shutdown = False
+        for file_pairs in pending.values():
+            num_groups = min(max_workers, len(file_pairs)) if directory_mode else len(file_pairs)
+            for i in range(num_groups):
+                group = file_pairs[i::num_groups]
+                task = executor.submit(_convert_group, group, ms_level, gzip, executable, directory_mode, output_format)
+                task.add_done_callback(partial(_resolve_group, futures=[futures[p] for p, _ in group]))
+        if shutdown:
+            executor.shutdown(wait=False)  # running conversions finish, the threads exit afterwards
+        return futures
 
-        return output_path
+    @staticmethod
+    def read_scans(
+        input_path: Union[Path, str],
+        scan_numbers: Sequence[int],
+        cache: Optional[SpectraCache] = None,
+        peak_filter: Optional[PeakFilter] = None,
+        executable: Optional[Union[Path, str]] = None,
+    ) -> pd.DataFrame:
+        """Reads selected scans of a ThermoRaw file without converting the whole file.
+
+        Uses the query mode of ThermoRawFileParser, which extracts only the requested scans as json. The result has
+        the layout of ``MSRaw.read_mzml``, with the mass analyzer, fragmentation method and m/z range parsed from
+        the filter string of each scan. Like read_mzml, only MS2 and higher scans are returned, requested MS1 scans
+        are skipped. If a cache is given, the spectra are stored per raw file and scan set, so repeated queries for
+        the same scans do not start the parser again. Raises subprocess.CalledProcessError if the parser failed.
+
+        :param input_path: file path of the Thermo Rawfile
+        :param scan_numbers: the scan numbers to extract
+        :param cache: optional cache of parsed spectra. Default: None
+        :param peak_filter: optional preprocessing applied to the peaks of each spectrum. Default: None
+        :param executable: path to the ThermoRawFileParser executable. Default: the bundled ThermoRawFileParser.exe
+        :return: pd.DataFrame with intensities and m/z values of the requested scans, ordered by scan number
+        """
+        _type_check(input_path, "input_path", (Path, str))
+        input_path = Path(input_path)
+        scan_numbers = sorted({int(scan_number) for scan_number in scan_numbers})
+        if not scan_numbers:
+            return MSRaw._to_dataframe({})
+        options = {"query": scan_numbers, "peak_filter": repr(peak_filter)}
+        if cache is not None:
+            df = cache.get(input_path, options)
+            if df is not None:
+                return df
+
+        with tempfile.TemporaryDirectory(prefix=".query-") as tmp_dir:
+            output_path = Path(tmp_dir) / f"{input_path.stem}.json"
+            _run_parser(_assemble_query_arg_list(input_path, output_path, scan_numbers, executable))
+            with open(output_path) as fh:
+                spectra = json.load(fh)
+        scans = _iter_query_scans(spectra, input_path.stem)
+        df = MSRaw._to_dataframe(dict(MSRaw._filter_peaks(scans, peak_filter)))
+        df.sort_values("SCAN_NUMBER", inplace=True, kind="stable")
+        if cache is not None:
+            cache.put(input_path, options, df)
+        return df
+
+
+def _iter_query_scans(spectra: List[Dict[str, Any]], file_name: str) -> Iterator[Tuple[str, List[Any]]]:
+    """
+    Convert the spectra returned by the query mode of ThermoRawFileParser to records of MS2 and higher scans.
+
+    The spectra follow the PROXI format, with the metadata given as list of cv attributes. The scan number is taken
+    from the scan number attribute or, if it is missing, from the end of the USI of the spectrum.
+
+    :param spectra: the parsed json output of the parser
+    :param file_name: name of the raw file
+    :yield: tuples of a unique key and the spectrum record in the order of MZML_DATA_COLUMNS
+    """
+    for spectrum in spectra:
+        attributes = {}
+        for attribute in spectrum.get("attributes", []):
+            attributes[attribute.get("accession")] = attribute.get("value")
+            attributes[attribute.get("name")] = attribute.get("value")
+        filter_string = attributes.get(FILTER_STRING, "")
+        if "@" not in filter_string:  # MS1 scans are not fragmented
+            continue
+        scan_number = attributes.get(SCAN_NUMBER, attributes.get("scan number"))
+        if scan_number is None:
+            scan_number = spectrum["usi"].rsplit(":", 1)[-1]
+        scan_number = int(scan_number)
+        fragmentation, mz_range = parse_filter_string(filter_string)
+        yield f"{file_name}_{scan_number}", [
+            file_name,
+            scan_number,
+            np.asarray(spectrum.get("intensities", []), dtype=float),
+            np.asarray(spectrum.get("mzs", []), dtype=float),
+            mz_range,
+            float(attributes.get(SCAN_START_TIME, np.nan)),
+            filter_string.split()[0],
+            fragmentation,
+        ]
+
+
+def _convert_group(
+    file_pairs: List[Tuple[Path, Path]],
+    ms_level: List[int],
+    gzip: bool,
+    executable: Optional[Union[str, Path]],
+    directory_mode: bool,
+    output_format: str = "mzml",
+) -> List[Path]:
+    """
+    Convert a group of raw files, either with a single parser process in directory mode or one after another.
+
+    :param file_pairs: list of tuples of the raw file path and the converted file path
+    :param ms_level: list of ms levels to convert
+    :param gzip: whether to gzip the files
+    :param executable: path to the ThermoRawFileParser executable
+    :param directory_mode: whether to use the directory mode of the parser
+    :param output_format: output format of the parser, one of OUTPUT_FORMATS
+    :return: paths of the converted files in the order of file_pairs
+    """
+    if directory_mode:
+        input_paths, output_paths = (list(paths) for paths in zip(*file_pairs))
+        return _convert_directory(input_paths, output_paths, ms_level, gzip, executable, output_format)
+    return [
+        _convert_file(input_path, output_path, ms_level, gzip, executable, output_format)
+        for input_path, output_path in file_pairs
+    ]
+
+
+def _resolve_group(task: Future, futures: List[Future]):
+    """
+    Propagate the result of a conversion task to the futures of the converted files.
+
+    :param task: the finished conversion task
+    :param futures: the futures of the files converted by the task in the same order as its result
+    """
+    if task.cancelled():
+        for future in futures:
+            future.cancel()
+        return
+    exception = task.exception()
+    if exception is not None:
+        for future in futures:
+            future.set_exception(exception)
+        return
+    for future, output_path in zip(futures, task.result()):
+        future.set_result(output_path)
 
 
 if __name__ == "__main__":
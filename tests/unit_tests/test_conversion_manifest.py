@@ -0,0 +1,203 @@
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from spectrum_io.raw.conversion_manifest import ConversionManifest, FileLock
+
+
+class TestConversionManifest:
+    """Class to test the manifest deciding about the reuse of converted files."""
+
+    def test_is_current(self, input_file: Path, output_file: Path):
+        """
+        Test that the manifest matches only the recorded input, output and parameters.
+
+        :param input_file: path to an input file
+        :param output_file: path to an output file
+        """
+        manifest = ConversionManifest(output_file)
+        assert not manifest.is_current(input_file, {"ms_level": [2]})
+        manifest.write(input_file, {"ms_level": [2]})
+        assert manifest.path == output_file.with_name("run.mzML.manifest.json")
+        assert manifest.is_current(input_file, {"ms_level": [2]})
+        assert not manifest.is_current(input_file, {"ms_level": [1, 2]})
+        output_file.write_text("<mzML>")
+        assert not manifest.is_current(input_file, {"ms_level": [2]})
+
+    def test_is_current_copied(self, input_file: Path, output_file: Path, tmp_path: Path):
+        """
+        Test that files with a different modification time but the same content are accepted.
+
+        :param input_file: path to an input file
+        :param output_file: path to an output file
+        :param tmp_path: temporary directory
+        """
+        ConversionManifest(output_file).write(input_file, {})
+        os.utime(output_file, ns=(0, 0))
+        assert ConversionManifest(output_file).is_current(input_file, {})
+        output_file.write_text("<mzML></mzMl>")  # same size, different content
+        os.utime(output_file, ns=(0, 0))
+        assert not ConversionManifest(output_file).is_current(input_file, {})
+
+    def test_invalid_manifest(self, input_file: Path, output_file: Path):
+        """
+        Test that unreadable or removed manifests mark the output as not reusable.
+
+        :param input_file: path to an input file
+        :param output_file: path to an output file
+        """
+        manifest = ConversionManifest(output_file)
+        manifest.path.write_text("{")
+        assert not manifest.is_current(input_file, {})
+        manifest.write(input_file, {})
+        manifest.invalidate()
+        assert not manifest.is_current(input_file, {})
+
+
+class TestFileLock:
+    """Class to test the lock file used to serialize conversions."""
+
+    def test_lock_serializes(self, tmp_path: Path):
+        """
+        Test that a second lock waits until the first one is released.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        events = []
+        with FileLock(lock_path):
+            thread = threading.Thread(target=lambda: events.append(FileLock(lock_path, poll_interval=0.01).acquire()))
+            thread.start()
+            time.sleep(0.1)
+            assert not events
+        thread.join()
+        assert events == [None]
+        assert lock_path.is_file()
+
+    def test_lock_timeout(self, tmp_path: Path):
+        """
+        Test that waiting for a lock held by another host times out.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        lock_path.write_text(f"other-{socket.gethostname()} {os.getpid()} token")
+        with pytest.raises(TimeoutError):
+            FileLock(lock_path, timeout=0.05, poll_interval=0.01).acquire()
+
+    @pytest.mark.skipif(os.name != "posix", reason="stale locks are only detected on posix systems")
+    def test_stale_lock(self, tmp_path: Path):
+        """
+        Test that a lock of a process that no longer exists is removed.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        lock_path.write_text(f"{socket.gethostname()} {2**22 + 1}")
+        with FileLock(lock_path, timeout=1):
+            assert lock_path.read_text().startswith(f"{socket.gethostname()} {os.getpid()} ")
+        assert not lock_path.exists()
+
+    def test_empty_lock(self, tmp_path: Path):
+        """
+        Test that an empty lock times out while fresh and is removed once it is older than stale_after.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        lock_path.touch()
+        with pytest.raises(TimeoutError):
+            FileLock(lock_path, timeout=0.05, poll_interval=0.01).acquire()
+        _age(lock_path, 120)
+        with FileLock(lock_path, timeout=1, stale_after=60):
+            assert lock_path.read_text()
+
+    def test_old_foreign_lock(self, tmp_path: Path):
+        """
+        Test that a lock of another host is removed once it was not refreshed for stale_after seconds.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        lock_path.write_text(f"other-{socket.gethostname()} 1 token")
+        _age(lock_path, 120)
+        with FileLock(lock_path, timeout=1, stale_after=60):
+            assert lock_path.read_text().startswith(socket.gethostname())
+
+    def test_refresh(self, tmp_path: Path):
+        """
+        Test that a held lock is refreshed and therefore not removed by waiters.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        with FileLock(lock_path, stale_after=0.2):
+            with pytest.raises(TimeoutError):
+                FileLock(lock_path, timeout=0.5, poll_interval=0.01, stale_after=0.2).acquire()
+        assert not lock_path.exists()
+
+    def test_concurrent_stale_takeover(self, tmp_path: Path):
+        """
+        Test that waiters racing for a stale lock hold it one at a time.
+
+        :param tmp_path: temporary directory
+        """
+        lock_path = tmp_path / "run.mzML.lock"
+        lock_path.write_text(f"other-{socket.gethostname()} 1 token")
+        _age(lock_path, 120)
+        holders = []
+        max_holders = []
+        guard = threading.Lock()
+
+        def hold():
+            with FileLock(lock_path, timeout=5, poll_interval=0.001, stale_after=60):
+                with guard:
+                    holders.append(None)
+                    max_holders.append(len(holders))
+                time.sleep(0.01)
+                with guard:
+                    holders.pop()
+
+        threads = [threading.Thread(target=hold) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(max_holders) == 8
+        assert max(max_holders) == 1
+        assert not lock_path.exists()
+        assert not lock_path.with_name(lock_path.name + ".break").exists()
+
+    def test_default_timeout(self, tmp_path: Path):
+        """
+        Test that waiting for the lock of a manifest is bounded by default.
+
+        :param tmp_path: temporary directory
+        """
+        lock = ConversionManifest(tmp_path / "run.mzML").lock()
+        assert lock.timeout is not None
+
+
+def _age(path: Path, seconds: float):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def input_file(tmp_path: Path) -> Path:
+    """Create a raw file."""
+    path = tmp_path / "run.raw"
+    path.write_bytes(b"raw data")
+    return path
+
+
+@pytest.fixture
+def output_file(tmp_path: Path) -> Path:
+    """Create a converted file."""
+    path = tmp_path / "run.mzML"
+    path.write_text("<mzML></mzML>")
+    return path
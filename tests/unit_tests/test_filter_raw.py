@@ -0,0 +1,207 @@
+import gzip
+import hashlib
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pyteomics import mzml
+
+from spectrum_io.file import hdf5
+from spectrum_io.raw.filter_raw import SpectraFilter
+from spectrum_io.raw.msraw import MSRaw
+from spectrum_io.raw.scan_index import ScanIndex
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestRemoveSpectra:
+    """Class to test writing mzml files that only contain selected spectra."""
+
+    @pytest.mark.parametrize("gzipped", [False, True])
+    def test_remove_spectra(self, tmp_path: Path, mzml_path: Path, gzipped: bool):
+        """
+        Test that only the selected spectra are kept and that the result is a valid indexedmzML file.
+
+        :param tmp_path: temporary directory
+        :param mzml_path: path to a copy of the test mzml file
+        :param gzipped: whether to filter a gzipped copy of the file
+        """
+        if gzipped:
+            with gzip.open(mzml_path.with_suffix(".mzML.gz"), "wb") as f:
+                f.write(mzml_path.read_bytes())
+            mzml_path = mzml_path.with_suffix(".mzML.gz")
+        out_path = tmp_path / "filtered.mzML"
+        SpectraFilter.remove_spectra(mzml_path, out_path, [7, 2, 3, 3, 100])
+        content = out_path.read_bytes()
+
+        assert b'<spectrumList count="3"' in content
+        assert re.findall(rb'<spectrum\s[^>]*?\bindex="(\d+)"', content) == [b"0", b"1", b"2"]
+        checksum_end = content.index(b"<fileChecksum>") + len(b"<fileChecksum>")
+        assert (
+            content[checksum_end : checksum_end + 40]
+            == hashlib.sha1(content[:checksum_end], usedforsecurity=False).hexdigest().encode()
+        )
+
+        index = ScanIndex._from_index_list(out_path)
+        assert index.scan_numbers.tolist() == [2, 3, 7]
+        assert index.offsets.tolist() == ScanIndex._from_scan(out_path).offsets.tolist()
+        with mzml.PreIndexedMzML(str(out_path)) as reader:
+            assert len(reader) == 3
+            assert reader.get_by_id("controllerType=0 controllerNumber=1 scan=7")["ms level"] == 2
+
+        expected_df = MSRaw.read_mzml(mzml_path, scanidx=[2, 3, 7])
+        df = MSRaw.read_mzml(out_path)
+        assert df["SCAN_NUMBER"].tolist() == [2, 3, 7]
+        assert df["RETENTION_TIME"].tolist() == expected_df["RETENTION_TIME"].tolist()
+
+    def test_remove_all_spectra(self, tmp_path: Path, mzml_path: Path):
+        """
+        Test that the output is valid if no spectrum is kept.
+
+        :param tmp_path: temporary directory
+        :param mzml_path: path to a copy of the test mzml file
+        """
+        out_path = tmp_path / "filtered.mzML"
+        SpectraFilter.remove_spectra(mzml_path, out_path, [])
+        content = out_path.read_bytes()
+        assert b'<spectrumList count="0"' in content
+        assert b"<spectrum " not in content
+        assert len(ScanIndex._from_index_list(out_path)) == 0
+        assert content.endswith(b"</indexedmzML>\n")
+
+
+class TestSpectraFilter:
+    """Class to test filtering the unmatched spectra of a directory."""
+
+    def test_get_matched_spectra(self, mzml_dir: Path, msms_file: Path):
+        """
+        Test that matched scans are grouped by raw file.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt matching different scans in both files
+        """
+        spectra_filter = SpectraFilter(mzml_dir, msms_file)
+        assert spectra_filter.get_matched_spectra() == {"run_a": {2, 3}, "run_b": {4, 12}, "run_x": {2}}
+
+    def test_get_unmatched_spectra(self, mzml_dir: Path, msms_file: Path):
+        """
+        Test that unmatched scans are determined per raw file.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt matching different scans in both files
+        """
+        assert SpectraFilter(mzml_dir, msms_file).get_unmatched_spectra() == {
+            "run_a": [4, 6, 7, 8, 10, 11, 12],
+            "run_b": [2, 3, 6, 7, 8, 10, 11],
+        }
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_filter_spectra(self, mzml_dir: Path, msms_file: Path, workers: int):
+        """
+        Test that each file only keeps its own unmatched MS2 spectra and that outputs are not filtered again.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt matching different scans in both files
+        :param workers: number of worker processes
+        """
+        SpectraFilter(mzml_dir, msms_file, workers=workers).filter_spectra()
+        df = MSRaw.read_mzml(mzml_dir / "run_a_unmatched_spectra.mzML")
+        assert df["SCAN_NUMBER"].tolist() == [4, 6, 7, 8, 10, 11, 12]
+        df = MSRaw.read_mzml(mzml_dir / "run_b_unmatched_spectra.mzML")
+        assert df["SCAN_NUMBER"].tolist() == [2, 3, 6, 7, 8, 10, 11]
+
+        SpectraFilter(mzml_dir, msms_file, workers=workers).filter_spectra()
+        assert not list(mzml_dir.glob("*_unmatched_spectra_unmatched_spectra.mzML"))
+
+    def test_process_mzml_directory(self, mzml_dir: Path, msms_file: Path):
+        """
+        Test that the spectra returned by get_unmatched_spectra or a list of scans are kept.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt matching different scans in both files
+        """
+        spectra_filter = SpectraFilter(mzml_dir, msms_file)
+        spectra_filter.process_mzml_directory(spectra_filter.get_unmatched_spectra())
+        df = MSRaw.read_mzml(mzml_dir / "run_b_unmatched_spectra.mzML")
+        assert df["SCAN_NUMBER"].tolist() == [2, 3, 6, 7, 8, 10, 11]
+
+        spectra_filter.process_mzml_directory([3, 7])
+        for raw_file in ["run_a", "run_b"]:
+            df = MSRaw.read_mzml(mzml_dir / f"{raw_file}_unmatched_spectra.mzML")
+            assert df["SCAN_NUMBER"].tolist() == [3, 7]
+
+    def test_filter_spectra_hdf5(self, mzml_dir: Path, msms_file: Path):
+        """
+        Test writing the unmatched spectra to hdf5 containers.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt matching different scans in both files
+        """
+        SpectraFilter(mzml_dir, msms_file, output_format="hdf5").filter_spectra()
+        df = hdf5.read_spectra(mzml_dir / "run_b_unmatched_spectra.hdf5")
+        assert df["SCAN_NUMBER"].tolist() == [2, 3, 6, 7, 8, 10, 11]
+        assert (df["RAW_FILE"] == "run_b").all()
+        assert (df["PRECURSOR_CHARGE"] == 2).all()
+        expected_df = MSRaw.read_mzml(mzml_dir / "run_a.mzML", scanidx=[2])
+        np.testing.assert_array_equal(df["MZ"].iloc[0], expected_df["MZ"].iloc[0])
+        np.testing.assert_array_equal(df["INTENSITIES"].iloc[0], expected_df["INTENSITIES"].iloc[0])
+
+    def test_filter_spectra_mgf(self, mzml_dir: Path, msms_file: Path):
+        """
+        Test writing the unmatched spectra to mgf files.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt matching different scans in both files
+        """
+        SpectraFilter(mzml_dir, msms_file, output_format="mgf").filter_spectra()
+        content = (mzml_dir / "run_a_unmatched_spectra.mgf").read_text()
+        assert content.count("BEGIN IONS") == content.count("END IONS") == 7
+        assert re.findall(r"SCANS=(\d+)", content) == ["4", "6", "7", "8", "10", "11", "12"]
+        assert "TITLE=run_a.4.4.2" in content
+        assert "PEPMASS=" in content and "CHARGE=2+" in content
+
+    def test_invalid_output_format(self, mzml_dir: Path, msms_file: Path):
+        """
+        Test that unsupported output formats are rejected.
+
+        :param mzml_dir: directory with two copies of the test mzml file
+        :param msms_file: path to a msms.txt
+        """
+        with pytest.raises(ValueError):
+            SpectraFilter(mzml_dir, msms_file, output_format="mzxml")
+
+
+@pytest.fixture
+def mzml_dir(tmp_path: Path) -> Path:
+    """Directory with an uncompressed and a gzipped copy of the test mzml file."""
+    mzml_dir = tmp_path / "mzml"
+    mzml_dir.mkdir()
+    shutil.copy(DATA_PATH / "test.mzML", mzml_dir / "run_a.mzML")
+    with gzip.open(mzml_dir / "run_b.mzML.gz", "wb") as f:
+        f.write((DATA_PATH / "test.mzML").read_bytes())
+    return mzml_dir
+
+
+@pytest.fixture
+def msms_file(tmp_path: Path) -> Path:
+    """msms.txt with matches in both files and in a raw file that is not part of the directory."""
+    file_path = tmp_path / "msms.txt"
+    file_path.write_text(
+        "Raw file\tScan number\tSequence\n"
+        "run_a\t2\tPEPA\n"
+        "run_b\t4\tPEPB\n"
+        "run_a\t3\tPEPC\n"
+        "run_b\t12\tPEPD\n"
+        "run_x\t2\tPEPE\n"
+    )
+    return file_path
+
+
+@pytest.fixture
+def mzml_path(tmp_path: Path) -> Path:
+    """Copy of the test mzml file, so that no scan index sidecar is written next to the original."""
+    file_path = tmp_path / "test.mzML"
+    shutil.copy(DATA_PATH / "test.mzML", file_path)
+    return file_path
@@ -0,0 +1,485 @@
+import threading
+from concurrent.futures import CancelledError
+from pathlib import Path
+from typing import Union
+
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+import scipy
+
+from spectrum_io.file import hdf5
+from spectrum_io.raw.msraw import MSRaw
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestSpectra:
+    """Class to test the ragged-array spectra container."""
+
+    def test_write_read_spectra(self, tmp_path: Path, raw_df: pd.DataFrame):
+        """
+        Test that streamed batches are read back as one dataframe.
+
+        :param tmp_path: temporary directory
+        :param raw_df: dataframe returned by read_mzml
+        """
+        path = tmp_path / "spectra.hdf5"
+        hdf5.write_spectra((raw_df.iloc[i : i + 4] for i in range(0, len(raw_df), 4)), path)
+        with h5py.File(path, "r") as f:
+            assert f[hdf5.MZ_RAW_KEY].shape == (raw_df["MZ"].apply(len).sum(),)
+            assert f["offsets"][-1] == f[hdf5.INTENSITY_RAW_KEY].shape[0]
+
+        df = hdf5.read_spectra(path)
+        assert list(df.columns) == list(raw_df.columns)
+        pd.testing.assert_frame_equal(
+            df.drop(columns=["MZ", "INTENSITIES"]),
+            raw_df.drop(columns=["MZ", "INTENSITIES"]).reset_index(drop=True),
+            check_dtype=False,
+        )
+        for col in ["MZ", "INTENSITIES"]:
+            for actual, expected in zip(df[col], raw_df[col]):
+                np.testing.assert_array_equal(actual, expected)
+
+    def test_write_spectra_groups(self, tmp_path: Path, raw_df: pd.DataFrame):
+        """
+        Test storing spectra of several raw files in separate groups of the same file.
+
+        :param tmp_path: temporary directory
+        :param raw_df: dataframe returned by read_mzml
+        """
+        path = tmp_path / "spectra.hdf5"
+        hdf5.write_spectra(raw_df.iloc[:3], path, group="run_a")
+        hdf5.write_spectra(raw_df.iloc[3:], path, group="run_b", mode="a")
+        hdf5.write_spectra([], path, group="run_c", mode="a")
+        assert len(hdf5.read_spectra(path, "run_a")) == 3
+        assert len(hdf5.read_spectra(path, "run_b")) == len(raw_df) - 3
+        assert len(hdf5.read_spectra(path, "run_c")) == 0
+        assert len(hdf5.read_spectra(path, "run_c", start=1, stop=3)) == 0
+
+        df = hdf5.read_spectra(path, "run_b", start=2, stop=4)
+        assert df["SCAN_NUMBER"].tolist() == raw_df["SCAN_NUMBER"].iloc[5:7].tolist()
+        for actual, expected in zip(df["MZ"], raw_df["MZ"].iloc[5:7]):
+            np.testing.assert_array_equal(actual, expected)
+
+
+class TestPartialRead:
+    """Class to test reading row ranges, column subsets and chunks."""
+
+    @pytest.mark.parametrize("sparse_layout,row_sorted", [("csr", True), ("coo", True), ("coo", False)])
+    def test_read_sparse_rows(
+        self, tmp_path: Path, matrix: scipy.sparse.csr_matrix, sparse_layout: str, row_sorted: bool
+    ):
+        """
+        Test reading row ranges and columns of a sparse group.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        :param sparse_layout: the layout of the sparse group
+        :param row_sorted: whether the entries are stored sorted by row
+        """
+        path = tmp_path / "sparse.hdf5"
+        index = [f"r{i}" for i in range(10)]
+        hdf5.write_dataset(matrix, path, "m", column_names=list("abcd"), index=index, sparse_layout=sparse_layout)
+        if not row_sorted:
+            with h5py.File(path, "a") as f:
+                order = np.random.default_rng(0).permutation(f["sparse_m/i"].shape[0])
+                for name in ["i", "j", "values"]:
+                    f[f"sparse_m/{name}"][:] = f[f"sparse_m/{name}"][:][order]
+                del f["sparse_m"].attrs["row_sorted"]
+        expected = pd.DataFrame(matrix.toarray(), columns=list("abcd"), index=[f"r{i}" for i in range(10)])
+
+        df = hdf5.read_file(path, "sparse_m", start=3, stop=7, columns=["d", "b"])
+        pd.testing.assert_frame_equal(df.sparse.to_dense(), expected.iloc[3:7][["d", "b"]], check_dtype=False)
+        pd.testing.assert_frame_equal(hdf5.read_file(path, "sparse_m").sparse.to_dense(), expected, check_dtype=False)
+        assert len(hdf5.read_file(path, "sparse_m", start=12)) == 0
+
+        chunks = list(hdf5.iter_file(path, "sparse_m", chunksize=4))
+        assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks).sparse.to_dense(), expected, check_dtype=False, check_index_type=False
+        )
+
+    @pytest.mark.parametrize("compression", ["gzip", "lzf"])
+    def test_write_sparse_compression(self, tmp_path: Path, compression: str):
+        """
+        Test that the csr layout uses compact dtypes and chunked, compressed datasets.
+
+        :param tmp_path: temporary directory
+        :param compression: the compression method
+        """
+        matrix = scipy.sparse.random(2000, 174, density=0.1, format="csr", random_state=0, dtype=np.float32)
+        hdf5.write_dataset(matrix, tmp_path / "coo.hdf5", "m", compression=None, sparse_layout="coo")
+        hdf5.write_dataset(matrix, tmp_path / "csr.hdf5", "m", compression=compression)
+        with h5py.File(tmp_path / "csr.hdf5", "r") as f:
+            group = f["sparse_m"]
+            assert group.attrs["layout"] == "csr"
+            assert group["indices"].dtype == np.int32 and group["data"].dtype == np.float32
+            assert group["indices"].compression == compression and group["indices"].chunks is not None
+        assert (tmp_path / "csr.hdf5").stat().st_size * 2 < (tmp_path / "coo.hdf5").stat().st_size
+        df = hdf5.read_file(tmp_path / "csr.hdf5", "sparse_m", start=100, stop=300)
+        np.testing.assert_array_equal(df.sparse.to_coo().toarray(), matrix[100:300].toarray())
+
+    def test_write_sparse_invalid_options(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix):
+        """
+        Test that unknown layouts and compression methods are rejected and blosc requires hdf5plugin.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        """
+        with pytest.raises(ValueError):
+            hdf5.write_dataset(matrix, tmp_path / "m.hdf5", "m", sparse_layout="csc")
+        with pytest.raises(ValueError):
+            hdf5.write_dataset(matrix, tmp_path / "m.hdf5", "m", compression="zip")
+        if hdf5.hdf5plugin is None:
+            with pytest.raises(ImportError):
+                hdf5.write_dataset(matrix, tmp_path / "m.hdf5", "m", compression="blosc:zstd")
+        else:
+            hdf5.write_dataset(matrix, tmp_path / "m.hdf5", "m", compression="blosc:zstd")
+            assert len(hdf5.read_file(tmp_path / "m.hdf5", "sparse_m")) == 10
+
+    def test_write_dataframe_compression(self, tmp_path: Path):
+        """
+        Test that dataframes are compressed by default and can be written without compression.
+
+        :param tmp_path: temporary directory
+        """
+        df = pd.DataFrame({"a": np.zeros(100000), "b": np.arange(100000)})
+        hdf5.write_dataset(df, tmp_path / "compressed.hdf5", "df")
+        hdf5.write_dataset(df, tmp_path / "uncompressed.hdf5", "df", compression=False)
+        assert (tmp_path / "compressed.hdf5").stat().st_size * 2 < (tmp_path / "uncompressed.hdf5").stat().st_size
+        pd.testing.assert_frame_equal(hdf5.read_file(tmp_path / "compressed.hdf5", "df"), df)
+
+    @pytest.mark.parametrize("hdf_format", ["fixed", "table"])
+    def test_read_pandas_rows(self, tmp_path: Path, hdf_format: str):
+        """
+        Test reading row ranges, columns and chunks of a pandas key.
+
+        :param tmp_path: temporary directory
+        :param hdf_format: the pandas storage format
+        """
+        df = pd.DataFrame({"a": np.arange(10), "b": np.arange(10) * 2.0, "c": list("abcdefghij")})
+        path = tmp_path / "df.hdf5"
+        hdf5.write_dataset(df, path, "df", compression=None, hdf_format=hdf_format, data_columns=["a"])
+        pd.testing.assert_frame_equal(hdf5.read_file(path, "df", start=2, stop=5, columns=["c"]), df.iloc[2:5][["c"]])
+        chunks = list(hdf5.iter_file(path, "df", chunksize=3, columns=["a", "b"]))
+        assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+        pd.testing.assert_frame_equal(pd.concat(chunks), df[["a", "b"]])
+        if hdf_format == "table":
+            pd.testing.assert_frame_equal(hdf5.read_file(path, "df", where="a > 6"), df[df["a"] > 6])
+            chunks = list(hdf5.iter_file(path, "df", chunksize=2, where="a > 4"))
+            pd.testing.assert_frame_equal(pd.concat(chunks), df[df["a"] > 4])
+        else:
+            with pytest.raises(ValueError):
+                hdf5.read_file(path, "df", where="a > 6")
+
+
+class TestReadSparse:
+    """Class to test reading sparse groups as scipy matrices."""
+
+    @pytest.mark.parametrize("sparse_layout", ["csr", "coo"])
+    def test_read_sparse(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix, sparse_layout: str):
+        """
+        Test reading all rows and row ranges with column names and index.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        :param sparse_layout: the layout of the sparse group
+        """
+        path = tmp_path / "sparse.hdf5"
+        index = [f"r{i}" for i in range(10)]
+        hdf5.write_dataset(matrix, path, "m", column_names=list("abcd"), index=index, sparse_layout=sparse_layout)
+
+        result, column_names, result_index = hdf5.read_sparse(path, "sparse_m")
+        assert isinstance(result, scipy.sparse.csr_matrix)
+        np.testing.assert_allclose(result.toarray(), matrix.toarray(), rtol=1e-6)
+        assert list(column_names) == list("abcd")
+        assert list(result_index) == index
+
+        result, _, result_index = hdf5.read_sparse(path, "sparse_m", start=3, stop=7)
+        np.testing.assert_allclose(result.toarray(), matrix[3:7].toarray(), rtol=1e-6)
+        assert list(result_index) == index[3:7]
+        assert hdf5.read_sparse(path, "sparse_m", start=12)[0].shape == (0, 4)
+
+    def test_read_sparse_without_names(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix):
+        """
+        Test that the stored dtypes are kept and missing column names and index are returned as None.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        """
+        hdf5.write_dataset(matrix, tmp_path / "sparse.hdf5", "m")
+        result, column_names, index = hdf5.read_sparse(tmp_path / "sparse.hdf5", "sparse_m", stop=-2)
+        assert result.dtype == np.float32 and result.shape == (8, 4)
+        assert column_names is None and index is None
+
+
+class TestAppendDataset:
+    """Class to test appending batches of rows to datasets."""
+
+    def test_append_sparse(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix):
+        """
+        Test that appended batches, including empty ones, are read back as one matrix.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        """
+        path = tmp_path / "append.hdf5"
+        index = [f"r{i}" for i in range(10)]
+        for start, stop in [(0, 0), (0, 4), (4, 4), (4, 10)]:
+            hdf5.append_dataset(matrix[start:stop], path, "m", column_names=list("abcd"), index=index[start:stop])
+        result, column_names, result_index = hdf5.read_sparse(path, "sparse_m")
+        np.testing.assert_allclose(result.toarray(), matrix.toarray())
+        assert list(column_names) == list("abcd")
+        assert list(result_index) == index
+        with h5py.File(path, "r") as f:
+            assert f["sparse_m/data"].maxshape == (None,) and f["sparse_m/data"].compression == "gzip"
+
+    def test_append_sparse_to_written_group(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix):
+        """
+        Test appending to groups written by write_dataset and rejecting incompatible batches.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        """
+        path = tmp_path / "append.hdf5"
+        hdf5.write_dataset(matrix, path, "m")
+        hdf5.append_dataset(matrix[:3], path, "m")
+        np.testing.assert_allclose(
+            hdf5.read_sparse(path, "sparse_m")[0].toarray(), scipy.sparse.vstack([matrix, matrix[:3]]).toarray()
+        )
+        with pytest.raises(ValueError):
+            hdf5.append_dataset(matrix[:, :2], path, "m")
+        with pytest.raises(ValueError):
+            hdf5.append_dataset(matrix[:3], path, "m", index=["a", "b", "c"])
+
+        hdf5.write_dataset(matrix, path, "coo", mode="a", sparse_layout="coo")
+        with pytest.raises(ValueError):
+            hdf5.append_dataset(matrix, path, "coo")
+
+    def test_append_dataframe(self, tmp_path: Path):
+        """
+        Test that dataframe batches are appended in table format, reserving space for longer strings.
+
+        :param tmp_path: temporary directory
+        """
+        path = tmp_path / "append.hdf5"
+        first = pd.DataFrame({"a": [1, 2], "sequence": ["PEPTIDE", "PEPTIDEK"]})
+        second = pd.DataFrame({"a": [3], "sequence": ["LONGERPEPTIDEK"]}, index=[2])
+        hdf5.append_dataset(first, path, "psms", min_itemsize={"sequence": 30})
+        hdf5.append_dataset(second, path, "psms")
+        pd.testing.assert_frame_equal(hdf5.read_file(path, "psms"), pd.concat([first, second]))
+
+    def test_write_file_keeps_all_datasets(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix):
+        """
+        Test that write_file replaces the file once instead of overwriting it with every dataframe.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        """
+        path = tmp_path / "out.hdf5"
+        path.write_text("outdated")
+        df = pd.DataFrame({"a": [1, 2, 3]})
+        hdf5.write_file([df, matrix, df], path, ["first", "m", "second"], [list("abcd")]).result()
+        pd.testing.assert_frame_equal(hdf5.read_file(path, "first"), df)
+        pd.testing.assert_frame_equal(hdf5.read_file(path, "second"), df)
+        assert hdf5.read_sparse(path, "sparse_m")[0].shape == (10, 4)
+
+    def test_write_file_sparse_keeps_file(self, tmp_path: Path, matrix: scipy.sparse.csr_matrix):
+        """
+        Test that write_file adds sparse datasets to an existing file like before, instead of replacing it.
+
+        :param tmp_path: temporary directory
+        :param matrix: sparse matrix with 10 rows and 4 columns
+        """
+        path = tmp_path / "out.hdf5"
+        df = pd.DataFrame({"a": [1, 2, 3]})
+        hdf5.write_file([df], path, ["first"]).result()
+        hdf5.write_file([matrix], path, ["m"], [list("abcd")]).result()
+        pd.testing.assert_frame_equal(hdf5.read_file(path, "first"), df)
+        assert hdf5.read_sparse(path, "sparse_m")[0].shape == (10, 4)
+
+
+class TestHDF5Writer:
+    """Class to test the background hdf5 writer service."""
+
+    def test_write_file(self, tmp_path: Path):
+        """
+        Test that writes to the same file are executed in order and the future resolves after writing.
+
+        :param tmp_path: temporary directory
+        """
+        df = pd.DataFrame({"a": [1, 2, 3]})
+        matrix = scipy.sparse.csr_matrix(np.eye(3))
+        with hdf5.HDF5Writer(num_threads=2) as writer:
+            first = writer.write_file([df], tmp_path / "out.hdf5", ["df"])
+            second = writer.submit(
+                tmp_path / "out.hdf5", hdf5.write_dataset, matrix, tmp_path / "out.hdf5", "m", mode="a"
+            )
+            assert first.result() is None and second.result() is None
+        pd.testing.assert_frame_equal(hdf5.read_file(tmp_path / "out.hdf5", "df"), df)
+        assert hdf5.read_file(tmp_path / "out.hdf5", "sparse_m").shape == (3, 3)
+
+    def test_write_file_error(self, tmp_path: Path):
+        """
+        Test that the exception of a failed write is raised by its future.
+
+        :param tmp_path: temporary directory
+        """
+        future = hdf5.write_file([np.zeros(3)], tmp_path / "out.hdf5", ["array"])
+        with pytest.raises(TypeError):
+            future.result()
+
+    def test_backpressure(self, tmp_path: Path):
+        """
+        Test that submitting blocks while the queue is full and that shutdown waits for all pending writes.
+
+        :param tmp_path: temporary directory
+        """
+        release = threading.Event()
+        finished = []
+        writer = hdf5.HDF5Writer(max_queue_size=1)
+        writer.submit(tmp_path / "a.hdf5", release.wait)  # blocks the worker
+        writer.submit(tmp_path / "a.hdf5", finished.append, 1)  # fills the queue
+        submitter = threading.Thread(target=writer.submit, args=(tmp_path / "b.hdf5", finished.append, 2))
+        submitter.start()
+        submitter.join(0.1)
+        assert submitter.is_alive()
+        release.set()
+        submitter.join()
+        writer.shutdown()
+        assert finished == [1, 2]
+        with pytest.raises(RuntimeError):
+            writer.submit(tmp_path / "a.hdf5", finished.append, 3)
+
+    def test_shutdown_without_waiting(self, tmp_path: Path):
+        """
+        Test that shutdown without waiting returns while the queue is full and cancels the writes that did not start.
+
+        :param tmp_path: temporary directory
+        """
+        release = threading.Event()
+        writer = hdf5.HDF5Writer(max_queue_size=1)
+        running = writer.submit(tmp_path / "a.hdf5", release.wait)  # blocks the worker
+        pending = writer.submit(tmp_path / "a.hdf5", print, 1)  # fills the queue
+        submitter_errors = []
+
+        def submit():
+            try:
+                writer.submit(tmp_path / "a.hdf5", print, 2)
+            except RuntimeError as e:
+                submitter_errors.append(e)
+
+        submitter = threading.Thread(target=submit)
+        submitter.start()
+        shutdown = threading.Thread(target=writer.shutdown, kwargs={"wait": False})
+        shutdown.start()
+        shutdown.join(1)
+        assert not shutdown.is_alive()
+        with pytest.raises(CancelledError):
+            pending.result(timeout=1)
+        submitter.join(1)
+        assert len(submitter_errors) == 1
+        release.set()
+        assert running.result(timeout=1) is True
+        writer._threads[0].join(1)
+        assert not writer._threads[0].is_alive()
+
+    def test_concurrent_dataframe_writes(self, tmp_path: Path):
+        """
+        Test that dataframes are written correctly by several threads at once.
+
+        :param tmp_path: temporary directory
+        """
+        df = pd.DataFrame({"a": np.arange(1000), "b": np.arange(1000) * 0.5})
+        with hdf5.HDF5Writer(num_threads=4) as writer:
+            futures = [writer.write_file([df], tmp_path / f"{i}.hdf5", ["df"]) for i in range(8)]
+        for i, future in enumerate(futures):
+            assert future.result() is None
+            pd.testing.assert_frame_equal(hdf5.read_file(tmp_path / f"{i}.hdf5", "df"), df)
+
+
+class TestSpectrumContainer:
+    """Class to test the single-file container of raw spectra, predictions and psm metadata."""
+
+    def test_raw_spectra(self, tmp_path: Path, raw_df: pd.DataFrame):
+        """
+        Test that spectra are stored per raw file, can be read in slices and are replaced when written again.
+
+        :param tmp_path: temporary directory
+        :param raw_df: dataframe returned by read_mzml
+        """
+        container = hdf5.SpectrumContainer(tmp_path / "container.hdf5")
+        assert container.raw_files() == []
+        other_df = raw_df.iloc[:4].assign(RAW_FILE="other")
+        container.write_raw_spectra(pd.concat([raw_df, other_df]))
+        assert sorted(container.raw_files()) == ["other", "test"]
+        assert len(container.read_raw_spectra("other")) == 4
+
+        df = container.read_raw_spectra("test", start=3, stop=6)
+        assert df["SCAN_NUMBER"].tolist() == raw_df["SCAN_NUMBER"].iloc[3:6].tolist()
+        for actual, expected in zip(df["INTENSITIES"], raw_df["INTENSITIES"].iloc[3:6]):
+            np.testing.assert_array_equal(actual, expected)
+
+        container.write_raw_spectra((raw_df.iloc[i : i + 2] for i in range(0, 4, 2)), raw_file="test")
+        assert len(container.read_raw_spectra("test")) == 4
+        with pytest.raises(ValueError):
+            container.write_raw_spectra([raw_df])
+
+    def test_psms_and_predictions(self, tmp_path: Path, raw_df: pd.DataFrame):
+        """
+        Test that psm metadata and predicted intensities are appended in batches next to the raw spectra.
+
+        :param tmp_path: temporary directory
+        :param raw_df: dataframe returned by read_mzml
+        """
+        container = hdf5.SpectrumContainer(tmp_path / "container.hdf5")
+        container.write_raw_spectra(raw_df)
+        psms = pd.DataFrame({"SCAN_NUMBER": np.arange(6), "SEQUENCE": list("ACDEFG"), "SCORE": np.linspace(0, 1, 6)})
+        predictions = np.random.default_rng(0).random((6, 174))
+        fragments = [f"y{i}" for i in range(174)]
+        for start in [0, 4]:
+            container.append_psms(psms.iloc[start : start + 4], data_columns=["SCORE"], min_itemsize={"SEQUENCE": 10})
+            container.append_predictions(predictions[start : start + 4], column_names=fragments)
+
+        pd.testing.assert_frame_equal(container.read_psms(), psms)
+        assert container.read_psms(where="SCORE > 0.5")["SCAN_NUMBER"].tolist() == [3, 4, 5]
+        result = container.read_predictions(start=2, stop=5)
+        assert result.dtype == np.float32
+        np.testing.assert_allclose(result, predictions[2:5], rtol=1e-6)
+        assert container.prediction_columns() == fragments
+        with h5py.File(container.path, "r") as f:
+            assert f[hdf5.INTENSITY_PRED_KEY].chunks[1] == 174
+        with pytest.raises(ValueError):
+            container.append_predictions(predictions[:, :10])
+        assert len(container.read_raw_spectra("test")) == len(raw_df)
+
+    @pytest.mark.parametrize("compression", [True, False, None, "lzf"])
+    def test_prediction_compression(self, tmp_path: Path, compression: Union[str, bool, None]):
+        """
+        Test that predictions accept the same compression options as write_dataset.
+
+        :param tmp_path: temporary directory
+        :param compression: the compression option
+        """
+        container = hdf5.SpectrumContainer(tmp_path / "container.hdf5")
+        predictions = np.random.default_rng(0).random((3, 4))
+        container.append_predictions(predictions, compression=compression)
+        np.testing.assert_allclose(container.read_predictions(), predictions, rtol=1e-6)
+        with h5py.File(container.path, "r") as f:
+            assert f[hdf5.INTENSITY_PRED_KEY].compression == {True: "gzip", "lzf": "lzf"}.get(compression)
+
+
+@pytest.fixture
+def matrix() -> scipy.sparse.csr_matrix:
+    """Sparse matrix with 10 rows, 4 columns and some empty rows."""
+    dense = np.arange(40, dtype=float).reshape(10, 4) % 3
+    dense[[0, 5, 9]] = 0
+    return scipy.sparse.csr_matrix(dense)
+
+
+@pytest.fixture
+def raw_df() -> pd.DataFrame:
+    """Spectra of the test mzml file."""
+    return MSRaw.read_mzml(DATA_PATH / "test.mzML")
@@ -0,0 +1,410 @@
+import gzip
+import inspect
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import spectrum_io.raw.msraw as msraw
+from spectrum_io.file import mgf
+from spectrum_io.raw.msraw import MSRaw
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestGetMassAnalyzer:
+    """Class to test mass analyzer detection."""
+
+    def test_get_mass_analyzer(self, mzml_path: Path):
+        """
+        Test detection of the orbitrap analyzer.
+
+        :param mzml_path: path to the test mzml file
+        """
+        assert msraw.get_mass_analyzer(mzml_path) == "FTMS"
+
+    def test_get_mass_analyzer_header_only(self, tmp_path: Path, mzml_path: Path):
+        """
+        Test that only the header is parsed by truncating the file after the instrument configuration.
+
+        :param tmp_path: temporary directory
+        :param mzml_path: path to the test mzml file
+        """
+        content = mzml_path.read_bytes()
+        truncated_path = tmp_path / "truncated.mzML"
+        truncated_path.write_bytes(content[: content.index(b"<run ") + 20])
+        assert msraw.get_mass_analyzer(truncated_path) == "FTMS"
+
+    def test_get_mass_analyzer_gzip(self, tmp_path: Path, mzml_path: Path):
+        """
+        Test detection on gzipped mzml files.
+
+        :param tmp_path: temporary directory
+        :param mzml_path: path to the test mzml file
+        """
+        gz_path = tmp_path / "test.mzML.gz"
+        with gzip.open(gz_path, "wb") as f:
+            f.write(mzml_path.read_bytes())
+        assert msraw.get_mass_analyzer(gz_path) == "FTMS"
+
+    def test_get_mass_analyzer_cached(self, tmp_path: Path, mzml_path: Path):
+        """
+        Test that results are cached until the file changes.
+
+        :param tmp_path: temporary directory
+        :param mzml_path: path to the test mzml file
+        """
+        file_path = tmp_path / "test.mzML"
+        content = mzml_path.read_bytes()
+        file_path.write_bytes(content)
+        msraw.get_mass_analyzer(file_path)
+        hits = msraw._get_mass_analyzer.cache_info().hits
+        assert msraw.get_mass_analyzer(file_path) == "FTMS"
+        assert msraw._get_mass_analyzer.cache_info().hits == hits + 1
+
+        file_path.write_bytes(
+            content.replace(b"MS:1000484", b"MS:1000082").replace(b"orbitrap", b"quadrupole ion trap")
+        )
+        assert msraw.get_mass_analyzer(file_path) == "ITMS"
+
+
+class TestIterMzml:
+    """Class to test batched reading of mzml files."""
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_iter_mzml_batches(self, mzml_path: Path, package: str):
+        """
+        Test that batches are bounded by the batch size and add up to the full dataframe.
+
+        :param mzml_path: path to the test mzml file
+        :param package: package used for parsing
+        """
+        batches = list(MSRaw.iter_mzml(mzml_path, package=package, batch_size=4))
+        assert [len(batch) for batch in batches] == [4, 4, 1]
+        assert list(batches[0].columns) == list(MSRaw.read_mzml(mzml_path, package=package).columns)
+
+        full_df = MSRaw.read_mzml(mzml_path, package=package)
+        batched_df = pd.concat(batches)
+        pd.testing.assert_frame_equal(
+            full_df.drop(columns=["INTENSITIES", "MZ"]), batched_df.drop(columns=["INTENSITIES", "MZ"])
+        )
+        for expected, actual in zip(full_df["MZ"], batched_df["MZ"]):
+            np.testing.assert_array_equal(expected, actual)
+
+    def test_iter_mzml_invalid_batch_size(self, mzml_path: Path):
+        """
+        Test that a non-positive batch size is rejected.
+
+        :param mzml_path: path to the test mzml file
+        """
+        with pytest.raises(ValueError):
+            next(MSRaw.iter_mzml(mzml_path, batch_size=0))
+
+
+class TestParallelReadMzml:
+    """Class to test reading multiple mzml files in a process pool."""
+
+    def test_read_mzml_workers(self, mzml_dir: Path):
+        """
+        Test that parallel reading gives the same result as sequential reading.
+
+        :param mzml_dir: directory containing multiple mzml files
+        """
+        sequential_df = MSRaw.read_mzml(mzml_dir)
+        parallel_df = MSRaw.read_mzml(mzml_dir, workers=2)
+        assert list(parallel_df.index) == list(sequential_df.index)
+        assert parallel_df["RAW_FILE"].unique().tolist() == ["run_a", "run_b", "run_c"]
+        pd.testing.assert_frame_equal(
+            sequential_df.drop(columns=["INTENSITIES", "MZ"]), parallel_df.drop(columns=["INTENSITIES", "MZ"])
+        )
+
+    def test_read_mzml_workers_error(self, mzml_dir: Path):
+        """
+        Test that errors raised in a worker name the failing file.
+
+        :param mzml_dir: directory containing multiple mzml files
+        """
+        (mzml_dir / "run_b.mzML").write_text("not an mzml file")
+        with pytest.raises(RuntimeError, match="run_b.mzML"):
+            MSRaw.read_mzml(mzml_dir, workers=2)
+
+    def test_read_mzml_keyword_only_options(self):
+        """Test that the options added after scanidx cannot be bound by extra positional arguments."""
+        parameters = inspect.signature(MSRaw.read_mzml).parameters
+        for name in ["workers", "cache", "decode_arrays", "peak_filter"]:
+            assert parameters[name].kind == inspect.Parameter.KEYWORD_ONLY
+        assert parameters["scanidx"].kind == inspect.Parameter.POSITIONAL_OR_KEYWORD
+
+
+class TestMetadataOnly:
+    """Class to test reading the scan metadata without decoding the binary arrays."""
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_read_mzml_metadata_only(self, mzml_path: Path, package: str):
+        """
+        Test that only the metadata columns are returned and that they match a full read.
+
+        :param mzml_path: path to the test mzml file
+        :param package: package used for parsing
+        """
+        full_df = MSRaw.read_mzml(mzml_path, package=package)
+        metadata_df = MSRaw.read_mzml(mzml_path, package=package, decode_arrays=False)
+        assert "INTENSITIES" not in metadata_df.columns
+        assert "MZ" not in metadata_df.columns
+        pd.testing.assert_frame_equal(metadata_df, full_df.drop(columns=["INTENSITIES", "MZ"]))
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_read_mzml_metadata_only_scanidx(self, mzml_path: Path, tmp_path: Path, package: str):
+        """
+        Test metadata-only reading of selected scans.
+
+        :param mzml_path: path to the test mzml file
+        :param tmp_path: temporary directory for the scan index sidecar
+        :param package: package used for parsing
+        """
+        file_path = tmp_path / "test.mzML"
+        shutil.copy(mzml_path, file_path)
+        metadata_df = MSRaw.read_mzml(file_path, package=package, scanidx=[4, 2], decode_arrays=False)
+        assert metadata_df["SCAN_NUMBER"].tolist() == [2, 4]
+        assert "MZ" not in metadata_df.columns
+
+    def test_iter_mzml_metadata_only(self, mzml_path: Path):
+        """
+        Test that batched reading supports metadata-only mode.
+
+        :param mzml_path: path to the test mzml file
+        """
+        batches = list(MSRaw.iter_mzml(mzml_path, batch_size=5, decode_arrays=False))
+        assert [len(batch) for batch in batches] == [5, 4]
+        assert "INTENSITIES" not in batches[0].columns
+
+
+class TestReadPsmSpectra:
+    """Class to test reading the spectra of search results."""
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_read_psm_spectra(self, mzml_dir: Path, psms: pd.DataFrame, workers: int):
+        """
+        Test that only PSMs with a spectrum are returned and annotated with the correct spectra.
+
+        :param mzml_dir: directory containing multiple mzml files
+        :param psms: search results referencing the files in mzml_dir
+        :param workers: number of worker processes
+        """
+        df = MSRaw.read_psm_spectra(psms, mzml_dir, workers=workers)
+        assert df["SEQUENCE"].tolist() == ["PEPA", "PEPB", "PEPC", "PEPD"]
+        assert set(df.columns) == set(psms.columns) | set(MSRaw.read_mzml(mzml_dir).columns)
+        full_df = MSRaw.read_mzml(mzml_dir)
+        for _, row in df.iterrows():
+            np.testing.assert_array_equal(row["MZ"], full_df.loc[f"{row['RAW_FILE']}_{row['SCAN_NUMBER']}", "MZ"])
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_read_psm_spectra_missing_scan(
+        self, mzml_dir: Path, psms: pd.DataFrame, workers: int, caplog: pytest.LogCaptureFixture
+    ):
+        """
+        Test that PSMs of scans that are not in the mzml file are skipped with a warning.
+
+        :param mzml_dir: directory containing multiple mzml files
+        :param psms: search results referencing the files in mzml_dir
+        :param workers: number of worker processes
+        :param caplog: fixture capturing log messages
+        """
+        missing = pd.DataFrame({"RAW_FILE": ["run_a", "run_a"], "SCAN_NUMBER": [999, 999], "SEQUENCE": ["X", "Y"]})
+        df = MSRaw.read_psm_spectra(pd.concat([psms, missing]), mzml_dir, workers=workers)
+        assert df["SEQUENCE"].tolist() == ["PEPA", "PEPB", "PEPC", "PEPD"]
+        assert "2 PSMs reference scans that are not in" in caplog.text
+
+    def test_read_psm_spectra_overlapping_columns(self, mzml_dir: Path, psms: pd.DataFrame):
+        """
+        Test that columns of the PSMs are kept instead of spectrum columns with the same name.
+
+        :param mzml_dir: directory containing multiple mzml files
+        :param psms: search results referencing the files in mzml_dir
+        """
+        psms = psms.assign(RETENTION_TIME=1.5)
+        df = MSRaw.read_psm_spectra(psms, mzml_dir)
+        assert not [column for column in df.columns if column.endswith(("_x", "_y"))]
+        assert (df["RETENTION_TIME"] == 1.5).all()
+        assert "MZ" in df.columns
+
+    def test_read_psm_spectra_keyword_only_options(self):
+        """Test that the options of read_psm_spectra can only be given as keyword arguments, like for read_mzml."""
+        parameters = inspect.signature(MSRaw.read_psm_spectra).parameters
+        for name in ["workers", "cache", "peak_filter"]:
+            assert parameters[name].kind == inspect.Parameter.KEYWORD_ONLY
+
+    def test_read_psm_spectra_missing_columns(self, mzml_dir: Path):
+        """
+        Test that PSMs without the key columns are rejected.
+
+        :param mzml_dir: directory containing multiple mzml files
+        """
+        with pytest.raises(ValueError):
+            MSRaw.read_psm_spectra(pd.DataFrame({"RAW_FILE": ["run_a"]}), mzml_dir)
+
+
+class TestGzippedMzml:
+    """Class to test reading gzipped mzml files."""
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_read_mzml_gzip(self, mzml_path: Path, gzipped_mzml_dir: Path, package: str):
+        """
+        Test that gzipped files are found in directories and read like uncompressed files.
+
+        :param mzml_path: path to the test mzml file
+        :param gzipped_mzml_dir: directory containing the test mzml file and a gzipped copy
+        :param package: package used for parsing
+        """
+        assert [path.name for path in MSRaw.get_file_list(gzipped_mzml_dir)] == ["run_a.mzML", "run_b.mzML.gz"]
+        expected_df = MSRaw.read_mzml(mzml_path, package=package)
+        df = MSRaw.read_mzml(gzipped_mzml_dir / "run_b.mzML.gz", package=package)
+        assert df["RAW_FILE"].unique().tolist() == ["run_b"]
+        assert list(df.index) == [key.replace("test", "run_b") for key in expected_df.index]
+        pd.testing.assert_frame_equal(
+            df.drop(columns=["RAW_FILE", "INTENSITIES", "MZ"]).reset_index(drop=True),
+            expected_df.drop(columns=["RAW_FILE", "INTENSITIES", "MZ"]).reset_index(drop=True),
+        )
+        for expected, actual in zip(expected_df["MZ"], df["MZ"]):
+            np.testing.assert_array_equal(expected, actual)
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_read_mzml_gzip_scanidx(self, gzipped_mzml_dir: Path, package: str):
+        """
+        Test random access to scans of gzipped files.
+
+        :param gzipped_mzml_dir: directory containing the test mzml file and a gzipped copy
+        :param package: package used for parsing
+        """
+        df = MSRaw.read_mzml(gzipped_mzml_dir / "run_b.mzML.gz", package=package, scanidx=[7, 3])
+        assert df["SCAN_NUMBER"].tolist() == [3, 7]
+
+    def test_get_raw_file_name(self):
+        """Test that the mzML and gz extensions are removed."""
+        assert msraw.get_raw_file_name("dir/run.mzML") == "run"
+        assert msraw.get_raw_file_name(Path("dir/run.1.mzML.gz")) == "run.1"
+
+
+class TestSampleMzml:
+    """Class to test reading a random sample of spectra."""
+
+    @pytest.mark.parametrize("package", ["pyteomics", "fast"])
+    def test_sample_mzml(self, mzml_dir: Path, package: str):
+        """
+        Test that n MS2 spectra are read per file and that the selection is reproducible.
+
+        :param mzml_dir: directory containing multiple mzml files
+        :param package: package used for parsing
+        """
+        df = MSRaw.sample_mzml(mzml_dir, 4, package=package, seed=42)
+        assert df.groupby("RAW_FILE").size().tolist() == [4, 4, 4]
+        assert not df["SCAN_NUMBER"].isin([1, 5, 9]).any()
+        assert df.groupby("RAW_FILE")["SCAN_NUMBER"].is_monotonic_increasing.all()
+        pd.testing.assert_frame_equal(
+            df.drop(columns=["INTENSITIES", "MZ"]),
+            MSRaw.sample_mzml(mzml_dir, 4, package=package, seed=42).drop(columns=["INTENSITIES", "MZ"]),
+        )
+        full_df = MSRaw.read_mzml(mzml_dir, package=package)
+        for key, mz in df["MZ"].items():
+            np.testing.assert_array_equal(mz, full_df.loc[key, "MZ"])
+
+    def test_sample_mzml_exhausted(self, mzml_dir: Path):
+        """
+        Test that all MS2 spectra are returned if n exceeds their number.
+
+        :param mzml_dir: directory containing multiple mzml files
+        """
+        df = MSRaw.sample_mzml(mzml_dir / "run_a.mzML", 50, stratified=False, seed=0, decode_arrays=False)
+        assert df["SCAN_NUMBER"].tolist() == [2, 3, 4, 6, 7, 8, 10, 11, 12]
+
+    def test_sample_mzml_invalid_n(self, mzml_path: Path):
+        """
+        Test that a non-positive sample size is rejected.
+
+        :param mzml_path: path to the test mzml file
+        """
+        with pytest.raises(ValueError):
+            MSRaw.sample_mzml(mzml_path, 0)
+
+
+class TestReadConvertedFormats:
+    """Class to test reading the mgf and parquet outputs of ThermoRawFileParser."""
+
+    def test_read_mgf(self, mzml_path: Path, tmp_path: Path):
+        """
+        Test that reading an mgf file returns the same spectra as reading the mzml file.
+
+        :param mzml_path: path to the test mzml file
+        :param tmp_path: temporary directory
+        """
+        expected_df = MSRaw.read_mzml(mzml_path)
+        mgf.write_file(expected_df, tmp_path / "test.mgf")
+        df = MSRaw.read_mgf(tmp_path, mass_analyzer="FTMS", fragmentation="HCD", mz_range="100.00-1010.00")
+        assert list(df.columns) == list(expected_df.columns)
+        assert df.index.tolist() == expected_df.index.tolist()
+        assert (df["MASS_ANALYZER"] == "FTMS").all()
+        np.testing.assert_allclose(df["RETENTION_TIME"], expected_df["RETENTION_TIME"], rtol=1e-6)
+        for key, mz in expected_df["MZ"].items():
+            np.testing.assert_allclose(df.loc[key, "MZ"], mz, rtol=1e-6)
+        assert MSRaw.read_mgf(tmp_path / "test.mgf", scanidx=[3, 12])["SCAN_NUMBER"].tolist() == [3, 12]
+
+    def test_read_parquet(self, mzml_path: Path, tmp_path: Path):
+        """
+        Test that reading a parquet file with one row per peak returns the same spectra as reading the mzml file.
+
+        :param mzml_path: path to the test mzml file
+        :param tmp_path: temporary directory
+        """
+        pytest.importorskip("pyarrow")
+        expected_df = MSRaw.read_mzml(mzml_path)
+        peaks = expected_df.explode(["MZ", "INTENSITIES"])
+        pd.DataFrame(
+            {
+                "scan": peaks["SCAN_NUMBER"].to_numpy(dtype="uint32"),
+                "level": np.full(len(peaks), 2, dtype="uint32"),
+                "rt": peaks["RETENTION_TIME"].to_numpy(dtype="float32"),
+                "mz": peaks["MZ"].to_numpy(dtype="float32"),
+                "intensity": peaks["INTENSITIES"].to_numpy(dtype="float32"),
+            }
+        ).iloc[::-1].to_parquet(tmp_path / "test.parquet")
+        df = MSRaw.read_parquet(tmp_path / "test.parquet")
+        assert df.index.tolist() == expected_df.index.tolist()
+        for key, mz in expected_df["MZ"].items():
+            np.testing.assert_allclose(np.sort(df.loc[key, "MZ"]), mz, rtol=1e-6)
+
+
+@pytest.fixture
+def mzml_dir(tmp_path: Path, mzml_path: Path) -> Path:
+    """Directory with three copies of the test mzml file."""
+    for name in ["run_c", "run_a", "run_b"]:
+        shutil.copy(mzml_path, tmp_path / f"{name}.mzML")
+    return tmp_path
+
+
+@pytest.fixture
+def gzipped_mzml_dir(tmp_path: Path, mzml_path: Path) -> Path:
+    """Directory with an uncompressed and a gzipped copy of the test mzml file."""
+    shutil.copy(mzml_path, tmp_path / "run_a.mzML")
+    with gzip.open(tmp_path / "run_b.mzML.gz", "wb") as f:
+        f.write(mzml_path.read_bytes())
+    return tmp_path
+
+
+@pytest.fixture
+def psms() -> pd.DataFrame:
+    """Search results with two PSMs of the same scan and one PSM of a file that does not exist."""
+    return pd.DataFrame(
+        {
+            "RAW_FILE": ["run_b", "run_a", "run_a", "run_x", "run_c"],
+            "SCAN_NUMBER": [12, 3, 3, 2, 7],
+            "SEQUENCE": ["PEPA", "PEPB", "PEPC", "PEPX", "PEPD"],
+        }
+    )
+
+
+@pytest.fixture
+def mzml_path() -> Path:
+    """Path to a small indexed mzml file with 3 MS1 and 9 MS2 spectra."""
+    return DATA_PATH / "test.mzML"
@@ -0,0 +1,138 @@
+import base64
+import re
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from lxml import etree
+from pymzml.ms_numpress import MSNumpress
+
+import spectrum_io.raw.mzml_decoder as mzml_decoder
+from spectrum_io.raw.msraw import MSRaw
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestDecodeBinary:
+    """Class to test decoding of binary arrays."""
+
+    @pytest.mark.parametrize("accession", ["MS:1000521", "MS:1000523", "MS:1000519", "MS:1000522"])
+    def test_decode_zlib(self, accession: str):
+        """
+        Test decoding of zlib compressed arrays of all supported data types.
+
+        :param accession: accession of the data type
+        """
+        dtype = mzml_decoder.DTYPES[accession]
+        values = np.arange(10).astype(dtype)
+        text = base64.b64encode(zlib.compress(values.tobytes())).decode()
+        decoded = mzml_decoder.decode_binary(text, dtype, mzml_decoder.ZLIB, len(values))
+        np.testing.assert_array_equal(decoded, values)
+        assert decoded.dtype == dtype
+        assert decoded.flags.writeable
+
+    @pytest.mark.parametrize("length", [0, 10000, 70000, 100000])
+    @pytest.mark.parametrize("compression", ["MS:1000574", "MS:1000576"])
+    def test_decode_length_mismatch(self, length: int, compression: str):
+        """
+        Test that arrays spanning several decompression chunks are decoded and wrong lengths are corrected.
+
+        :param length: the array length given to the decoder, the encoded array has 70000 values
+        :param compression: accession of the compression
+        """
+        values = np.linspace(0, 1, 70000).astype("<f8")
+        encoded = values.tobytes()
+        if compression == mzml_decoder.ZLIB:
+            encoded = zlib.compress(encoded)
+        decoded = mzml_decoder.decode_binary(base64.b64encode(encoded).decode(), values.dtype, compression, length)
+        np.testing.assert_array_equal(decoded, values)
+        assert decoded.flags.writeable
+
+    def test_decode_uncompressed(self):
+        """Test decoding of uncompressed arrays."""
+        values = np.array([100.5, 200.25], dtype="<f8")
+        text = base64.b64encode(values.tobytes()).decode()
+        decoded = mzml_decoder.decode_binary(text, values.dtype, mzml_decoder.NO_COMPRESSION, len(values))
+        np.testing.assert_array_equal(decoded, values)
+
+    @pytest.mark.parametrize("accession,method", [("MS:1002313", "pic"), ("MS:1002748", "slof")])
+    def test_decode_numpress(self, accession: str, method: str):
+        """
+        Test decoding of MS-Numpress compressed arrays.
+
+        :param accession: accession of the compression
+        :param method: numpress method
+        """
+        values = [1.0, 5.0, 300.0, 1234.0]
+        encoded = bytes(getattr(MSNumpress(values), f"encode_{method}")())
+        if mzml_decoder.NUMPRESS[accession][1]:
+            encoded = zlib.compress(encoded)
+        text = base64.b64encode(encoded).decode()
+        decoded = mzml_decoder.decode_binary(text, np.dtype("<f8"), accession, len(values))
+        np.testing.assert_allclose(decoded, values, rtol=1e-3)
+
+
+class TestParseSpectrum:
+    """Class to test parsing of spectrum elements."""
+
+    def test_parse_spectrum_seconds(self, spectrum_xml: bytes):
+        """
+        Test that scan start times in seconds are converted to minutes.
+
+        :param spectrum_xml: xml of a MS2 spectrum of the test file
+        """
+        spectrum_xml = spectrum_xml.replace(
+            b'unitAccession="UO:0000031" unitName="minute"', b'unitAccession="UO:0000010" unitName="second"'
+        )
+        spectrum = mzml_decoder.parse_spectrum(etree.fromstring(spectrum_xml))
+        assert spectrum.scan_number == 2
+        assert spectrum.ms_level == 2
+        assert spectrum.retention_time == pytest.approx(0.2 / 60)
+        assert spectrum.filter_string.startswith("FTMS + c NSI d Full ms2")
+        assert len(spectrum.mz) == len(spectrum.intensity)
+
+    def test_parse_spectrum_precursor(self, spectrum_xml: bytes):
+        """
+        Test that the selected precursor ion is parsed.
+
+        :param spectrum_xml: xml of a MS2 spectrum of the test file
+        """
+        spectrum = mzml_decoder.parse_spectrum(etree.fromstring(spectrum_xml))
+        expected_mz = float(re.search(rb'accession="MS:1000744" value="([\d.]+)"', spectrum_xml).group(1))
+        assert spectrum.precursor_mz == expected_mz
+        assert spectrum.precursor_charge == 2
+
+    def test_parse_spectrum_min_ms_level(self, spectrum_xml: bytes):
+        """
+        Test that spectra below the minimum ms level are skipped.
+
+        :param spectrum_xml: xml of a MS2 spectrum of the test file
+        """
+        assert mzml_decoder.parse_spectrum(etree.fromstring(spectrum_xml), min_ms_level=3) is None
+
+
+class TestFastBackend:
+    """Class to test the fast read_mzml backend."""
+
+    def test_fast_equals_pyteomics(self):
+        """Test that the fast backend returns the same dataframe as pyteomics."""
+        expected = MSRaw.read_mzml(DATA_PATH / "test.mzML", package="pyteomics")
+        df = MSRaw.read_mzml(DATA_PATH / "test.mzML", package="fast")
+        assert list(df.index) == list(expected.index)
+        pd.testing.assert_frame_equal(
+            df.drop(columns=["INTENSITIES", "MZ"]), expected.drop(columns=["INTENSITIES", "MZ"]), check_dtype=False
+        )
+        for col in ["INTENSITIES", "MZ"]:
+            for actual, desired in zip(df[col], expected[col]):
+                np.testing.assert_array_equal(actual, desired)
+
+
+@pytest.fixture
+def spectrum_xml() -> bytes:
+    """Xml of scan 2 of the test file."""
+    content = (DATA_PATH / "test.mzML").read_bytes()
+    start = content.index(b'<spectrum id="controllerType=0 controllerNumber=1 scan=2"')
+    end = content.index(b"</spectrum>", start) + len(b"</spectrum>")
+    return content[start:end]
@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from spectrum_io.raw import PeakFilter
+from spectrum_io.raw.msraw import MSRaw
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestPeakFilter:
+    """Class to test read-time peak preprocessing."""
+
+    def test_top_n(self, mz: np.ndarray, intensity: np.ndarray):
+        """
+        Test that the most intense peaks are kept in m/z order.
+
+        :param mz: m/z values of a spectrum
+        :param intensity: intensities of a spectrum
+        """
+        filtered_mz, filtered_intensity = PeakFilter(top_n=2)(mz, intensity)
+        np.testing.assert_array_equal(filtered_mz, [200.0, 400.0])
+        np.testing.assert_array_equal(filtered_intensity, [50.0, 100.0])
+
+    def test_min_relative_intensity(self, mz: np.ndarray, intensity: np.ndarray):
+        """
+        Test removal of peaks below a fraction of the base peak.
+
+        :param mz: m/z values of a spectrum
+        :param intensity: intensities of a spectrum
+        """
+        filtered_mz, _ = PeakFilter(min_relative_intensity=0.1)(mz, intensity)
+        np.testing.assert_array_equal(filtered_mz, [200.0, 300.0, 400.0])
+
+    def test_mz_range(self, mz: np.ndarray, intensity: np.ndarray):
+        """
+        Test clipping to an m/z range, the base peak is determined within the range.
+
+        :param mz: m/z values of a spectrum
+        :param intensity: intensities of a spectrum
+        """
+        filtered_mz, filtered_intensity = PeakFilter(mz_range=(100, 300))(mz, intensity)
+        np.testing.assert_array_equal(filtered_mz, [100.0, 200.0, 300.0])
+        filtered_mz, _ = PeakFilter(mz_range=(100, 300), min_relative_intensity=0.5)(mz, intensity)
+        np.testing.assert_array_equal(filtered_mz, [200.0])
+
+    def test_dtype(self, mz: np.ndarray, intensity: np.ndarray):
+        """
+        Test conversion of the arrays to float32.
+
+        :param mz: m/z values of a spectrum
+        :param intensity: intensities of a spectrum
+        """
+        filtered_mz, filtered_intensity = PeakFilter(dtype="float32")(mz, intensity)
+        assert filtered_mz.dtype == filtered_intensity.dtype == np.float32
+
+    def test_empty_spectrum(self):
+        """Test that empty spectra are passed through."""
+        filtered_mz, filtered_intensity = PeakFilter(top_n=5, min_relative_intensity=0.1)(np.empty(0), np.empty(0))
+        assert len(filtered_mz) == len(filtered_intensity) == 0
+
+    def test_invalid_parameters(self):
+        """Test that out of range parameters are rejected."""
+        with pytest.raises(ValueError):
+            PeakFilter(top_n=0)
+        with pytest.raises(ValueError):
+            PeakFilter(min_relative_intensity=2)
+        with pytest.raises(ValueError):
+            PeakFilter(mz_range=(500, 100))
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_read_mzml_peak_filter(self, package: str):
+        """
+        Test that the filter is applied while reading mzml files.
+
+        :param package: package used for parsing
+        """
+        mzml_path = DATA_PATH / "test.mzML"
+        full_df = MSRaw.read_mzml(mzml_path, package=package)
+        df = MSRaw.read_mzml(mzml_path, package=package, peak_filter=PeakFilter(top_n=3, dtype="float32"))
+        assert (df["MZ"].apply(len) == np.minimum(full_df["MZ"].apply(len), 3)).all()
+        assert all(mz.dtype == np.float32 for mz in df["MZ"])
+        assert all(intensity.dtype == np.float32 for intensity in df["INTENSITIES"])
+        np.testing.assert_allclose(
+            np.sort(df["INTENSITIES"].iloc[0]), np.sort(full_df["INTENSITIES"].iloc[0])[-3:], rtol=1e-6
+        )
+
+
+@pytest.fixture
+def mz() -> np.ndarray:
+    """m/z values of a small spectrum."""
+    return np.array([100.0, 200.0, 300.0, 400.0, 500.0])
+
+
+@pytest.fixture
+def intensity() -> np.ndarray:
+    """Intensities of a small spectrum, the base peak is at m/z 400."""
+    return np.array([4.0, 50.0, 20.0, 100.0, 1.0])
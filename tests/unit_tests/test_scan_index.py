@@ -0,0 +1,228 @@
+import gzip
+import io
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pyteomics import mzml
+
+from spectrum_io.raw.msraw import MSRaw
+from spectrum_io.raw.scan_index import (
+    RewindableReader,
+    ScanIndex,
+    ThreadedGzipReader,
+    get_sidecar_path,
+    open_mzml,
+)
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestScanIndex:
+    """Class to test the scan number to byte offset index."""
+
+    def test_build_from_index_list(self, mzml_path: Path):
+        """
+        Test that the offsets of the indexedmzML index list point to the spectra.
+
+        :param mzml_path: path to a copy of the test mzml file
+        """
+        index = ScanIndex.build(mzml_path)
+        np.testing.assert_array_equal(index.scan_numbers, np.arange(1, 13))
+        content = mzml_path.read_bytes()
+        for offset in index.offsets:
+            assert content[offset:].startswith(b"<spectrum ")
+
+    def test_build_from_scan(self, mzml_path: Path, unindexed_mzml_path: Path):
+        """
+        Test that scanning a file without index list finds the same spectra.
+
+        :param mzml_path: path to a copy of the test mzml file
+        :param unindexed_mzml_path: path to the test mzml file without index list
+        """
+        expected = ScanIndex.build(mzml_path)
+        index = ScanIndex.build(unindexed_mzml_path)
+        np.testing.assert_array_equal(index.scan_numbers, expected.scan_numbers)
+        shift = expected.offsets[0] - index.offsets[0]
+        np.testing.assert_array_equal(index.offsets + shift, expected.offsets)
+
+    def test_sidecar(self, mzml_path: Path):
+        """
+        Test that the index is stored next to the mzml file and invalidated when the file changes.
+
+        :param mzml_path: path to a copy of the test mzml file
+        """
+        sidecar_path = get_sidecar_path(mzml_path)
+        index = ScanIndex.for_file(mzml_path)
+        assert sidecar_path.is_file()
+        loaded = ScanIndex.load(sidecar_path, mzml_path)
+        assert loaded is not None
+        np.testing.assert_array_equal(loaded.offsets, index.offsets)
+
+        with open(mzml_path, "ab") as f:
+            f.write(b"\n")
+        assert ScanIndex.load(sidecar_path, mzml_path) is None
+
+    def test_iter_spectra(self, mzml_path: Path):
+        """
+        Test random access to spectra.
+
+        :param mzml_path: path to a copy of the test mzml file
+        """
+        index = ScanIndex.for_file(mzml_path)
+        spectra = list(index.iter_spectra(mzml_path, [7, 3]))
+        assert [scan for scan, _ in spectra] == [3, 7]
+        assert spectra[1][1].startswith(b'<spectrum id="controllerType=0 controllerNumber=1 scan=7"')
+        assert spectra[1][1].endswith(b"</spectrum>")
+        assert 7 in index
+        assert 13 not in index
+        with pytest.raises(KeyError):
+            index.get_offsets([3, 13])
+
+    def test_read_document(self, mzml_path: Path):
+        """
+        Test that the document of selected scans can be parsed by pyteomics.
+
+        :param mzml_path: path to a copy of the test mzml file
+        """
+        document = ScanIndex.for_file(mzml_path).read_document(mzml_path, [7, 3])
+        assert document.endswith(b"</mzML></indexedmzML>")
+        with mzml.MzML(io.BytesIO(document)) as reader:
+            assert [spectrum["id"].split("scan=")[-1] for spectrum in reader] == ["3", "7"]
+
+    def test_sample(self):
+        """Test seeded, stratified and uniform sampling of scan numbers."""
+        index = ScanIndex(np.arange(1, 101), np.arange(100) * 10)
+        stratified = index.sample(10, seed=1)
+        assert len(stratified) == 10
+        np.testing.assert_array_equal(stratified, index.sample(10, seed=1))
+        # exactly one scan per block of ten consecutive scans
+        np.testing.assert_array_equal((stratified - 1) // 10, np.arange(10))
+        uniform = index.sample(10, stratified=False, seed=1)
+        assert len(np.unique(uniform)) == 10
+        assert np.all(np.diff(uniform) > 0)
+        rest = index.sample(100, exclude=stratified)
+        assert len(rest) == 90
+        assert not np.isin(rest, stratified).any()
+
+
+class TestThreadedGzipReader:
+    """Class to test decompression in a background thread."""
+
+    def test_read(self, tmp_path: Path):
+        """
+        Test that the decompressed content is identical to the original file, independent of the chunk size.
+
+        :param tmp_path: temporary directory
+        """
+        content = np.random.default_rng(0).integers(0, 255, 100000, dtype=np.uint8).tobytes()
+        gz_path = tmp_path / "test.mzML.gz"
+        with gzip.open(gz_path, "wb") as f:
+            f.write(content)
+        with open_mzml(gz_path, threaded=True) as fh:
+            assert fh.read() == content
+        with ThreadedGzipReader(gz_path, chunk_size=1000, queue_size=2) as fh:
+            assert fh.read(10) == content[:10]
+            assert fh.readall() == content[10:]
+
+    def test_read_multiple_members(self, tmp_path: Path):
+        """
+        Test reading concatenated gzip files.
+
+        :param tmp_path: temporary directory
+        """
+        gz_path = tmp_path / "test.mzML.gz"
+        gz_path.write_bytes(gzip.compress(b"first member ") + gzip.compress(b"second member"))
+        with open_mzml(gz_path, threaded=True) as fh:
+            assert fh.read() == b"first member second member"
+
+    def test_close_early(self, tmp_path: Path):
+        """
+        Test that closing before the end of the file stops the background thread.
+
+        :param tmp_path: temporary directory
+        """
+        gz_path = tmp_path / "test.mzML.gz"
+        with gzip.open(gz_path, "wb") as f:
+            f.write(bytes(1000000))
+        reader = ThreadedGzipReader(gz_path, chunk_size=1000, queue_size=2)
+        reader.read(10)
+        reader.close()
+        assert not reader._thread.is_alive()
+
+    def test_error(self, tmp_path: Path):
+        """
+        Test that decompression errors are raised in the reading thread.
+
+        :param tmp_path: temporary directory
+        """
+        gz_path = tmp_path / "test.mzML.gz"
+        gz_path.write_bytes(b"not a gzip file")
+        with pytest.raises(OSError):
+            with open_mzml(gz_path, threaded=True) as fh:
+                fh.read()
+        gz_path.write_bytes(gzip.compress(bytes(100000))[:-100])
+        with pytest.raises(EOFError):
+            with open_mzml(gz_path, threaded=True) as fh:
+                fh.read()
+
+
+class TestRewindableReader:
+    """Class to test rewinding to the start of an unseekable stream."""
+
+    def test_seek_head(self, tmp_path: Path):
+        """
+        Test that the head can be read again until reading continued beyond it.
+
+        :param tmp_path: temporary directory
+        """
+        content = bytes(range(256)) * 40
+        gz_path = tmp_path / "test.mzML.gz"
+        gz_path.write_bytes(gzip.compress(content))
+        with RewindableReader(ThreadedGzipReader(gz_path), head_size=100) as fh:
+            assert fh.read(50) == content[:50]
+            fh.seek(10)
+            assert fh.read(60) == content[10:50]  # reads from the head are not combined with reads from the stream
+            assert fh.read(10) == content[50:60]
+            assert fh.tell() == 60
+            assert fh.read(100) == content[60:160]
+            with pytest.raises(io.UnsupportedOperation):
+                fh.seek(0)
+            assert fh.readall() == content[160:]
+
+
+class TestReadMzmlScanidx:
+    """Class to test reading selected scans with read_mzml."""
+
+    @pytest.mark.parametrize("package", ["pyteomics", "pymzml", "fast"])
+    def test_read_mzml_scanidx(self, unindexed_mzml_path: Path, package: str):
+        """
+        Test that only the requested MS2 scans are read, also from files without index list.
+
+        :param unindexed_mzml_path: path to the test mzml file without index list
+        :param package: package used for parsing
+        """
+        full_df = MSRaw.read_mzml(unindexed_mzml_path, package=package)
+        df = MSRaw.read_mzml(unindexed_mzml_path, package=package, scanidx=[11, 2, 5, 7])
+        assert df["SCAN_NUMBER"].tolist() == [2, 7, 11]
+        assert get_sidecar_path(unindexed_mzml_path).is_file()
+        for scan_number, mz in zip(df["SCAN_NUMBER"], df["MZ"]):
+            np.testing.assert_array_equal(mz, full_df[full_df["SCAN_NUMBER"] == scan_number]["MZ"].iloc[0])
+
+
+@pytest.fixture
+def mzml_path(tmp_path: Path) -> Path:
+    """Copy of the test mzml file in a temporary directory."""
+    return Path(shutil.copy(DATA_PATH / "test.mzML", tmp_path / "test.mzML"))
+
+
+@pytest.fixture
+def unindexed_mzml_path(tmp_path: Path) -> Path:
+    """Test mzml file without indexedmzML wrapper and index list in a temporary directory."""
+    content = (DATA_PATH / "test.mzML").read_bytes()
+    start = content.index(b"  <mzML ")
+    end = content.index(b"</mzML>") + len(b"</mzML>")
+    file_path = tmp_path / "unindexed.mzML"
+    file_path.write_bytes(b'<?xml version="1.0" encoding="utf-8"?>\n' + content[start:end] + b"\n")
+    return file_path
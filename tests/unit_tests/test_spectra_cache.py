@@ -0,0 +1,117 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectrum_io.raw import SpectraCache, spectra_cache
+from spectrum_io.raw.msraw import MSRaw
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestSpectraCache:
+    """Class to test the on-disk cache of parsed spectra."""
+
+    def test_cache_hit(self, mzml_path: Path, cache: SpectraCache, monkeypatch: pytest.MonkeyPatch):
+        """
+        Test that a second read is served from the cache without parsing.
+
+        :param mzml_path: path to a copy of the test mzml file
+        :param cache: empty spectra cache
+        :param monkeypatch: pytest monkeypatch fixture
+        """
+        expected = MSRaw.read_mzml(mzml_path, cache=cache)
+        assert len(list(cache.cache_dir.glob("*.npz"))) == 1
+
+        def fail(*args, **kwargs):
+            raise AssertionError("The file should not be parsed again.")
+
+        monkeypatch.setattr(MSRaw, "_iter_scans_pyteomics", staticmethod(fail))
+        df = MSRaw.read_mzml(mzml_path, cache=cache)
+        assert list(df.index) == list(expected.index)
+        pd.testing.assert_frame_equal(
+            df.drop(columns=["INTENSITIES", "MZ"]), expected.drop(columns=["INTENSITIES", "MZ"]), check_dtype=False
+        )
+        for actual, desired in zip(df["INTENSITIES"], expected["INTENSITIES"]):
+            np.testing.assert_array_equal(actual, desired)
+
+    def test_cache_hit_evicted(self, mzml_path: Path, cache: SpectraCache, monkeypatch: pytest.MonkeyPatch):
+        """
+        Test that an entry evicted by another process right after loading it is still returned.
+
+        :param mzml_path: path to a copy of the test mzml file
+        :param cache: empty spectra cache
+        :param monkeypatch: pytest monkeypatch fixture
+        """
+        expected = MSRaw.read_mzml(mzml_path, cache=cache)
+        load = spectra_cache.SpectrumBatch.load
+
+        def load_and_evict(path):
+            batch = load(path)
+            Path(path).unlink()
+            return batch
+
+        monkeypatch.setattr(spectra_cache.SpectrumBatch, "load", staticmethod(load_and_evict))
+        df = MSRaw.read_mzml(mzml_path, cache=cache)
+        assert list(df.index) == list(expected.index)
+
+    def test_cache_options(self, mzml_path: Path, cache: SpectraCache):
+        """
+        Test that different reader options are cached separately.
+
+        :param mzml_path: path to a copy of the test mzml file
+        :param cache: empty spectra cache
+        """
+        MSRaw.read_mzml(mzml_path, cache=cache)
+        df = MSRaw.read_mzml(mzml_path, scanidx=[2, 3], cache=cache)
+        assert df["SCAN_NUMBER"].tolist() == [2, 3]
+        assert len(list(cache.cache_dir.glob("*.npz"))) == 2
+
+    def test_cache_invalidation(self, mzml_path: Path, cache: SpectraCache):
+        """
+        Test that entries of a changed file are not used and removed.
+
+        :param mzml_path: path to a copy of the test mzml file
+        :param cache: empty spectra cache
+        """
+        MSRaw.read_mzml(mzml_path, cache=cache)
+        old_entries = set(cache.cache_dir.glob("*.npz"))
+        content = mzml_path.read_bytes()
+        mzml_path.write_bytes(content.replace(b"scan=12", b"scan=99"))
+        df = MSRaw.read_mzml(mzml_path, cache=cache)
+        assert 99 in df["SCAN_NUMBER"].tolist()
+        new_entries = set(cache.cache_dir.glob("*.npz"))
+        assert len(new_entries) == 1
+        assert new_entries.isdisjoint(old_entries)
+
+    def test_cache_eviction(self, tmp_path: Path, mzml_path: Path):
+        """
+        Test that the least recently used entries are evicted when the size limit is exceeded.
+
+        :param tmp_path: temporary directory
+        :param mzml_path: path to a copy of the test mzml file
+        """
+        cache = SpectraCache(tmp_path / "cache", max_size=1)
+        MSRaw.read_mzml(mzml_path, cache=cache)
+        assert len(list(cache.cache_dir.glob("*.npz"))) == 0
+
+        cache = SpectraCache(tmp_path / "cache")
+        MSRaw.read_mzml(mzml_path, cache=cache)
+        entry_size = sum(path.stat().st_size for path in cache.cache_dir.glob("*.npz"))
+        cache.max_size = int(entry_size * 1.5)
+        MSRaw.read_mzml(mzml_path, scanidx=[2, 3], cache=cache)
+        assert len(list(cache.cache_dir.glob("*.npz"))) == 1
+
+
+@pytest.fixture
+def mzml_path(tmp_path: Path) -> Path:
+    """Copy of the test mzml file in a temporary directory."""
+    return Path(shutil.copy(DATA_PATH / "test.mzML", tmp_path / "test.mzML"))
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> SpectraCache:
+    """Empty spectra cache in a temporary directory."""
+    return SpectraCache(tmp_path / "cache")
@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectrum_io.raw import SpectrumBatch
+from spectrum_io.raw.msraw import MSRaw
+
+DATA_PATH = Path(__file__).parent / "data"
+
+
+class TestSpectrumBatch:
+    """Class to test the ragged-array spectrum batch."""
+
+    def test_from_dataframe(self, raw_df: pd.DataFrame):
+        """
+        Test conversion from the read_mzml layout.
+
+        :param raw_df: dataframe returned by read_mzml
+        """
+        batch = SpectrumBatch.from_dataframe(raw_df)
+        assert len(batch) == len(raw_df)
+        assert batch.offsets[-1] == len(batch.mz) == len(batch.intensity)
+        np.testing.assert_array_equal(batch.num_peaks, raw_df["MZ"].apply(len).to_numpy())
+        assert batch.metadata["SCAN_NUMBER"].dtype == np.int64
+        assert batch.metadata["RAW_FILE"].dtype == "category"
+        assert batch.metadata["MASS_ANALYZER"].dtype == "category"
+        mz, intensity = batch.get_spectrum(3)
+        np.testing.assert_array_equal(mz, raw_df["MZ"].iloc[3])
+        np.testing.assert_array_equal(intensity, raw_df["INTENSITIES"].iloc[3])
+        assert np.shares_memory(mz, batch.mz)
+
+    def test_round_trip(self, raw_df: pd.DataFrame):
+        """
+        Test that converting to a batch and back preserves the dataframe.
+
+        :param raw_df: dataframe returned by read_mzml
+        """
+        df = SpectrumBatch.from_dataframe(raw_df).to_dataframe()
+        assert list(df.index) == list(raw_df.index)
+        pd.testing.assert_frame_equal(
+            df.drop(columns=["INTENSITIES", "MZ"]), raw_df.drop(columns=["INTENSITIES", "MZ"]), check_dtype=False
+        )
+        for expected, actual in zip(raw_df["INTENSITIES"], df["INTENSITIES"]):
+            np.testing.assert_array_equal(expected, actual)
+
+    def test_concat(self, raw_df: pd.DataFrame):
+        """
+        Test concatenation of batches.
+
+        :param raw_df: dataframe returned by read_mzml
+        """
+        batch = SpectrumBatch.concat(
+            [SpectrumBatch.from_dataframe(raw_df.iloc[:4]), SpectrumBatch.from_dataframe(raw_df.iloc[4:])]
+        )
+        expected = SpectrumBatch.from_dataframe(raw_df)
+        np.testing.assert_array_equal(batch.offsets, expected.offsets)
+        np.testing.assert_array_equal(batch.mz, expected.mz)
+        pd.testing.assert_frame_equal(batch.metadata, expected.metadata)
+
+    def test_invalid_offsets(self, raw_df: pd.DataFrame):
+        """
+        Test that inconsistent offsets are rejected.
+
+        :param raw_df: dataframe returned by read_mzml
+        """
+        batch = SpectrumBatch.from_dataframe(raw_df)
+        with pytest.raises(ValueError):
+            SpectrumBatch(batch.mz, batch.intensity, batch.offsets[:-1], batch.metadata)
+
+
+@pytest.fixture
+def raw_df() -> pd.DataFrame:
+    """Dataframe of the test mzml file."""
+    return MSRaw.read_mzml(DATA_PATH / "test.mzML")
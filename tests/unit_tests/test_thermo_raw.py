@@ -0,0 +1,334 @@
+import gzip
+import subprocess  # noqa: S404
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pytest
+from spectrum_fundamentals.constants import MZML_DATA_COLUMNS
+
+from spectrum_io.raw import SpectraCache, thermo_raw
+from spectrum_io.raw.thermo_raw import ThermoRaw, _assemble_arg_list
+
+STUB_PARSER = '''#!{python}
+"""Stub of ThermoRawFileParser writing the name of the raw file as content of the mzML file."""
+import gzip
+import json
+import sys
+from pathlib import Path
+
+FILTERS = ["FTMS + c NSI d Full ms2 500.00@hcd28.00 [100.00-1010.00]", "FTMS + p NSI Full ms [350.00-1800.00]"]
+args = sys.argv[1:]
+with open(__file__ + ".log", "a") as log:
+    log.write(" ".join(args) + "\\n")
+if args[0] == "query":
+    scans = []
+    for scan_range in args[args.index("-n") + 1].split(","):
+        start, _, end = scan_range.partition("-")
+        scans.extend(range(int(start), int(end or start) + 1))
+    spectra = []
+    for scan in scans:
+        attributes = [
+            {{"accession": "MS:1000016", "name": "scan start time", "value": str(scan / 10)}},
+            {{"accession": "MS:1000512", "name": "filter string", "value": FILTERS[scan == 1]}},
+        ]
+        if scan != 3:  # the scan number of scan 3 has to be taken from the usi
+            attributes.append({{"accession": "MS:1008025", "name": "scan number", "value": str(scan)}})
+        usi = f"mzspec:PXD000000:run:scan:{{scan}}"
+        peaks = {{"mzs": [100.0 + scan, 200.0], "intensities": [1.0, 2.0]}}
+        spectra.append({{"usi": usi, "attributes": attributes, **peaks}})
+    Path(args[args.index("-b") + 1]).write_text(json.dumps(spectra))
+    sys.exit(0)
+if "-d" in args:
+    output_dir = Path(args[args.index("-o") + 1])
+    pairs = [(raw, output_dir / (raw.stem + ".mzML")) for raw in sorted(Path(args[args.index("-d") + 1]).iterdir())]
+else:
+    pairs = [(Path(args[args.index("-i") + 1]), Path(args[args.index("-b") + 1]))]
+for raw, output in pairs:
+    if "-g" in args:  # the parser appends .gz to the output file when gzipping
+        output.with_name(output.name + ".gz").write_bytes(gzip.compress(raw.name.encode()))
+    else:
+        output.write_text(raw.name)
+    if "corrupt" in raw.name:
+        sys.exit(1)
+'''
+
+
+class TestConvertRawMzml:
+    """Class to test the conversion of single raw files."""
+
+    def test_convert_raw_mzml(self, raw_files: List[Path], parser: Path):
+        """
+        Test conversion of a single file using a custom executable.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        output_path = ThermoRaw.convert_raw_mzml(raw_files[0], executable=parser)
+        assert output_path == raw_files[0].with_suffix(".mzML")
+        assert output_path.read_text() == raw_files[0].name
+        assert sorted(p.name for p in output_path.parent.iterdir()) == [
+            "run_0.mzML",
+            "run_0.mzML.manifest.json",
+            "run_0.raw",
+            "run_1.raw",
+        ]
+
+    def test_convert_raw_mzml_failure(self, raw_files: List[Path], parser: Path):
+        """
+        Test that no partially written file is left behind if the conversion fails.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        raw_file = raw_files[0].with_name("corrupt.raw")
+        raw_file.touch()
+        with pytest.raises(subprocess.CalledProcessError):
+            ThermoRaw.convert_raw_mzml(raw_file, executable=parser)
+        assert sorted(p.name for p in raw_file.parent.iterdir()) == ["corrupt.raw", "run_0.raw", "run_1.raw"]
+
+    def test_convert_raw_mzml_gzip(self, raw_files: List[Path], parser: Path):
+        """
+        Test that gzipped files get the suffix .gz, also if the parser appends it to the given file name.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        output_path = ThermoRaw.convert_raw_mzml(raw_files[0], gzip=True, executable=parser)
+        assert output_path == raw_files[0].with_name("run_0.mzML.gz")
+        assert gzip.decompress(output_path.read_bytes()) == b"run_0.raw"
+        assert sorted(p.name for p in output_path.parent.iterdir()) == [
+            "run_0.mzML.gz",
+            "run_0.mzML.gz.manifest.json",
+            "run_0.raw",
+            "run_1.raw",
+        ]
+        custom_path = ThermoRaw.convert_raw_mzml(
+            raw_files[1], gzip=True, output_path=raw_files[1].with_name("custom.mzML"), executable=parser
+        )
+        assert custom_path == raw_files[1].with_name("custom.mzML.gz")
+        assert gzip.decompress(custom_path.read_bytes()) == b"run_1.raw"
+
+    def test_convert_raw_mzml_output_format(self, raw_files: List[Path], parser: Path):
+        """
+        Test that the format option is passed to the parser and determines the extension of the output file.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        output_path = ThermoRaw.convert_raw_mzml(raw_files[0], executable=parser, output_format="parquet")
+        assert output_path == raw_files[0].with_suffix(".parquet")
+        assert "--format=3" in Path(f"{parser}.log").read_text()
+        with pytest.raises(ValueError):
+            ThermoRaw.convert_raw_mzml(raw_files[0], executable=parser, output_format="mzxml")
+
+    def test_convert_raw_mzml_reuse(self, raw_files: List[Path], parser: Path):
+        """
+        Test that outputs are only reused if the parameters, the raw file and the output file did not change.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        output_path = ThermoRaw.convert_raw_mzml(raw_files[0], executable=parser)
+        ThermoRaw.convert_raw_mzml(raw_files[0], executable=parser)
+        assert len(Path(f"{parser}.log").read_text().splitlines()) == 1
+
+        ThermoRaw.convert_raw_mzml(raw_files[0], ms_level=[1, 2], executable=parser)
+        assert len(Path(f"{parser}.log").read_text().splitlines()) == 2
+
+        output_path.write_text("run_0")  # truncated output
+        ThermoRaw.convert_raw_mzml(raw_files[0], ms_level=[2, 1], executable=parser)
+        assert output_path.read_text() == "run_0.raw"
+        assert len(Path(f"{parser}.log").read_text().splitlines()) == 3
+
+        raw_files[0].write_text("acquired again")
+        ThermoRaw.convert_raw_mzml(raw_files[0], ms_level=[1, 2], executable=parser)
+        assert len(Path(f"{parser}.log").read_text().splitlines()) == 4
+
+    def test_assemble_arg_list_mono(self):
+        """Test that mono is only used for the .NET executable."""
+        args = _assemble_arg_list(Path("a.raw"), Path("a.mzML"), [1, 2], True, Path("parser"))
+        assert args == [Path("parser"), "--msLevel=1,2", "-i", Path("a.raw"), "-b", Path("a.mzML"), "-g"]
+        args = _assemble_arg_list(Path("raw"), Path("mzml"), [2], False, directory_mode=True)
+        assert args[-4:] == ["-d", Path("raw"), "-o", Path("mzml")]
+        assert (args[0] == "mono") == (sys.platform != "win32")
+
+
+class TestConvertRawMzmlBatch:
+    """Class to test the concurrent conversion of multiple raw files."""
+
+    @pytest.mark.parametrize("directory_mode", [False, True])
+    def test_convert_raw_mzml_batch(self, raw_files: List[Path], parser: Path, tmpdir: Path, directory_mode: bool):
+        """
+        Test batch conversion into an output directory.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        :param tmpdir: temporary directory
+        :param directory_mode: whether to use the directory mode of the parser
+        """
+        output_dir = Path(tmpdir) / "mzml"
+        futures = ThermoRaw.convert_raw_mzml_batch(
+            raw_files, output_dir, max_workers=1, directory_mode=directory_mode, executable=parser
+        )
+        wait(futures.values())
+        for raw_file in raw_files:
+            assert futures[raw_file].result() == output_dir / f"{raw_file.stem}.mzML"
+            assert futures[raw_file].result().read_text() == raw_file.name
+        assert sorted(p.name for p in output_dir.glob("*.mzML")) == ["run_0.mzML", "run_1.mzML"]
+        assert not list(output_dir.glob(".*")) and not list(output_dir.glob("*.lock"))
+        num_calls = len(Path(f"{parser}.log").read_text().splitlines())
+        assert num_calls == (1 if directory_mode else 2)
+
+    @pytest.mark.parametrize("directory_mode", [False, True])
+    def test_convert_raw_mzml_batch_gzip(self, raw_files: List[Path], parser: Path, directory_mode: bool):
+        """
+        Test that gzipped files keep the suffix .gz when they are renamed into place.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        :param directory_mode: whether to use the directory mode of the parser
+        """
+        futures = ThermoRaw.convert_raw_mzml_batch(
+            raw_files, gzip=True, directory_mode=directory_mode, executable=parser
+        )
+        wait(futures.values())
+        for raw_file in raw_files:
+            assert futures[raw_file].result() == raw_file.with_name(f"{raw_file.stem}.mzML.gz")
+            assert gzip.decompress(futures[raw_file].result().read_bytes()) == raw_file.name.encode()
+        assert not list(raw_files[0].parent.glob(".*"))
+
+    @pytest.mark.parametrize("directory_mode", [False, True])
+    def test_convert_raw_mzml_batch_skip_existing(self, raw_files: List[Path], parser: Path, directory_mode: bool):
+        """
+        Test that files converted with the same parameters are not converted again.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        :param directory_mode: whether to use the directory mode of the parser
+        """
+        ThermoRaw.convert_raw_mzml(raw_files[0], executable=parser)
+        raw_files[1].with_suffix(".mzML").write_text("no manifest")
+        futures = ThermoRaw.convert_raw_mzml_batch(raw_files, executable=parser, directory_mode=directory_mode)
+        wait(futures.values())
+        assert futures[raw_files[0]].result().read_text() == "run_0.raw"
+        assert futures[raw_files[1]].result().read_text() == "run_1.raw"
+        calls = Path(f"{parser}.log").read_text().splitlines()
+        assert len(calls) == 2 and "run_0.raw" not in calls[1]
+
+    def test_convert_raw_mzml_batch_failure(self, raw_files: List[Path], parser: Path):
+        """
+        Test that a failed conversion is reported through the future of the file.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        corrupt_file = raw_files[0].with_name("corrupt.raw")
+        corrupt_file.touch()
+        futures = ThermoRaw.convert_raw_mzml_batch(raw_files + [corrupt_file], max_workers=2, executable=parser)
+        wait(futures.values())
+        assert isinstance(futures[corrupt_file].exception(), subprocess.CalledProcessError)
+        assert futures[raw_files[1]].result().is_file()
+        assert not corrupt_file.with_suffix(".mzML").exists()
+        assert not list(corrupt_file.parent.glob(".*"))
+
+    def test_convert_raw_mzml_batch_cancelled(self, raw_files: List[Path], parser: Path):
+        """
+        Test that cancelling a conversion task cancels the futures of its files.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        release = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        executor.submit(release.wait)  # keeps the conversions from starting
+        futures = ThermoRaw.convert_raw_mzml_batch(raw_files, directory_mode=True, executable=parser, executor=executor)
+        executor.shutdown(wait=False, cancel_futures=True)
+        release.set()
+        assert all(future.cancelled() for future in futures.values())
+
+    def test_convert_raw_mzml_batch_without_symlinks(
+        self, raw_files: List[Path], parser: Path, monkeypatch: pytest.MonkeyPatch
+    ):
+        """
+        Test that directory mode falls back to hardlinks or copies if symlinks cannot be created, e.g. on Windows.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        :param monkeypatch: pytest fixture to replace os.symlink
+        """
+
+        def symlink(*args):
+            raise OSError("symbolic link privilege not held")
+
+        monkeypatch.setattr(thermo_raw.os, "symlink", symlink)
+        futures = ThermoRaw.convert_raw_mzml_batch(raw_files, directory_mode=True, executable=parser)
+        wait(futures.values())
+        for raw_file in raw_files:
+            assert futures[raw_file].result().read_text() == raw_file.name
+
+
+class TestReadScans:
+    """Class to test the extraction of selected scans."""
+
+    def test_read_scans(self, raw_files: List[Path], parser: Path, tmp_path: Path):
+        """
+        Test that only the requested MS2 scans are extracted and that results are cached per scan set.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        :param tmp_path: temporary directory
+        """
+        cache = SpectraCache(tmp_path / "cache")
+        df = ThermoRaw.read_scans(raw_files[0], [5, 3, 1, 3, 2], cache=cache, executable=parser)
+        assert list(df.columns) == MZML_DATA_COLUMNS
+        assert df.index.tolist() == ["run_0_2", "run_0_3", "run_0_5"]
+        assert df["SCAN_NUMBER"].tolist() == [2, 3, 5]
+        assert df["MASS_ANALYZER"].tolist() == ["FTMS"] * 3
+        assert df["FRAGMENTATION"].tolist() == ["HCD"] * 3
+        assert df["MZ_RANGE"].tolist() == ["100.00-1010.00"] * 3
+        np.testing.assert_allclose(df["RETENTION_TIME"], [0.2, 0.3, 0.5])
+        np.testing.assert_array_equal(df.loc["run_0_5", "MZ"], [105.0, 200.0])
+        assert "-n 1-3,5 " in Path(f"{parser}.log").read_text()
+
+        cached_df = ThermoRaw.read_scans(raw_files[0], [1, 2, 3, 5], cache=cache, executable=parser)
+        pd.testing.assert_frame_equal(cached_df, df)
+        assert len(Path(f"{parser}.log").read_text().splitlines()) == 1
+        ThermoRaw.read_scans(raw_files[0], [2], cache=cache, executable=parser)
+        assert len(Path(f"{parser}.log").read_text().splitlines()) == 2
+
+    def test_read_scans_empty(self, raw_files: List[Path], parser: Path):
+        """
+        Test that the parser is not started if no scans are requested.
+
+        :param raw_files: paths to raw files
+        :param parser: path to the stub parser
+        """
+        df = ThermoRaw.read_scans(raw_files[0], [], executable=parser)
+        assert len(df) == 0
+        assert list(df.columns) == MZML_DATA_COLUMNS
+        assert not Path(f"{parser}.log").exists()
+
+
+@pytest.fixture
+def raw_files(tmpdir: Path) -> List[Path]:
+    """Create empty raw files."""
+    raw_dir = Path(tmpdir) / "raw"
+    raw_dir.mkdir()
+    paths = [raw_dir / f"run_{i}.raw" for i in range(2)]
+    for path in paths:
+        path.touch()
+    return paths
+
+
+@pytest.fixture
+def parser(tmpdir: Path) -> Path:
+    """Create a stub of ThermoRawFileParser."""
+    path = Path(tmpdir) / "parser"
+    path.write_text(STUB_PARSER.format(python=sys.executable))
+    path.chmod(0o755)
+    return path